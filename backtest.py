@@ -0,0 +1,44 @@
+# backtest.py
+from utils.api import login_to_robinhood, fetch_historical_data_batch, fetch_crypto_historical_arrays
+from utils.backtest import StrategyParams, load_panel, run_backtest, metrics
+from utils.settings import BACKTEST_INITIAL_CAPITAL, BACKTEST_SPAN, BACKTEST_FETCH
+from utils.symbols import lookup
+from utils import bar_cache
+from data_loader import load_stock_symbols
+
+
+def fill_bar_cache(stock_symbols, span=BACKTEST_SPAN):
+    """
+    Fetches `span` of daily bars for the universe into the bar cache.
+    """
+    login_to_robinhood()
+    stocks = [symbol for symbol in stock_symbols if lookup(symbol).asset_class == 'stock']
+    coins = [lookup(symbol).symbol for symbol in stock_symbols if lookup(symbol).asset_class == 'crypto']
+    fetch_historical_data_batch(stocks, span=span, as_arrays=True)
+    for coin in coins:
+        fetch_crypto_historical_arrays(coin, span=span)
+    bar_cache.flush()
+
+
+def main():
+    stock_symbols = load_stock_symbols()
+    if BACKTEST_FETCH:
+        fill_bar_cache(stock_symbols)
+
+    panel = load_panel(stock_symbols)
+    if not len(panel):
+        print("No cached daily bars to backtest. Set BACKTEST_FETCH = True to fetch them first.")
+        return
+    result = run_backtest(panel, StrategyParams(), BACKTEST_INITIAL_CAPITAL)
+    summary = metrics(result)
+
+    print(f"Backtested {len(panel)} symbols over {len(result.days)} days "
+          f"({result.trades[0]['entry_date'] if result.trades else 'no trades'} onwards).")
+    print(f"Final equity: ${summary['final_equity']:.2f} ({summary['total_return']:.1%} total, "
+          f"{summary['cagr']:.1%} CAGR)")
+    print(f"Max drawdown: {summary['max_drawdown']:.1%}, win rate: {summary['win_rate']:.1%} over "
+          f"{summary['trades']} trades, exposure: {summary['exposure']:.1%}")
+
+
+if __name__ == "__main__":
+    main()
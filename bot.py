@@ -3,7 +3,9 @@ from utils.api import get_top_movers, load_csv_data, sanitize_ticker_symbols, lo
 from utils.account_data import global_account_data, update_global_account_data
 from utils.trading import analyze_stock, send_trade_summary, execute_trade, check_positions_against_atr, get_stock_orders_and_match_open_positions, close_trades_open_for_ten_days
 from utils.trade_state import calculate_current_risk, get_open_trades
-from utils.settings import SIMULATED, SIMULATED_PORTFOLIO_SIZE, MAX_DAILY_LOSS, USE_CSV_DATA, ATR_THRESHOLDS  
+from utils.settings import SIMULATED, SIMULATED_PORTFOLIO_SIZE, MAX_DAILY_LOSS, USE_CSV_DATA, ATR_THRESHOLDS, SCAN_WORKERS, SCAN_MODE
+from utils.scanner import scan_stocks, screen_stocks, stream_stocks
+from utils import signal_memo, market_snapshot, request_layer, negative_cache, prescreen
 from data_loader import load_stock_symbols  
 import robin_stocks.robinhood as r
 from tqdm import tqdm
@@ -13,8 +15,11 @@ import json
 def main():
     login_to_robinhood();
 
+    # Bars and ATRs fetched during this run are shared by every step below
+    market_snapshot.start_run()
+
     # Step 1: Update global account data (positions, portfolio info, etc.)
-    update_global_account_data()
+    account = update_global_account_data()
 
     # Check and close trades open for more than 10 days
     close_trades_open_for_ten_days(global_account_data['positions'])
@@ -24,7 +29,7 @@ def main():
 
     # Step 3: Simulated or live trading mode setup
     simulated = SIMULATED  
-    portfolio_size = SIMULATED_PORTFOLIO_SIZE if simulated else float(global_account_data['portfolio_info']['equity'])  
+    portfolio_size = SIMULATED_PORTFOLIO_SIZE if simulated else float(account.portfolio_info['equity'])  
     max_daily_loss = portfolio_size * MAX_DAILY_LOSS
 
     # Step 4: Get open positions and match with orders
@@ -51,16 +56,67 @@ def main():
 
     # Step 8: Analyze and trade based on ATR and crossover signals
     with tqdm(stock_symbols, desc="Analyzing stocks", position=0, leave=True, ncols=100) as progress_bar:
-        results = []
-        total_stocks_analyzed = 0
+        if SCAN_MODE == 'screener':
+            def on_chunk(chunk, fetched):
+                progress_bar.set_description(f"Fetched {chunk[-1]}")
+                progress_bar.update(len(chunk))
+
+            results, screen_stats = screen_stocks(stock_symbols, portfolio_size, current_risk_percent,
+                                                  atr_thresholds=ATR_THRESHOLDS, max_workers=SCAN_WORKERS,
+                                                  on_chunk=on_chunk)
+            tqdm.write(f"Screened {screen_stats['screened']} symbols: {len(screen_stats['short_history'])} skipped for "
+                       f"short history, {screen_stats['below_atr_floor']} below the 3% ATR floor, "
+                       f"{len(results)} eligible.")
+        elif SCAN_MODE == 'streaming':
+            def on_chunk(chunk):
+                progress_bar.set_description(f"Evaluated {chunk[-1]}")
+                progress_bar.update(len(chunk))
+
+            def on_preliminary(ranked, evaluated, total):
+                leaders = ', '.join(f"{trade['Stock']} ({trade['ATR Percent']:.2f}%)" for trade in ranked[:3])
+                tqdm.write(f"Preliminary top trades after {evaluated} of {total} symbols: {leaders or 'none yet'}")
+
+            results, stream_stats = stream_stocks(stock_symbols, portfolio_size, current_risk_percent,
+                                                  atr_thresholds=ATR_THRESHOLDS, max_workers=SCAN_WORKERS,
+                                                  on_chunk=on_chunk, on_preliminary=on_preliminary)
+            tqdm.write(f"Streamed {stream_stats['screened']} symbols: {stream_stats['short_history']} skipped for "
+                       f"short history, {stream_stats['below_atr_floor']} below the 3% ATR floor, "
+                       f"{stream_stats['eligible']} eligible, {stream_stats['late']} left unevaluated at the deadline; "
+                       f"kept the top {len(results)}.")
+            if 'indicator_state' in stream_stats:
+                state = stream_stats['indicator_state']
+                tqdm.write(f"Indicator state: {state['incremental']} symbols updated incrementally, "
+                           f"{state['rebuilt']} rebuilt after a consistency check, {state['built']} built fresh.")
+        else:
+            def on_result(stock, eligible, error):
+                progress_bar.set_description(f"Analyzed {stock}")
+                progress_bar.update(1)
+                if error is not None:
+                    tqdm.write(f"{stock} skipped due to an error: {error}")
+                elif not eligible:
+                    tqdm.write(f"{stock} skipped due to ATR percent being less than 3%.")
+
+            results, _ = scan_stocks(stock_symbols, portfolio_size, current_risk_percent, simulated=simulated,
+                                     atr_thresholds=ATR_THRESHOLDS, max_workers=SCAN_WORKERS, on_result=on_result)
+        total_stocks_analyzed = len(stock_symbols)
         total_trades_made = 0
-        for stock in stock_symbols:
-            progress_bar.set_description(f"Analyzing {stock}")
-            eligible_for_trade = analyze_stock(stock, results, portfolio_size, current_risk_percent, atr_thresholds=ATR_THRESHOLDS, simulated=simulated)
-            total_stocks_analyzed += 1
-            progress_bar.update(1)  
-            if not eligible_for_trade:
-                tqdm.write(f"{stock} skipped due to ATR percent being less than 3%.")
+        if SCAN_MODE != 'streaming':  # The streaming pipeline does not use the signal memo
+            memo_report = signal_memo.report()
+            tqdm.write(f"Signal memo: {memo_report['hits']} of {memo_report['hits'] + memo_report['misses']} symbols "
+                       f"reused an unchanged signal ({memo_report['hit_ratio']:.0%}).")
+        skips = negative_cache.report()
+        tqdm.write(f"Negative cache: skipped {skips['skipped']} of {skips['universe']} symbols "
+                   f"({skips['skip_ratio']:.0%}) {skips['by_reason']}.")
+        pruning = prescreen.report()
+        if pruning['full_refresh']:
+            tqdm.write("Pre-screen: full universe refresh, nothing pruned.")
+        else:
+            tqdm.write(f"Pre-screen: pruned {pruning['pruned']} of {pruning['universe']} symbols "
+                       f"({pruning['prune_ratio']:.0%}), saving about {pruning['seconds_saved']:.1f}s.")
+        for endpoint, counters in request_layer.report().items():
+            tqdm.write(f"Requests [{endpoint}]: {counters['attempts']} sent for {counters['calls']} calls, "
+                       f"{counters['throttled']} throttled, {counters['retries']} retried, {counters['failures']} failed, "
+                       f"{counters['rate_wait'] + counters['backoff_wait']:.1f}s waiting.")
 
     # Step 9: Logging and execution of trades
     logger.log_initial_risk(current_risk_percent, MAX_DAILY_LOSS * 100, risk_available_for_new_trades)
@@ -88,6 +144,7 @@ def main():
     logger.log_top_trades(top_trades)
     logger.log_all_possible_trades(results)
     logger.log_top_three_trades(top_trades)
+    market_snapshot.end_run()
 
     # Print global_account_data at the end of bot.py
     # print("\n--- Global Account Data at the End ---\n")
@@ -2,34 +2,23 @@
 from utils.api import sanitize_ticker_symbols
 import pandas as pd
 from utils.settings import USE_CSV_DATA, USE_NASDAQ_DATA, USE_SP500_DATA  # Import the settings
+from utils.universe import load_universe
 
 def load_stock_symbols():
-    stock_symbols = []
-
-    # Load crypto symbols
+    """
+    Returns the deduplicated scan universe from the compiled universe index: crypto symbols,
+    then NASDAQ and/or S&P 500 symbols as enabled in settings.
+    """
+    sources = ['crypto']
+    if USE_NASDAQ_DATA:
+        sources.append('nasdaq')
+    if USE_SP500_DATA:
+        sources.append('sp500')
     try:
-        crypto_data = load_csv_data('crypto_symbols.csv', 'crypto')
-        crypto_data = sanitize_ticker_symbols(crypto_data)
-        stock_symbols.extend(crypto_data['Symbol'].tolist())
+        return load_universe().symbols(sources)
     except Exception as e:
-        print(f"Error loading crypto symbols: {e}")
-
-    if USE_NASDAQ_DATA and not USE_SP500_DATA:
-        nasdaq_data = load_csv_data('nasdaq100_full.csv', 'nasdaq')
-        nasdaq_data = sanitize_ticker_symbols(nasdaq_data)
-        stock_symbols.extend(nasdaq_data['Ticker'].tolist())
-    elif USE_SP500_DATA and not USE_NASDAQ_DATA:
-        sp500_data = load_csv_data('sp500_companies.csv', 'sp500')
-        sp500_data = sanitize_ticker_symbols(sp500_data)
-        stock_symbols.extend(sp500_data['Symbol'].tolist())
-    elif USE_NASDAQ_DATA and USE_SP500_DATA:
-        nasdaq_data = load_csv_data('nasdaq100_full.csv', 'nasdaq')
-        nasdaq_data = sanitize_ticker_symbols(nasdaq_data)
-        sp500_data = load_csv_data('sp500_companies.csv', 'sp500')
-        sp500_data = sanitize_ticker_symbols(sp500_data)
-        stock_symbols.extend(nasdaq_data['Ticker'].tolist() + sp500_data['Symbol'].tolist())
-
-    return stock_symbols
+        print(f"Error loading universe index: {e}")
+        return []
 
 def load_csv_data(file_path, exchange):
     df = pd.read_csv(file_path)
@@ -13,7 +13,7 @@ def log_analysis_summary(results):
     print(colored("\n--- Analysis Summary ---", 'yellow'))
     for result in results:
         print(f"{result['Stock']}: {colored('Eligible for Trade:', 'blue')} {result['Eligible for Trade']}, "
-              f"ATR Percent: {colored(f'{result['ATR Percent']:.2f}%', 'cyan')}, "
+              f"ATR Percent: {colored(format(result['ATR Percent'], '.2f') + '%', 'cyan')}, "
               f"Reason: {result['Reason']}")
 
 
@@ -73,14 +73,14 @@ def log_top_trades(top_trades):
 def log_all_possible_trades(results):
     print(colored("\n--- All Possible Trades ---", 'green'))
     for idx, trade in enumerate(results, start=1):
-        print(f"{idx}. Stock: {colored(trade['Stock'], 'yellow')}, ATR Percent: {colored(f'{trade['ATR Percent']:.2f}%', 'cyan')}, "
-              f"Eligible: {colored(trade['Eligible for Trade'], 'blue')}, Trade Amount: {colored(f'${trade['Trade Amount']:.2f}', 'magenta')}, "
-              f"Risk Percent: {colored(f'{trade['Risk Percent']:.2f}%', 'red')}")
+        print(f"{idx}. Stock: {colored(trade['Stock'], 'yellow')}, ATR Percent: {colored(format(trade['ATR Percent'], '.2f') + '%', 'cyan')}, "
+              f"Eligible: {colored(trade['Eligible for Trade'], 'blue')}, Trade Amount: {colored('$' + format(trade['Trade Amount'], '.2f'), 'magenta')}, "
+              f"Risk Percent: {colored(format(trade['Risk Percent'], '.2f') + '%', 'red')}")
 
 
 def log_top_three_trades(top_trades):
     print(colored("\n--- Top Three Trades ---", 'yellow'))
     for idx, trade in enumerate(top_trades, start=1):
-        print(f"{idx}. Stock: {colored(trade['Stock'], 'yellow')}, ATR Percent: {colored(f'{trade['ATR Percent']:.2f}%', 'cyan')}, "
-              f"Eligible: {colored(trade['Eligible for Trade'], 'blue')}, Trade Amount: {colored(f'${trade['Trade Amount']:.2f}', 'magenta')}, "
-              f"Risk Percent: {colored(f'{trade['Risk Percent']:.2f}%', 'red')}")
\ No newline at end of file
+        print(f"{idx}. Stock: {colored(trade['Stock'], 'yellow')}, ATR Percent: {colored(format(trade['ATR Percent'], '.2f') + '%', 'cyan')}, "
+              f"Eligible: {colored(trade['Eligible for Trade'], 'blue')}, Trade Amount: {colored('$' + format(trade['Trade Amount'], '.2f'), 'magenta')}, "
+              f"Risk Percent: {colored(format(trade['Risk Percent'], '.2f') + '%', 'red')}")
\ No newline at end of file
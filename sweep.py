@@ -0,0 +1,27 @@
+# sweep.py
+import logging
+from utils.backtest import load_panel
+from utils.sweep import run_sweep
+from utils.settings import SWEEP_GRID, SWEEP_RESULTS_FILE
+from data_loader import load_stock_symbols
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    panel = load_panel(load_stock_symbols())
+    if not len(panel):
+        print("No cached daily bars to sweep over. Run backtest.py with BACKTEST_FETCH = True first.")
+        return
+
+    def on_result(params, summary, done, total):
+        print(f"[{done}/{total}] CAGR {summary['cagr']:.1%}, drawdown {summary['max_drawdown']:.1%}: {params}")
+
+    results = run_sweep(panel, SWEEP_GRID, on_result=on_result)
+    print(f"\nTop settings of {len(results)} recorded in {SWEEP_RESULTS_FILE}:")
+    for row in results[:10]:
+        print(f"CAGR {row['cagr']:.1%}, drawdown {row['max_drawdown']:.1%}, win rate {row['win_rate']:.1%}, "
+              f"exposure {row['exposure']:.1%}, {row['trades']} trades: {row['params']}")
+
+
+if __name__ == "__main__":
+    main()
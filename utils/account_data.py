@@ -1,7 +1,13 @@
 # utils/account_data.py
 import robin_stocks.robinhood as r
 import os
+import time
+import logging
+from types import MappingProxyType
+from typing import NamedTuple
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
+from utils import positions, request_layer
 
 # Load environment variables (like Robinhood username and password)
 load_dotenv()
@@ -25,11 +31,98 @@ def reset_risk_in_global_data():
 #     password = os.getenv('ROBINHOOD_PASSWORD')
 #     r.login(username=username, password=password)
 
+class AccountSnapshot(NamedTuple):
+    """
+    Read-only view of the account as fetched at the start of a run. Nested records are frozen
+    too; update_global_account_data hands out mutable copies.
+    """
+    account_info: MappingProxyType
+    portfolio_info: MappingProxyType
+    positions: MappingProxyType
+    fetched_at: float
+    timings: MappingProxyType
+
+
+# Independent bootstrap requests; they share nothing, so they are issued together
+BOOTSTRAP_STAGES = {
+    'account_info': lambda: request_layer.call('account', r.profiles.load_account_profile),
+    'portfolio_info': lambda: request_layer.call('account', r.profiles.load_portfolio_profile),
+    'positions': lambda: positions.get_positions(max_age=0),  # Normalized stock and crypto records
+}
+
+
+def _timed(fetch):
+    start = time.perf_counter()
+    result = fetch()
+    return result, time.perf_counter() - start
+
+
+def _freeze(value):
+    if isinstance(value, dict):
+        return MappingProxyType({key: _freeze(item) for key, item in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(item) for item in value)
+    return value
+
+
+def _thaw(value):
+    if isinstance(value, MappingProxyType):
+        return {key: _thaw(item) for key, item in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(item) for item in value]
+    return value
+
+
+def load_account_snapshot():
+    """
+    Fetches the account profile, portfolio profile and positions concurrently. Positions are
+    api.position_record entries for stocks and crypto alike, the same records get_positions
+    returns, and the fetch also refreshes the positions cache.
+
+    :return: AccountSnapshot.
+    :raises RuntimeError: If any stage fails; the run must not continue without its positions or equity.
+    """
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=len(BOOTSTRAP_STAGES)) as executor:
+        futures = {name: executor.submit(_timed, fetch) for name, fetch in BOOTSTRAP_STAGES.items()}
+
+    data, timings, failed = {}, {}, []
+    for name, future in futures.items():
+        try:
+            data[name], timings[name] = future.result()
+        except Exception as e:
+            logging.error(f"Account bootstrap stage {name} failed: {e}")
+            data[name], timings[name] = None, None
+        # robin_stocks returns None instead of raising when a request fails
+        if data[name] is None:
+            failed.append(name)
+    if failed:
+        raise RuntimeError(f"Account bootstrap failed for {', '.join(failed)}; aborting the run")
+    timings['total'] = time.perf_counter() - start
+
+    stages = ', '.join(f"{name} {seconds:.2f}s" for name, seconds in timings.items())
+    logging.info(f"Account bootstrap timings: {stages}")
+    print(f"Account data loaded ({stages})")
+
+    return AccountSnapshot(
+        account_info=_freeze(data['account_info']),
+        portfolio_info=_freeze(data['portfolio_info']),
+        positions=_freeze(data['positions']),
+        fetched_at=time.time(),
+        timings=MappingProxyType(timings)
+    )
+
+
 def update_global_account_data():
-    global global_account_data
-    global_account_data['account_info'] = r.profiles.load_account_profile()
-    global_account_data['portfolio_info'] = r.profiles.load_portfolio_profile()
-    global_account_data['positions'] = r.account.build_holdings()
+    """
+    Loads a fresh AccountSnapshot and mirrors deep copies of it into global_account_data for
+    existing callers, which may modify them (bot.py adds each position's order date).
+    """
+    snapshot = load_account_snapshot()
+    global_account_data['account_info'] = _thaw(snapshot.account_info)
+    global_account_data['portfolio_info'] = _thaw(snapshot.portfolio_info)
+    global_account_data['positions'] = _thaw(snapshot.positions)
+    return snapshot
 
 def test_print_global_account_data():
     # Print out the global account data to verify everything is working
@@ -1,32 +1,342 @@
 # utils/analysis.py
+import math
+from array import array
+import numpy as np
+from utils.bar_store import Bars
+
+
+# Vectorized indicator kernels. Each works along the last axis, so the same call handles a
+# single series (1-D) or a symbols x bars matrix (2-D).
+
+def sma(values, period):
+    """
+    Simple moving average computed from cumulative sums in O(n) per series.
+
+    :param values: 1-D array of prices or 2-D array of shape (symbols, bars).
+    :return: Array with bars - period + 1 columns; empty along the last axis if there are fewer than period bars.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    if values.shape[-1] < period:
+        return np.empty(values.shape[:-1] + (0,))
+    csum = np.cumsum(values, axis=-1)
+    csum = np.concatenate((np.zeros(values.shape[:-1] + (1,)), csum), axis=-1)
+    return (csum[..., period:] - csum[..., :-period]) / period
+
+
+def true_range(high, low, close):
+    """
+    True range of each bar against the previous close. The first bar has no previous close,
+    so the result has one column fewer than the inputs.
+    """
+    high, low, close = (np.asarray(column, dtype=np.float64) for column in (high, low, close))
+    prev_close = close[..., :-1]
+    return np.maximum.reduce((
+        high[..., 1:] - low[..., 1:],
+        np.abs(high[..., 1:] - prev_close),
+        np.abs(low[..., 1:] - prev_close),
+    ))
+
+
+def _wilder_smooth(initial, values, period):
+    """
+    Applies Wilder's recursion atr = (prev * (period - 1) + tr) / period to every column of values.
+
+    The recursion is unrolled into a closed form, atr_k = beta^k * (atr_0 + alpha * sum(beta^-j * tr_j)),
+    evaluated with cumulative sums. It is applied in blocks short enough that beta^-k cannot overflow.
+    """
+    beta = (period - 1) / period
+    alpha = 1 / period
+    if beta == 0:
+        return values.copy()
+    block = max(1, int(50 / -np.log(beta)))
+    out = np.empty_like(values)
+    prev = initial
+    for start in range(0, values.shape[-1], block):
+        chunk = values[..., start:start + block]
+        k = np.arange(1, chunk.shape[-1] + 1)
+        smoothed = beta ** k * (prev[..., None] + alpha * np.cumsum(chunk * beta ** -k, axis=-1))
+        out[..., start:start + chunk.shape[-1]] = smoothed
+        prev = smoothed[..., -1]
+    return out
+
+
+def wilder_atr(high, low, close, period=14):
+    """
+    Wilder ATR series. The first value is the plain average of the first `period` true ranges
+    (divided by `period` even when fewer are available), and each later value is Wilder-smoothed.
+
+    :return: Array of ATR values along the last axis; the last column is the most recent ATR.
+    """
+    tr = true_range(high, low, close)
+    initial = tr[..., :period].sum(axis=-1) / period
+    smoothed = _wilder_smooth(np.asarray(initial), tr[..., period:], period)
+    return np.concatenate((initial[..., None], smoothed), axis=-1)
+
+
+# Streaming indicator state. Each object is fed one bar at a time and costs O(1) per bar;
+# replace_last() revises the most recent (still forming) bar in place, so intraday refreshes
+# do not re-run the window. Values match the batch kernels above to floating-point rounding.
+
+class RollingSMA:
+    """
+    Simple moving average over the last `period` values, held in a fixed-size ring buffer.
+    """
+    __slots__ = ('period', '_buffer', '_next', '_count', '_sum', '_since_resync')
+
+    def __init__(self, period):
+        self.period = period
+        self._buffer = array('d', bytes(8 * period))
+        self._next = 0  # Slot the next new value goes into
+        self._count = 0
+        self._sum = 0.0
+        self._since_resync = 0
+
+    @property
+    def value(self):
+        """
+        Latest SMA, or None until `period` values have been seen.
+        """
+        return self._sum / self.period if self._count >= self.period else None
+
+    def update(self, value):
+        """
+        Appends a new value and returns the updated SMA.
+        """
+        value = float(value)
+        self._sum += value - self._buffer[self._next]
+        self._buffer[self._next] = value
+        self._next = (self._next + 1) % self.period
+        self._count += 1
+        self._since_resync += 1
+        if self._since_resync >= self.period:
+            # Re-add the window exactly once per period so rounding error cannot accumulate
+            self._sum = math.fsum(self._buffer)
+            self._since_resync = 0
+        return self.value
+
+    def export_state(self):
+        """
+        :return: Tuple of (floats, ints) that import_state() accepts: the window and its sum, and the counters.
+        """
+        return list(self._buffer) + [self._sum], [self._next, self._count, self._since_resync]
+
+    def import_state(self, floats, ints):
+        self._buffer = array('d', floats[:self.period])
+        self._sum = float(floats[self.period])
+        self._next, self._count, self._since_resync = (int(value) for value in ints)
+
+    def committed_values(self):
+        """
+        Values in the window before the latest one, oldest first.
+        """
+        size = min(self._count, self.period)
+        return [self._buffer[(self._next - size + i) % self.period] for i in range(size - 1)]
+
+    def replace_last(self, value):
+        """
+        Revises the most recent value (e.g. the current bar's close moved) and returns the SMA.
+        """
+        if self._count == 0:
+            return self.update(value)
+        last = (self._next - 1) % self.period
+        value = float(value)
+        self._sum += value - self._buffer[last]
+        self._buffer[last] = value
+        return self.value
+
+
+class WilderATR:
+    """
+    Wilder ATR with the same seeding as wilder_atr: the average of the first `period` true ranges,
+    then Wilder smoothing. State covers every bar before the latest one; the latest bar is kept
+    separately so replace_last() only has to recompute its own contribution.
+    """
+    __slots__ = ('period', '_prev_close', '_tr_count', '_tr_sum', '_atr', '_last')
+
+    def __init__(self, period=14):
+        self.period = period
+        self._prev_close = None  # Close of the bar before the latest one
+        self._tr_count = 0  # True ranges folded into the committed state
+        self._tr_sum = 0.0  # Their sum, while still seeding
+        self._atr = None  # Committed ATR once `period` true ranges are in
+        self._last = None  # Latest bar as (high, low, close)
+
+    def _true_range(self, bar):
+        high, low, _ = bar
+        previous = self._prev_close
+        return max(high - low, abs(high - previous), abs(low - previous))
+
+    @property
+    def value(self):
+        """
+        Latest ATR, or None before the first bar.
+        """
+        if self._last is None:
+            return None
+        if self._prev_close is None:
+            return 0.0  # A single bar has no true range; wilder_atr reports 0 as well
+        tr = self._true_range(self._last)
+        if self._tr_count < self.period:
+            return (self._tr_sum + tr) / self.period
+        return (self._atr * (self.period - 1) + tr) / self.period
+
+    def update(self, high, low, close):
+        """
+        Appends a new bar and returns the updated ATR.
+        """
+        if self._last is not None:
+            if self._prev_close is not None:
+                tr = self._true_range(self._last)
+                self._tr_count += 1
+                if self._tr_count <= self.period:
+                    self._tr_sum += tr
+                    if self._tr_count == self.period:
+                        self._atr = self._tr_sum / self.period
+                else:
+                    self._atr = (self._atr * (self.period - 1) + tr) / self.period
+            self._prev_close = self._last[2]
+        self._last = (float(high), float(low), float(close))
+        return self.value
+
+    def export_state(self):
+        """
+        :return: Tuple of (floats, ints) that import_state() accepts. Missing values are stored as NaN.
+        """
+        nan = float('nan')
+        last = self._last or (nan, nan, nan)
+        previous = nan if self._prev_close is None else self._prev_close
+        atr = nan if self._atr is None else self._atr
+        return [previous, self._tr_sum, atr, *last], [self._tr_count]
+
+    def import_state(self, floats, ints):
+        previous, self._tr_sum, atr, high, low, close = (float(value) for value in floats)
+        self._prev_close = None if math.isnan(previous) else previous
+        self._atr = None if math.isnan(atr) else atr
+        self._last = None if math.isnan(close) else (high, low, close)
+        self._tr_count = int(ints[0])
+
+    @property
+    def last_close(self):
+        """
+        Close of the latest bar, or None before the first bar.
+        """
+        return self._last[2] if self._last is not None else None
+
+    @property
+    def previous_close(self):
+        """
+        Close of the bar before the latest one, or None.
+        """
+        return self._prev_close
+
+    def replace_last(self, high, low, close):
+        """
+        Revises the latest bar and returns the ATR.
+        """
+        if self._last is None:
+            return self.update(high, low, close)
+        self._last = (float(high), float(low), float(close))
+        return self.value
+
+
+class CrossoverDetector:
+    """
+    Incremental detect_recent_crossover over a short and a long SMA of closing prices: reports a
+    bullish crossover if the short SMA moved from at or below the long SMA to above it within the
+    last `days` bars. Only the last days + 1 SMA pairs are kept, in ring buffers.
+    """
+    __slots__ = ('days', 'short', 'long', '_short_values', '_long_values', '_next', '_count')
+
+    def __init__(self, short_period=20, long_period=50, days=5):
+        self.days = days
+        self.short = RollingSMA(short_period)
+        self.long = RollingSMA(long_period)
+        self._short_values = array('d', bytes(8 * (days + 1)))
+        self._long_values = array('d', bytes(8 * (days + 1)))
+        self._next = 0
+        self._count = 0  # Bars for which both SMAs exist
+
+    def _store(self, slot):
+        short, long = self.short.value, self.long.value
+        if short is None or long is None:
+            return False
+        self._short_values[slot] = short
+        self._long_values[slot] = long
+        return True
+
+    @property
+    def signal(self):
+        """
+        "Bullish Crossover" or None, as detect_recent_crossover would return for the same closes.
+        """
+        size = self.days + 1
+        if self._count < size:
+            return None
+        newest = (self._next - 1) % size
+        for i in range(self.days):
+            now = (newest - i) % size
+            before = (now - 1) % size
+            if (self._short_values[before] <= self._long_values[before]
+                    and self._short_values[now] > self._long_values[now]):
+                return "Bullish Crossover"
+        return None
+
+    def update(self, close):
+        """
+        Appends a new close and returns the current signal.
+        """
+        self.short.update(close)
+        self.long.update(close)
+        if self._store(self._next):
+            self._next = (self._next + 1) % (self.days + 1)
+            self._count += 1
+        return self.signal
+
+    def export_state(self):
+        """
+        :return: Tuple of (floats, ints) covering both SMAs and the recent SMA pairs.
+        """
+        short_floats, short_ints = self.short.export_state()
+        long_floats, long_ints = self.long.export_state()
+        floats = short_floats + long_floats + list(self._short_values) + list(self._long_values)
+        return floats, short_ints + long_ints + [self._next, self._count]
+
+    def import_state(self, floats, ints):
+        short_size, long_size, pairs = self.short.period + 1, self.long.period + 1, self.days + 1
+        self.short.import_state(floats[:short_size], ints[0:3])
+        self.long.import_state(floats[short_size:short_size + long_size], ints[3:6])
+        offset = short_size + long_size
+        self._short_values = array('d', floats[offset:offset + pairs])
+        self._long_values = array('d', floats[offset + pairs:offset + 2 * pairs])
+        self._next, self._count = int(ints[6]), int(ints[7])
+
+    def replace_last(self, close):
+        """
+        Revises the latest close and returns the current signal.
+        """
+        self.short.replace_last(close)
+        self.long.replace_last(close)
+        if self._count:
+            self._store((self._next - 1) % (self.days + 1))
+        return self.signal
+
 
 # Calculate moving averages
 def moving_average(data, period):
-    return [sum(data[i:i+period])/period for i in range(len(data)-period+1)]
+    return sma(data, period).tolist()
 
 
 def calculate_atr(historicals, period=14):
-    tr_list = []
-    
-    # Calculate true ranges
-    for i in range(1, len(historicals)):
-        high_low = float(historicals[i]['high_price']) - float(historicals[i]['low_price'])
-        high_close = abs(float(historicals[i]['high_price']) - float(historicals[i-1]['close_price']))
-        low_close = abs(float(historicals[i]['low_price']) - float(historicals[i-1]['close_price']))
-        true_range = max(high_low, high_close, low_close)
-        tr_list.append(true_range)
-    
-    # Initial ATR
-    initial_atr = sum(tr_list[:period]) / period
-    
-    # Subsequent ATRs
-    atr_values = [initial_atr]
-    for i in range(period, len(tr_list)):
-        current_atr = (atr_values[-1] * (period - 1) + tr_list[i]) / period
-        atr_values.append(current_atr)
-    
+    # Accept either columnar Bars (NumPy views from the bar store) or the broker's list of dicts
+    if isinstance(historicals, Bars):
+        highs, lows, closes = historicals.high, historicals.low, historicals.close
+    else:
+        highs = [float(day['high_price']) for day in historicals]
+        lows = [float(day['low_price']) for day in historicals]
+        closes = [float(day['close_price']) for day in historicals]
+
     # Return the most recent ATR
-    return atr_values[-1]
+    return float(wilder_atr(highs, lows, closes, period)[-1])
 
 # Other functions (if any) in analysis.py...
 
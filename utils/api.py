@@ -4,41 +4,104 @@ import os
 import logging
 import contextlib
 import pandas as pd
+from concurrent.futures import ThreadPoolExecutor
+from robin_stocks.robinhood.helper import request_get
+from robin_stocks.robinhood.urls import crypto_currency_pairs_url, crypto_quote_url
 from dotenv import load_dotenv  # Import the function to load environment variables
-from utils.settings import SIMULATED, SIMULATED_PORTFOLIO_SIZE  # Import settings
+from utils.settings import SIMULATED, SIMULATED_PORTFOLIO_SIZE, HISTORICALS_CHUNK_SIZE  # Import settings
+from utils import bar_cache, request_layer, negative_cache
+from utils.bar_store import bars_to_dicts
 
 load_dotenv()
 
+CRYPTO_QUOTES_URL = 'https://api.robinhood.com/marketdata/forex/quotes/'
+
 def login_to_robinhood():
     username = os.getenv('ROBINHOOD_USERNAME')
     password = os.getenv('ROBINHOOD_PASSWORD')
     r.login(username=username, password=password)
 
 
+def position_record(name, quantity, price, average_buy_price, position_type='stock'):
+    """
+    Builds the normalized position record shared by stock and crypto holdings (all numbers as floats).
+    """
+    quantity, price, average_buy_price = float(quantity), float(price), float(average_buy_price)
+    return {
+        'name': name,
+        'quantity': quantity,
+        'price': price,
+        'average_buy_price': average_buy_price,
+        'equity': quantity * price,
+        'percent_change': ((price - average_buy_price) / average_buy_price) * 100 if average_buy_price else 0.0,
+        'equity_change': (price - average_buy_price) * quantity,
+        'type': position_type
+    }
+
+
+def _request_crypto_quote(pair_id):
+    with contextlib.redirect_stdout(None):
+        return request_layer.call('quotes', request_get, crypto_quote_url(pair_id))
+
+
+def fetch_crypto_quotes(symbols, max_workers=4):
+    """
+    Returns {symbol: mark_price} for crypto symbols.
+
+    The currency pair list is fetched once to map every symbol to its pair ID, then all quotes
+    come back in a single forex quotes request. If that request fails, the quotes are fetched
+    concurrently one pair at a time instead.
+    """
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    with contextlib.redirect_stdout(None):
+        pairs = request_layer.call('quotes', request_get, crypto_currency_pairs_url(), 'results') or []
+    pair_ids = {}
+    for pair in pairs:
+        code = pair.get('asset_currency', {}).get('code')
+        if code in symbols and code not in pair_ids:
+            pair_ids[code] = pair['id']
+    if not pair_ids:
+        return {}
+    symbol_by_id = {pair_id: symbol for symbol, pair_id in pair_ids.items()}
+
+    with contextlib.redirect_stdout(None):
+        quotes = request_layer.call('quotes', request_get, CRYPTO_QUOTES_URL, 'results',
+                                    {'ids': ','.join(pair_ids.values())})
+    if not quotes or quotes == [None]:
+        logging.warning("Batched crypto quote request failed; fetching quotes per pair")
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            quotes = list(executor.map(_request_crypto_quote, pair_ids.values()))
+
+    prices = {}
+    for quote in quotes:
+        if quote and quote.get('id') in symbol_by_id and quote.get('mark_price') is not None:
+            prices[symbol_by_id[quote['id']]] = float(quote['mark_price'])
+    return prices
+
+
 def get_positions():
     # Get stock positions
-    stock_positions = r.account.build_holdings()
-    
-    # Get crypto positions
+    stock_positions = {
+        symbol: position_record(holding.get('name', symbol), holding['quantity'], holding['price'],
+                                holding['average_buy_price'])
+        for symbol, holding in request_layer.call('account', r.account.build_holdings).items()
+    }
+
+    # Get crypto positions: cost bases come from the single positions response, prices from one quote request
     try:
-        crypto_positions = r.crypto.get_crypto_positions()
-        # Convert crypto positions to same format as stocks
+        crypto_positions = [position for position in request_layer.call('account', r.crypto.get_crypto_positions)
+                            if float(position['quantity']) > 0]
+        prices = fetch_crypto_quotes(position['currency']['code'] for position in crypto_positions)
         for position in crypto_positions:
-            if float(position['quantity']) > 0:
-                symbol = position['currency']['code']
-                quantity = float(position['quantity'])
-                price = float(r.crypto.get_crypto_quote(symbol)['mark_price'])
-                average_buy_price = float(position['cost_bases'][0]['direct_cost_basis']) / quantity
-                stock_positions[symbol] = {
-                    'name': symbol,
-                    'quantity': str(quantity),
-                    'price': str(price),
-                    'average_buy_price': str(average_buy_price),
-                    'equity': str(quantity * price),
-                    'percent_change': str(((price - average_buy_price) / average_buy_price) * 100),
-                    'equity_change': str((price - average_buy_price) * quantity),
-                    'type': 'crypto'
-                }
+            symbol = position['currency']['code']
+            if symbol not in prices:
+                print(f"Error fetching crypto quote for {symbol}")
+                continue
+            quantity = float(position['quantity'])
+            cost_basis = float(position['cost_bases'][0]['direct_cost_basis'])
+            stock_positions[symbol] = position_record(symbol, quantity, prices[symbol], cost_basis / quantity, 'crypto')
     except Exception as e:
         print(f"Error fetching crypto positions: {e}")
 
@@ -47,9 +110,8 @@ def get_positions():
 
 def order_buy_market(symbol, quantity):
     try:
-        order = r.orders.order_buy_market(symbol, quantity)
-        order_id = order.get('id')  # Extract the order ID from the response
-        return order_id
+        order = request_layer.call('orders', r.orders.order_buy_market, symbol, quantity, idempotent=False)
+        return order
     except Exception as e:
         print(f"Error placing market order: {e}")
         return None
@@ -57,7 +119,7 @@ def order_buy_market(symbol, quantity):
 
 def order_sell_market(symbol, quantity):
     try:
-        order = r.orders.order_sell_market(symbol, quantity)
+        order = request_layer.call('orders', r.orders.order_sell_market, symbol, quantity, idempotent=False)
         return order
     except Exception as e:
         print(f"Error placing market sell order: {e}")
@@ -66,9 +128,11 @@ def order_sell_market(symbol, quantity):
 
 def order_crypto_buy_market(symbol, quantity):
     try:
-        order = r.orders.order_buy_crypto_by_quantity(
+        order = request_layer.call(
+            'orders', r.orders.order_buy_crypto_by_quantity,
             symbol=symbol,
-            quantity=quantity
+            quantity=quantity,
+            idempotent=False
         )
         return order.get('id')
     except Exception as e:
@@ -77,9 +141,11 @@ def order_crypto_buy_market(symbol, quantity):
 
 def order_crypto_sell_market(symbol, quantity):
     try:
-        order = r.orders.order_sell_crypto_by_quantity(
+        order = request_layer.call(
+            'orders', r.orders.order_sell_crypto_by_quantity,
             symbol=symbol,
-            quantity=quantity
+            quantity=quantity,
+            idempotent=False
         )
         return order
     except Exception as e:
@@ -87,28 +153,168 @@ def order_crypto_sell_market(symbol, quantity):
         return None
 
 
-def fetch_historical_data(stock, interval='day', span='3month'):
+def order_buy_crypto_by_price(symbol, amount):
+    try:
+        order = request_layer.call(
+            'orders', r.orders.order_buy_crypto_by_price,
+            symbol=symbol,
+            amountInDollars=amount,
+            idempotent=False
+        )
+        return order
+    except Exception as e:
+        print(f"Error placing crypto buy-by-price order: {e}")
+        return None
+
+
+def order_buy_fractional_by_price(symbol, amount):
     try:
-        sanitized_stock = stock.replace('-', '')
+        order = request_layer.call(
+            'orders', r.orders.order_buy_fractional_by_price,
+            symbol=symbol,
+            amountInDollars=amount,
+            timeInForce='gfd',
+            extendedHours=False,
+            idempotent=False
+        )
+        return order
+    except Exception as e:
+        print(f"Error placing fractional buy order: {e}")
+        return None
+
+
+def _sanitize_symbol(stock):
+    return stock.replace('-', '').upper()
+
+def _request_stock_historicals(stock, interval, span):
+    try:
+        sanitized_stock = _sanitize_symbol(stock)
         with contextlib.redirect_stdout(None):  # Suppress console output
-            data = r.stocks.get_stock_historicals(sanitized_stock, interval=interval, span=span)
+            data = request_layer.call('historicals', r.stocks.get_stock_historicals, sanitized_stock,
+                                      interval=interval, span=span)
         return data
-    except (r.exceptions.APIError, r.exceptions.RequestError, r.exceptions.NotFound) as e:
+    except Exception as e:
         logging.error(f"Failed to fetch data for {stock}: {e}")
         return None
 
-def fetch_crypto_historical_data(symbol, interval='day', span='3month'):
+def _request_historicals_chunk(sanitized_symbols, interval, span):
+    """
+    Requests historicals for several symbols in one call.
+
+    :return: Dict mapping sanitized symbol to its bars, or None if the request failed as a whole.
+    """
+    try:
+        with contextlib.redirect_stdout(None):  # Suppress console output
+            data = request_layer.call('historicals', r.stocks.get_stock_historicals, sanitized_symbols,
+                                      interval=interval, span=span)
+    except Exception as e:
+        logging.error(f"Failed to fetch historicals chunk starting at {sanitized_symbols[0]}: {e}")
+        return None
+    if data is None or data == [None]:
+        return None
+
+    grouped = {}
+    for bar in data:
+        grouped.setdefault(bar['symbol'], []).append(bar)
+    return grouped
+
+def fetch_historical_arrays(stock, interval='day', span='3month'):
+    """
+    Returns a stock's bars as a columnar Bars object (NumPy arrays), read through the bar cache.
+    Only the missing tail is requested when the symbol is already cached.
+    """
+    return bar_cache.read_through(
+        _sanitize_symbol(stock),
+        lambda fetch_span: _request_stock_historicals(stock, interval, fetch_span),
+        interval=interval, span=span
+    )
+
+def fetch_historical_data(stock, interval='day', span='3month'):
+    """
+    Returns a stock's bars in the broker's list-of-dicts layout, read through the bar cache.
+    """
+    bars = fetch_historical_arrays(stock, interval=interval, span=span)
+    return bars_to_dicts(bars, _sanitize_symbol(stock)) if bars is not None else None
+
+def fetch_historical_data_batch(symbols, chunk_size=HISTORICALS_CHUNK_SIZE, interval='day', span='3month', as_arrays=False,
+                                failures=None):
+    """
+    Fetches historicals for many symbols using one request per chunk of symbols.
+
+    Symbols are served from the bar cache where possible. The rest are grouped by the span
+    they need (full history or just the tail) and requested in chunks. If a chunk request
+    fails as a whole, its symbols are retried one at a time so a single bad ticker cannot
+    drop the rest of the chunk.
+
+    :param symbols: List of ticker symbols.
+    :param chunk_size: Number of symbols sent per historicals request.
+    :param as_arrays: Return columnar Bars objects instead of lists of dicts.
+    :param failures: Optional dict that receives {symbol: reason} (negative_cache.NOT_FOUND or
+                     negative_cache.API_ERROR) for symbols that came back without data.
+    :return: Dict mapping each requested symbol to its bars, or None if no data was returned.
+    """
+    cached = {}
+    served = {}
+    reasons = {}
+    pending_by_span = {}
+    for stock in symbols:
+        key = _sanitize_symbol(stock)
+        if key in cached:
+            continue
+        cached[key], fetch_span = bar_cache.plan_fetch(key, interval=interval, span=span)
+        if fetch_span is None:
+            served[key] = cached[key]
+        else:
+            pending_by_span.setdefault(fetch_span, []).append(key)
+
+    for fetch_span, keys in pending_by_span.items():
+        for start in range(0, len(keys), chunk_size):
+            chunk = keys[start:start + chunk_size]
+            fetched = _request_historicals_chunk(chunk, interval, fetch_span)
+            for key in chunk:
+                if fetched is None:
+                    # Whole chunk failed; fall back to per-symbol requests for this chunk only
+                    new_bars = _request_stock_historicals(key, interval, fetch_span)
+                    not_found = request_layer.last_status() in (400, 404)
+                else:
+                    # The chunk succeeded, so a symbol missing from it is unknown to the broker
+                    new_bars = fetched.get(key)
+                    not_found = True
+                if not new_bars or new_bars == [None]:
+                    reasons[key] = negative_cache.NOT_FOUND if not_found else negative_cache.API_ERROR
+                served[key] = bar_cache.update_from_fetch(key, cached[key], new_bars, interval=interval, span=span)
+
+    if not as_arrays:
+        served = {key: bars_to_dicts(bars, key) if bars is not None else None for key, bars in served.items()}
+    if failures is not None:
+        failures.update({stock: reasons[_sanitize_symbol(stock)] for stock in symbols
+                         if _sanitize_symbol(stock) in reasons})
+    return {stock: served.get(_sanitize_symbol(stock)) for stock in symbols}
+
+def _request_crypto_historicals(symbol, interval, span):
     try:
         with contextlib.redirect_stdout(None):
-            data = r.crypto.get_crypto_historicals(symbol, interval=interval, span=span)
+            data = request_layer.call('historicals', r.crypto.get_crypto_historicals, symbol,
+                                      interval=interval, span=span)
         return data
     except Exception as e:
         logging.error(f"Failed to fetch crypto data for {symbol}: {e}")
         return None
 
+def fetch_crypto_historical_arrays(symbol, interval='day', span='3month'):
+    return bar_cache.read_through(
+        symbol,
+        lambda fetch_span: _request_crypto_historicals(symbol, interval, fetch_span),
+        interval=interval, span=span, bounds='24_7'
+    )
+
+def fetch_crypto_historical_data(symbol, interval='day', span='3month'):
+    bars = fetch_crypto_historical_arrays(symbol, interval=interval, span=span)
+    return bars_to_dicts(bars, symbol) if bars is not None else None
+
 def get_top_movers(direction='up'):
     try:
-        movers = r.markets.get_top_movers_sp500(direction=direction)
+        movers = request_layer.call('markets', r.markets.get_top_movers_sp500, direction=direction)
         symbols = [mover['symbol'] for mover in movers]
         return symbols
     except Exception as e:
@@ -119,7 +325,7 @@ def get_portfolio_size(simulated=SIMULATED, simulated_size=SIMULATED_PORTFOLIO_S
     if simulated:
         return simulated_size
     else:
-        portfolio = r.profiles.load_account_profile(info='portfolio_cash')
+        portfolio = request_layer.call('account', r.profiles.load_account_profile, info='portfolio_cash')
         return float(portfolio)
 
 def load_csv_data(file_path, exchange):
@@ -0,0 +1,413 @@
+# utils/backtest.py
+import os
+import json
+import shutil
+import logging
+from datetime import datetime, timezone
+from typing import NamedTuple
+import numpy as np
+from utils import bar_cache
+from utils.analysis import sma, wilder_atr
+from utils.screener import MIN_HISTORY, classify_atr_percent, filter_block, size_block
+from utils.symbols import lookup
+from utils.universe import load_universe
+from utils.settings import MAX_DAILY_LOSS, ATR_THRESHOLDS, BACKTEST_INITIAL_CAPITAL
+
+# Vectorized replay of the live strategy over cached daily bars. The universe is aligned onto
+# one (symbols, days) grid, indicators are computed for every symbol and day in a few matrix
+# passes, and every possible entry's exit is resolved at once from a window of the bars that
+# follow it. Only the portfolio itself (risk cap, top-N selection, cash) is stepped day by day,
+# and that loop touches a handful of candidates per day.
+
+DAY_SECONDS = 86400
+
+# Relative slack on the risk limits. A per-trade loss of exactly risk_per_trade of the portfolio
+# can round to just above it, which would reject every trade for some parameter values.
+RISK_TOLERANCE = 1e-9
+
+# Why a trade closed
+EXIT_OPEN, EXIT_STOP, EXIT_TARGET, EXIT_TIME = 'open', 'stop', 'target', 'time'
+
+
+class StrategyParams(NamedTuple):
+    short_period: int = 20  # analyze_stock's moving averages
+    long_period: int = 50
+    crossover_days: int = 5  # Crossover must be this recent
+    atr_period: int = 14
+    atr_floor: float = 3.0  # Minimum ATR% to trade
+    atr_thresholds: tuple = ATR_THRESHOLDS  # Classified ATR% buckets that may be traded
+    atr_multiple: float = 2.0  # Stop and target distance from the purchase price, in ATRs
+    risk_per_trade: float = 0.02  # Share of the portfolio lost if the stop is hit
+    max_daily_loss: float = MAX_DAILY_LOSS  # Cap on the summed risk of open trades
+    max_hold_days: int = 10  # Calendar days after which a trade is closed regardless
+    top_n: int = 3  # Best candidates by ATR% considered per day
+
+    def indicator_key(self):
+        """
+        The parameters the indicator arrays depend on; runs sharing a key can share Signals.
+        """
+        return self.short_period, self.long_period, self.crossover_days, self.atr_period
+
+
+class Panel:
+    """
+    Daily bars for many symbols aligned on one calendar: each price field is a (symbols, days)
+    matrix with NaN where a symbol has no bar. `days` holds epoch day numbers (UTC).
+    """
+    __slots__ = ('symbols', 'days', 'open', 'high', 'low', 'close')
+
+    def __init__(self, symbols, days, open, high, low, close):
+        self.symbols = symbols
+        self.days = days
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+
+    def __len__(self):
+        return len(self.symbols)
+
+
+class Signals(NamedTuple):
+    bullish: np.ndarray  # Recent 20/50 bullish crossover as of each day's close
+    atr: np.ndarray  # Wilder ATR as of each day's close
+    atr_percent: np.ndarray
+    atr_filled: np.ndarray  # ATR carried forward over days a symbol has no bar
+    close_filled: np.ndarray  # Close carried forward, used to mark positions
+
+
+class BacktestResult(NamedTuple):
+    days: np.ndarray  # Epoch day numbers of the simulated span
+    equity: np.ndarray  # Cash plus open positions marked at each day's close
+    open_positions: np.ndarray  # Number of positions held at each day's close
+    trades: list  # One dict per trade, in entry order
+    params: StrategyParams
+    initial_capital: float
+
+
+def panel_from_bars(bars_by_symbol, min_history=MIN_HISTORY):
+    """
+    Aligns per-symbol Bars onto a shared daily calendar. Symbols with fewer than min_history
+    bars cannot produce a signal and are left out.
+    """
+    members = [(symbol, bars) for symbol, bars in bars_by_symbol.items()
+               if bars is not None and len(bars) >= min_history]
+    if not members:
+        empty = np.empty((0, 0))
+        return Panel([], np.empty(0, dtype=np.int64), empty, empty, empty, empty)
+    symbol_days = [np.asarray(bars.begins_at, dtype=np.int64) // DAY_SECONDS for _, bars in members]
+    days = np.unique(np.concatenate(symbol_days))
+    fields = {field: np.full((len(members), len(days)), np.nan) for field in ('open', 'high', 'low', 'close')}
+    for row, ((_, bars), own_days) in enumerate(zip(members, symbol_days)):
+        columns = np.searchsorted(days, own_days)
+        for field, matrix in fields.items():
+            matrix[row, columns] = getattr(bars, field)
+    return Panel([symbol for symbol, _ in members], days, **fields)
+
+
+def load_panel(symbols=None, interval='day', min_history=MIN_HISTORY):
+    """
+    Builds a Panel from the bar cache without fetching anything. Stocks are read from the
+    regular-hours store and coins from the 24/7 store, as the scan caches them.
+
+    :param symbols: Symbols to load (default: the whole universe index).
+    """
+    if symbols is None:
+        symbols = load_universe().symbols()
+    bars_by_symbol = {}
+    for symbol in symbols:
+        info = lookup(symbol)
+        entry = bar_cache.get_store(interval, info.trading_hours).get(info.symbol)
+        if entry is not None:
+            bars_by_symbol[info.symbol] = entry[0]
+    panel = panel_from_bars(bars_by_symbol, min_history)
+    logging.info(f"Backtest panel: {len(panel)} of {len(symbols)} symbols with cached history, "
+                 f"{len(panel.days)} days")
+    return panel
+
+
+def _save_columns(directory, columns, meta):
+    """
+    Writes each array as an .npy file plus meta.json, into a temporary directory that replaces
+    `directory` only once complete.
+    """
+    tmp_dir = directory + '.tmp'
+    shutil.rmtree(tmp_dir, ignore_errors=True)
+    os.makedirs(tmp_dir)
+    for name, array in columns.items():
+        np.save(os.path.join(tmp_dir, f"{name}.npy"), array)
+    with open(os.path.join(tmp_dir, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+    shutil.rmtree(directory, ignore_errors=True)
+    os.replace(tmp_dir, directory)
+
+
+def _open_columns(directory, names):
+    with open(os.path.join(directory, 'meta.json'), 'r') as f:
+        meta = json.load(f)
+    return meta, {name: np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in names}
+
+
+def save_panel(panel, directory):
+    _save_columns(directory, {field: getattr(panel, field) for field in Panel.__slots__[1:]},
+                  {'symbols': list(panel.symbols)})
+
+
+def open_panel(directory):
+    """
+    Opens a saved Panel with read-only memory-mapped matrices, so processes reading the same
+    files share one copy through the page cache.
+    """
+    meta, columns = _open_columns(directory, Panel.__slots__[1:])
+    return Panel(meta['symbols'], **columns)
+
+
+def save_signals(signals, directory, params=StrategyParams()):
+    _save_columns(directory, signals._asdict(), {'indicator_key': list(params.indicator_key())})
+
+
+def open_signals(directory):
+    """
+    Opens saved Signals memory-mapped read-only, or returns None if none were saved there.
+    """
+    try:
+        _, columns = _open_columns(directory, Signals._fields)
+    except FileNotFoundError:
+        return None
+    except (ValueError, OSError) as e:
+        logging.warning(f"Ignoring unreadable signals in {directory}: {e}")
+        return None
+    return Signals(**columns)
+
+
+def _fill_forward(matrix):
+    """
+    Carries each row's last finite value forward over NaNs; leading NaNs stay NaN.
+    """
+    columns = np.where(np.isfinite(matrix), np.arange(matrix.shape[1]), 0)
+    np.maximum.accumulate(columns, axis=1, out=columns)
+    return matrix[np.arange(matrix.shape[0])[:, None], columns]
+
+
+def _signal_block(closes, highs, lows, params):
+    """
+    Per-bar crossover and ATR for equal-length histories, matching screen_block at every bar:
+    bullish[:, t] is what _crossover_mask returns for the first t + 1 bars.
+    """
+    count, length = closes.shape
+    long_period, days = params.long_period, params.crossover_days
+    bullish = np.zeros((count, length), dtype=bool)
+    if length >= long_period + days:
+        ma_long = sma(closes, long_period)
+        ma_short = sma(closes, params.short_period)[:, -ma_long.shape[1]:]
+        crossed = np.zeros((count, length + 1), dtype=np.int64)
+        crossed[:, long_period + 1:] = (ma_short[:, :-1] <= ma_long[:, :-1]) & (ma_short[:, 1:] > ma_long[:, 1:])
+        recent = np.cumsum(crossed, axis=1)
+        bullish[:, days - 1:] = recent[:, days:] > recent[:, :-days]
+        bullish[:, :long_period + days - 1] = False
+    atr = np.full((count, length), np.nan)
+    if length > params.atr_period:
+        atr[:, params.atr_period:] = wilder_atr(highs, lows, closes, params.atr_period)
+    return bullish, atr
+
+
+def compute_signals(panel, params=StrategyParams()):
+    """
+    Computes crossover and ATR for every symbol and day. Each symbol's indicators run over its
+    own bars (gaps in the shared calendar are skipped, not filled); symbols with the same bar
+    count are evaluated as one matrix.
+    """
+    bullish = np.zeros(panel.close.shape, dtype=bool)
+    atr = np.full(panel.close.shape, np.nan)
+    present = np.isfinite(panel.close)
+    by_length = {}
+    for row in range(len(panel)):
+        columns = np.flatnonzero(present[row])
+        by_length.setdefault(len(columns), []).append((row, columns))
+    for members in by_length.values():
+        rows = np.array([row for row, _ in members])
+        columns = np.stack([columns for _, columns in members])
+        block_bullish, block_atr = _signal_block(panel.close[rows[:, None], columns], panel.high[rows[:, None], columns],
+                                                 panel.low[rows[:, None], columns], params)
+        bullish[rows[:, None], columns] = block_bullish
+        atr[rows[:, None], columns] = block_atr
+    with np.errstate(divide='ignore', invalid='ignore'):
+        atr_percent = np.where(panel.close != 0, atr / panel.close * 100, 0.0)
+    return Signals(bullish, atr, atr_percent, _fill_forward(atr), _fill_forward(panel.close))
+
+
+def resolve_exits(panel, signals, rows, columns, params, end):
+    """
+    Finds where every candidate entry would exit, all at once.
+
+    An entry is bought at the close of its signal day. On each later day, in the order the bot
+    checks them: a trade held more than max_hold_days calendar days is sold at the open; then a
+    low at or below purchase - atr_multiple * ATR is stopped out (at the open if it gapped
+    through), and a high at or above purchase + atr_multiple * ATR takes profit (likewise). The
+    ATR is the one known before the day starts. A trade with no exit before `end` stays open.
+
+    :return: Tuple of (exit column, exit price, reason) arrays.
+    """
+    # The time exit is due at the first column more than max_hold_days calendar days after entry;
+    # it happens at the symbol's first bar from there on (a stock's Monday open when the panel
+    # also has crypto weekends). Stops and targets can only fire on days before that column.
+    due = np.searchsorted(panel.days, panel.days[columns] + params.max_hold_days + 1)
+    horizon = max(params.max_hold_days, 1)  # Columns are distinct days, so at most max_hold_days lie before `due`
+    ahead = columns[:, None] + np.arange(1, horizon + 1)
+    inside = ahead < np.minimum(due, end)[:, None]
+    ahead = np.minimum(ahead, end - 1)
+    entry = panel.close[rows, columns][:, None]
+    distance = params.atr_multiple * signals.atr_filled[rows[:, None], ahead - 1]
+    opens = panel.open[rows[:, None], ahead]
+    stopped = inside & (panel.low[rows[:, None], ahead] <= entry - distance)
+    targeted = inside & (panel.high[rows[:, None], ahead] >= entry + distance)
+
+    triggered = stopped | targeted
+    first = np.argmax(triggered, axis=1)
+    pick = np.arange(len(rows)), first
+    hit = triggered[pick]
+    stop_price = (entry - distance)[pick]
+    target_price = (entry + distance)[pick]
+    day_open = np.where(np.isnan(opens[pick]), np.inf, opens[pick])
+    exit_price = np.where(stopped[pick], np.minimum(day_open, stop_price),
+                          np.maximum(np.where(np.isinf(day_open), -np.inf, day_open), target_price))
+    reason = np.where(stopped[pick], EXIT_STOP, EXIT_TARGET)
+    exit_column = np.where(hit, ahead[pick], end - 1)
+
+    # Entries that neither stopped nor took profit: sold at the open of their next bar from `due`
+    timed = ~hit & (due < end)
+    if timed.any():
+        unique_rows, row_index = np.unique(rows[timed], return_inverse=True)
+        bar_columns = np.where(np.isfinite(panel.open[unique_rows, :end]), np.arange(end), end)
+        next_bar = np.minimum.accumulate(bar_columns[:, ::-1], axis=1)[:, ::-1]
+        time_column = next_bar[row_index, due[timed]]
+        has_bar = time_column < end
+        timed[timed] = has_bar
+        exit_column[timed] = time_column[has_bar]
+        exit_price[timed] = panel.open[rows[timed], exit_column[timed]]
+        reason[timed] = EXIT_TIME
+
+    held_open = ~hit & ~timed
+    exit_price = np.where(held_open, signals.close_filled[rows, end - 1], exit_price)
+    return exit_column, exit_price, np.where(held_open, EXIT_OPEN, reason)
+
+
+def format_day(day):
+    return datetime.fromtimestamp(int(day) * DAY_SECONDS, tz=timezone.utc).strftime('%Y-%m-%d')
+
+
+def run_backtest(panel, params=StrategyParams(), initial_capital=BACKTEST_INITIAL_CAPITAL, signals=None,
+                 start=0, end=None):
+    """
+    Replays the strategy over panel columns [start, end).
+
+    Each day, after that day's exits: the portfolio is marked at the close, every symbol with a
+    recent bullish crossover, ATR% at or above atr_floor and a classified ATR% in atr_thresholds
+    is sized as analyze_stock sizes it against that equity, candidates whose risk would break
+    the max_daily_loss cap are dropped, and the top_n by ATR% are taken in order as bot.main
+    takes them: a symbol already held is skipped, the loop stops once the cap is used up, and
+    a trade needing more risk or cash than is left is passed over.
+
+    :param signals: Signals from compute_signals for the same indicator_key, to reuse them.
+    :return: BacktestResult.
+    """
+    end = len(panel.days) if end is None else end
+    if end <= start:
+        return BacktestResult(panel.days[start:start], np.empty(0), np.zeros(0, dtype=np.int64), [], params,
+                              float(initial_capital))
+    if signals is None:
+        signals = compute_signals(panel, params)
+    _, passes = filter_block(signals.bullish[:, start:end], signals.atr_percent[:, start:end],
+                             params.atr_thresholds, params.atr_floor)
+    rows, columns = np.nonzero(passes)
+    columns = columns + start
+    atr_percent = signals.atr_percent[rows, columns]
+    order = np.lexsort((rows, -atr_percent, columns))  # By day, then best ATR% first
+    rows, columns, atr_percent = rows[order], columns[order], atr_percent[order]
+    exit_column, exit_price, reason = resolve_exits(panel, signals, rows, columns, params, end)
+    day_bounds = np.searchsorted(columns, np.arange(start, end + 1))
+
+    cash = float(initial_capital)
+    current_risk = 0.0
+    held = {}  # row -> trade dict
+    exits_by_column = {}
+    trades = []
+    equity = np.empty(end - start)
+    open_positions = np.zeros(end - start, dtype=np.int64)
+    for offset, column in enumerate(range(start, end)):
+        for trade in exits_by_column.pop(column, ()):
+            cash += trade['shares'] * trade['exit_price']
+            current_risk -= trade['risk_dollar']
+            del held[trade['row']]
+        portfolio_size = cash + sum(trade['shares'] * signals.close_filled[row, column] for row, trade in held.items())
+
+        first, last = day_bounds[offset], day_bounds[offset + 1]
+        if first < last:
+            _, purchase_amount, potential_loss, within_risk = size_block(
+                atr_percent[first:last], portfolio_size, current_risk, params.risk_per_trade, params.atr_multiple,
+                params.max_daily_loss, RISK_TOLERANCE
+            )
+            risk_cap = params.max_daily_loss * portfolio_size
+            for index in np.flatnonzero(within_risk)[:params.top_n]:
+                candidate = first + index
+                row = rows[candidate]
+                if row in held:
+                    continue
+                if current_risk >= risk_cap:
+                    break
+                if potential_loss[index] > risk_cap - current_risk or purchase_amount[index] > cash:
+                    continue
+                price = panel.close[row, column]
+                trade = {
+                    'row': row,
+                    'symbol': panel.symbols[row],
+                    'entry_date': format_day(panel.days[column]),
+                    'exit_date': format_day(panel.days[exit_column[candidate]]),
+                    'entry_price': float(price),
+                    'exit_price': float(exit_price[candidate]),
+                    'shares': float(purchase_amount[index]) / float(price),
+                    'trade_amount': float(purchase_amount[index]),
+                    'risk_dollar': float(potential_loss[index]),
+                    'atr_percent': float(atr_percent[candidate]),
+                    'classified_atr_percent': float(classify_atr_percent(atr_percent[candidate])),
+                    'reason': str(reason[candidate]),
+                }
+                trade['pnl'] = trade['shares'] * (trade['exit_price'] - trade['entry_price'])
+                cash -= trade['trade_amount']
+                current_risk += trade['risk_dollar']
+                held[row] = trade
+                trades.append(trade)
+                if trade['reason'] != EXIT_OPEN:
+                    exits_by_column.setdefault(int(exit_column[candidate]), []).append(trade)
+            portfolio_size = cash + sum(trade['shares'] * signals.close_filled[row, column]
+                                        for row, trade in held.items())
+        equity[offset] = portfolio_size
+        open_positions[offset] = len(held)
+
+    for trade in trades:
+        del trade['row']
+    return BacktestResult(panel.days[start:end], equity, open_positions, trades, params, float(initial_capital))
+
+
+def metrics(result):
+    """
+    Summary statistics of a backtest: total return, CAGR over the calendar span, maximum
+    drawdown of the daily equity curve, win rate over closed trades, and exposure (the share
+    of days ending with at least one open position).
+    """
+    equity = result.equity
+    if len(equity) == 0:
+        return {'total_return': 0.0, 'cagr': 0.0, 'max_drawdown': 0.0, 'win_rate': 0.0, 'trades': 0,
+                'exposure': 0.0, 'final_equity': result.initial_capital}
+    years = max(int(result.days[-1] - result.days[0]), 1) / 365.25
+    growth = float(equity[-1]) / result.initial_capital
+    closed = [trade for trade in result.trades if trade['reason'] != EXIT_OPEN]
+    return {
+        'total_return': growth - 1,
+        'cagr': growth ** (1 / years) - 1 if growth > 0 else -1.0,
+        'max_drawdown': float(np.max(1 - equity / np.maximum.accumulate(np.maximum(equity, 1e-12)))),
+        'win_rate': sum(trade['pnl'] > 0 for trade in closed) / len(closed) if closed else 0.0,
+        'trades': len(result.trades),
+        'exposure': float(np.mean(result.open_positions > 0)),
+        'final_equity': float(equity[-1]),
+    }
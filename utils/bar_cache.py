@@ -0,0 +1,178 @@
+# utils/bar_cache.py
+import os
+import logging
+import threading
+import atexit
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+import numpy as np
+from utils.bar_store import BarStore, Bars, BAR_FIELDS, bars_from_dicts
+from utils.symbols import REGULAR_HOURS
+from utils.settings import BAR_CACHE_DIR, BAR_CACHE_FORMING_TTL_MINUTES
+
+# Calendar days covered by each broker span, used to trim merged history and pick tail spans
+SPAN_DAYS = {'hour': 1, 'day': 1, 'week': 7, 'month': 31, '3month': 92, 'year': 366, '5year': 1830}
+# Short spans that may be used to refresh only the tail of a cached series, smallest first
+TAIL_SPANS = {'day': ('week', 'month'), 'week': ('3month', 'year')}
+DAY_SECONDS = 86400
+MARKET_TIMEZONE = ZoneInfo('America/New_York')  # REGULAR_HOURS are exchange-local times
+
+_lock = threading.RLock()
+_stores = {}  # (interval, bounds) -> BarStore
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+def get_store(interval='day', bounds='regular'):
+    """
+    Returns the memory-mapped BarStore holding cached bars for an interval and bounds.
+    """
+    with _lock:
+        key = (interval, bounds)
+        if key not in _stores:
+            _stores[key] = BarStore(os.path.join(BAR_CACHE_DIR, f"{interval}_{bounds}"))
+        return _stores[key]
+
+
+def get_arrays(symbol, interval='day', span='3month', bounds='regular'):
+    """
+    Returns the cached Bars for a symbol without fetching anything, or None if it is not cached.
+    Columns are read-only NumPy views into the store.
+    """
+    entry = get_store(interval, bounds).get(symbol)
+    if entry is None:
+        return None
+    return _trim(entry[0], span)
+
+
+def session_between(start, end, bounds='regular'):
+    """
+    Whether a trading session was open at any point between two aware datetimes. Bars for a
+    regular-hours series can only change while a weekday session is open; any other bounds
+    (24/7 crypto) are always in session. Exchange holidays count as sessions, which only
+    costs a refresh that finds nothing new.
+    """
+    if bounds != 'regular':
+        return True
+    if end - start > timedelta(days=7):
+        return True
+    day = start.astimezone(MARKET_TIMEZONE).date()
+    while day <= end.astimezone(MARKET_TIMEZONE).date():
+        if day.weekday() < 5:
+            opens = datetime.combine(day, REGULAR_HOURS[0], MARKET_TIMEZONE)
+            closes = datetime.combine(day, REGULAR_HOURS[1], MARKET_TIMEZONE)
+            if opens < end and start < closes:
+                return True
+        day += timedelta(days=1)
+    return False
+
+
+def plan_fetch(symbol, interval='day', span='3month', bounds='regular', now=None):
+    """
+    Decides what, if anything, must be fetched to serve a symbol's bars.
+
+    Bars whose period had closed when they were fetched are final. The last bar may still
+    have been forming, so a cache entry is only served as-is for BAR_CACHE_FORMING_TTL_MINUTES
+    after its fetch; after that the tail is re-fetched with the shortest span covering the gap.
+    An entry fetched after the last session closed (overnight, weekends) is complete and is
+    served without a refresh until the next session opens.
+
+    :return: Tuple of (cached_bars, fetch_span). fetch_span is None when the cache can be served,
+             a short span for a tail refresh, or the requested span for a full fetch.
+    """
+    now = now or _now()
+    entry = get_store(interval, bounds).get(symbol)
+    if entry is None or len(entry[0]) == 0 or SPAN_DAYS[entry[1]] < SPAN_DAYS[span]:
+        return None, span
+
+    bars, _, fetched_at = entry
+    fetched_at = datetime.fromisoformat(fetched_at)
+    if (now - fetched_at < timedelta(minutes=BAR_CACHE_FORMING_TTL_MINUTES)
+            or not session_between(fetched_at, now, bounds)):
+        return _trim(bars, span), None
+
+    gap_seconds = now.timestamp() - bars.begins_at[-1]
+    for tail_span in TAIL_SPANS.get(interval, ()):
+        # The tail must reach back past the last cached bar so it can replace a partial bar
+        if SPAN_DAYS[tail_span] < SPAN_DAYS[span] and gap_seconds < (SPAN_DAYS[tail_span] - 1) * DAY_SECONDS:
+            return _trim(bars, span), tail_span
+    return _trim(bars, span), span
+
+
+def _trim(bars, span):
+    if len(bars) == 0:
+        return bars
+    cutoff = bars.begins_at[-1] - SPAN_DAYS[span] * DAY_SECONDS
+    return bars[int(np.searchsorted(bars.begins_at, cutoff, side='right')):]
+
+
+def merge_bars(cached_bars, new_bars):
+    """
+    Merges freshly fetched bars over cached ones. Every cached bar at or after the first new
+    bar is replaced, which drops any stale copy of a bar that was still forming.
+    """
+    if cached_bars is None or len(cached_bars) == 0:
+        return new_bars
+    if len(new_bars) == 0:
+        return cached_bars
+    kept = int(np.searchsorted(cached_bars.begins_at, new_bars.begins_at[0], side='left'))
+    return Bars(*(np.concatenate((getattr(cached_bars, field)[:kept], getattr(new_bars, field)))
+                  for field in BAR_FIELDS))
+
+
+def store_bars(symbol, bars, interval='day', span='3month', bounds='regular', fetched_at=None):
+    """
+    Stores bars for a symbol, replacing the previous entry.
+    """
+    fetched_at = fetched_at or _now()
+    store = get_store(interval, bounds)
+    previous = store.get(symbol)
+    # Keep the widest span we have covered so a shorter request never shrinks the entry
+    if previous and SPAN_DAYS[previous[1]] > SPAN_DAYS[span]:
+        span = previous[1]
+    store.put(symbol, _trim(bars, span), span, fetched_at.isoformat())
+
+
+def update_from_fetch(symbol, cached_bars, new_bars, interval='day', span='3month', bounds='regular', now=None):
+    """
+    Merges the result of a full or tail fetch into the cache and returns the Bars to serve.
+
+    new_bars is the broker's raw list of dicts. A failed fetch (None or [None]) falls back
+    to the cached bars if there are any, and otherwise returns None.
+    """
+    if not new_bars or new_bars == [None]:
+        if cached_bars is not None and len(cached_bars):
+            logging.warning(f"Serving cached bars for {symbol}; refresh failed")
+            return cached_bars
+        return None
+    merged = merge_bars(cached_bars, bars_from_dicts(new_bars))
+    store_bars(symbol, merged, interval=interval, span=span, bounds=bounds, fetched_at=now)
+    return _trim(merged, span)
+
+
+def read_through(symbol, fetch, interval='day', span='3month', bounds='regular'):
+    """
+    Serves a symbol's Bars from the cache, fetching only what is missing.
+
+    :param fetch: Callable taking a span and returning the broker's list of bars.
+    """
+    now = _now()
+    cached_bars, fetch_span = plan_fetch(symbol, interval=interval, span=span, bounds=bounds, now=now)
+    if fetch_span is None:
+        return cached_bars
+    new_bars = fetch(fetch_span)
+    return update_from_fetch(symbol, cached_bars, new_bars, interval=interval, span=span, bounds=bounds, now=now)
+
+
+def flush():
+    """
+    Writes any modified stores to disk.
+    """
+    with _lock:
+        for store in _stores.values():
+            store.flush()
+
+
+atexit.register(flush)
@@ -0,0 +1,252 @@
+# utils/bar_store.py
+import json
+import os
+import glob
+import logging
+import threading
+from datetime import datetime, timezone
+import numpy as np
+
+PRICE_FIELDS = ('open', 'high', 'low', 'close', 'volume')
+BAR_FIELDS = ('begins_at',) + PRICE_FIELDS
+
+
+class Bars:
+    """
+    Columnar OHLCV history for one symbol.
+
+    begins_at holds int64 epoch seconds; the price fields and volume are float64 arrays.
+    Arrays handed out by BarStore are read-only views into memory-mapped files.
+    """
+    __slots__ = BAR_FIELDS
+
+    def __init__(self, begins_at, open, high, low, close, volume):
+        self.begins_at = begins_at
+        self.open = open
+        self.high = high
+        self.low = low
+        self.close = close
+        self.volume = volume
+
+    def __len__(self):
+        return len(self.close)
+
+    def __getitem__(self, index):
+        # Slicing keeps every column aligned and stays a view
+        return Bars(*(getattr(self, field)[index] for field in BAR_FIELDS))
+
+    @classmethod
+    def empty(cls):
+        return cls(np.empty(0, dtype=np.int64), *(np.empty(0) for _ in PRICE_FIELDS))
+
+
+def parse_timestamp(value):
+    return int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp())
+
+
+def format_timestamp(value):
+    return datetime.fromtimestamp(int(value), tz=timezone.utc).strftime('%Y-%m-%dT%H:%M:%SZ')
+
+
+def bars_from_dicts(historicals):
+    """
+    Converts the broker's list-of-dicts historicals (string prices) into a Bars object.
+    This is the only place bar fields are parsed from strings.
+    """
+    if not historicals:
+        return Bars.empty()
+    return Bars(
+        np.array([parse_timestamp(bar['begins_at']) for bar in historicals], dtype=np.int64),
+        np.array([float(bar['open_price']) for bar in historicals]),
+        np.array([float(bar['high_price']) for bar in historicals]),
+        np.array([float(bar['low_price']) for bar in historicals]),
+        np.array([float(bar['close_price']) for bar in historicals]),
+        np.array([float(bar.get('volume') or 0) for bar in historicals]),
+    )
+
+
+def bars_to_dicts(bars, symbol):
+    """
+    Converts Bars back into the broker's list-of-dicts layout for callers that still use it.
+    Prices are returned as floats rather than strings.
+    """
+    return [
+        {
+            'begins_at': format_timestamp(bars.begins_at[i]),
+            'open_price': float(bars.open[i]),
+            'high_price': float(bars.high[i]),
+            'low_price': float(bars.low[i]),
+            'close_price': float(bars.close[i]),
+            'volume': float(bars.volume[i]),
+            'symbol': symbol,
+        }
+        for i in range(len(bars))
+    ]
+
+
+STORE_VERSION = 2
+MAX_PIECES = 8  # A symbol reaching this many pieces has all but its first rewritten as one
+COMPACT_DEAD_FRACTION = 0.5  # Rewrite the whole store once this share of stored rows is unreferenced
+
+
+def _common_prefix(old, new):
+    """
+    Number of leading rows two Bars share exactly (the part of a symbol that need not be rewritten).
+    """
+    length = min(len(old), len(new))
+    if length == 0:
+        return 0
+    same = np.ones(length, dtype=bool)
+    for field in BAR_FIELDS:
+        same &= getattr(old, field)[:length] == getattr(new, field)[:length]
+    mismatch = np.flatnonzero(~same)
+    return int(mismatch[0]) if len(mismatch) else length
+
+
+class BarStore:
+    """
+    Memory-mapped columnar store of bars for one (interval, bounds) pair.
+
+    Bars live in segments: each flush writes one .npy file per field holding only the rows
+    that changed, and index.json maps each symbol to its pieces ([segment, start, end] row
+    ranges, oldest first) plus cache metadata. A refreshed symbol whose history is unchanged
+    apart from its tail only gets its new rows appended, so a flush costs the size of what was
+    fetched, not of the whole cache. Columns are opened with np.load(mmap_mode='r'); a symbol
+    held in a single piece is served as a view, without parsing or copying.
+
+    Pieces are folded back together as they pile up: a symbol's tail pieces once it reaches
+    MAX_PIECES, and the whole store once COMPACT_DEAD_FRACTION of stored rows is unreferenced. index.json is replaced
+    last, so a crash mid-flush leaves the previous state intact.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self._lock = threading.RLock()
+        self._segments = {}  # segment -> {field: memmap}
+        self._index = {}
+        self._next_segment = 1
+        self._updates = {}
+        self._load()
+
+    def _column_path(self, field, segment):
+        return os.path.join(self.directory, f"{field}.{segment}.npy")
+
+    def _load(self):
+        index_path = os.path.join(self.directory, 'index.json')
+        try:
+            with open(index_path, 'r') as f:
+                index = json.load(f)
+            if index.get('version') == STORE_VERSION:
+                symbols = index['symbols']
+            else:
+                # One-generation layout: {symbol: [start, end, span, fetched_at]}
+                generation = index['generation']
+                symbols = {symbol: [[[generation, start, end]], span, fetched_at]
+                           for symbol, (start, end, span, fetched_at) in index['symbols'].items()}
+            referenced = {piece[0] for pieces, _, _ in symbols.values() for piece in pieces}
+            segments = {segment: {field: np.load(self._column_path(field, segment), mmap_mode='r')
+                                  for field in BAR_FIELDS} for segment in referenced}
+        except FileNotFoundError:
+            return
+        except (ValueError, KeyError, TypeError, OSError) as e:
+            logging.error(f"Discarding unreadable bar store {self.directory}: {e}")
+            return
+        self._index = symbols
+        self._segments = segments
+        self._next_segment = max(index.get('next_segment', 1), *(segment + 1 for segment in referenced), 1)
+
+    def _read(self, pieces):
+        parts = [Bars(*(self._segments[segment][field][start:end] for field in BAR_FIELDS))
+                 for segment, start, end in pieces]
+        if len(parts) == 1:
+            return parts[0]
+        if not parts:
+            return Bars.empty()
+        return Bars(*(np.concatenate([getattr(part, field) for part in parts]) for field in BAR_FIELDS))
+
+    def get(self, symbol):
+        """
+        :return: Tuple of (bars, span, fetched_at ISO string), or None if the symbol is not stored.
+        """
+        with self._lock:
+            if symbol in self._updates:
+                return self._updates[symbol]
+            location = self._index.get(symbol)
+            if location is None:
+                return None
+            pieces, span, fetched_at = location
+            return self._read(pieces), span, fetched_at
+
+    def put(self, symbol, bars, span, fetched_at):
+        with self._lock:
+            self._updates[symbol] = (bars, span, fetched_at)
+
+    def symbols(self):
+        with self._lock:
+            return set(self._index) | set(self._updates)
+
+    def _plan_updates(self, rewrite_all):
+        """
+        :return: Tuple of (new index, [(symbol, bars to write)]) for the next segment. Unchanged
+                 leading rows keep their existing pieces; only the rest is written.
+        """
+        index = {} if rewrite_all else dict(self._index)
+        writes = []
+        for symbol in sorted(self.symbols() if rewrite_all else self._updates):
+            bars, span, fetched_at = self.get(symbol)
+            kept = []
+            location = None if rewrite_all else self._index.get(symbol)
+            if location is not None:
+                shared = _common_prefix(self._read(location[0]), bars)
+                # Past MAX_PIECES, the small tail pieces are folded into one; the bulk stays put
+                pieces = location[0] if len(location[0]) < MAX_PIECES else location[0][:1]
+                for segment, start, end in pieces:
+                    take = min(end - start, shared)
+                    if take > 0:
+                        kept.append([segment, start, start + take])
+                    shared -= take
+            rest = bars[sum(end - start for _, start, end in kept):]
+            index[symbol] = [kept, span, fetched_at]
+            if len(rest):
+                writes.append((symbol, rest))
+        return index, writes
+
+    def flush(self):
+        """
+        Writes pending updates as a new segment, or rewrites the store if most rows are dead.
+        """
+        with self._lock:
+            if not self._updates:
+                return
+            os.makedirs(self.directory, exist_ok=True)
+            index, writes = self._plan_updates(rewrite_all=False)
+            stored = sum(len(columns['close']) for columns in self._segments.values())
+            kept = sum(end - start for pieces, _, _ in index.values() for _, start, end in pieces)
+            written = sum(len(bars) for _, bars in writes)
+            if stored - kept > COMPACT_DEAD_FRACTION * (stored + written):
+                index, writes = self._plan_updates(rewrite_all=True)
+
+            segment = self._next_segment
+            offset = 0
+            for symbol, bars in writes:
+                index[symbol][0].append([segment, offset, offset + len(bars)])
+                offset += len(bars)
+            if writes:
+                for field in BAR_FIELDS:
+                    dtype = np.int64 if field == 'begins_at' else np.float64
+                    column = np.concatenate([getattr(bars, field) for _, bars in writes]).astype(dtype, copy=False)
+                    np.save(self._column_path(field, segment), column)
+
+            index_path = os.path.join(self.directory, 'index.json')
+            with open(index_path + '.tmp', 'w') as f:
+                json.dump({'version': STORE_VERSION, 'next_segment': segment + 1, 'symbols': index}, f)
+            os.replace(index_path + '.tmp', index_path)  # Commit point for the new segment
+
+            self._updates.clear()
+            self._load()
+            for path in glob.glob(os.path.join(self.directory, '*.npy')):
+                try:
+                    if int(path.rsplit('.', 2)[1]) not in self._segments:
+                        os.remove(path)
+                except ValueError:
+                    continue
@@ -0,0 +1,167 @@
+# utils/indicator_state.py
+import os
+import logging
+import threading
+import numpy as np
+from utils.analysis import CrossoverDetector
+from utils.settings import INDICATOR_STATE_FILE
+
+# Per-symbol streaming crossover state kept between runs. At the end of a run every symbol's
+# SMA windows, recent SMA pairs and last bar timestamp are written to one compact .npz file; the
+# next run reloads it and only applies the bars that arrived since. State that disagrees with
+# the fetched bars is discarded and rebuilt from them.
+
+# ATR is deliberately not kept here. Wilder's ATR depends on where its seed window starts, and
+# the fetched window slides forward every day, so an ATR carried across runs drifts from the
+# one screen_block computes over the same bars (by around 1% of ATR, enough to move a symbol
+# across the 3% floor or between classes). SMAs only see their last `period` closes and match
+# exactly, so the streaming scan takes the crossover from here and computes ATR from the bars.
+
+STATE_VERSION = 2
+SHORT_PERIOD, LONG_PERIOD, CROSSOVER_DAYS = 20, 50, 5
+CLOSE_TOLERANCE = 1e-9  # Relative difference allowed between stored and fetched closes
+
+_lock = threading.RLock()
+_states = None  # symbol -> SymbolState
+_dirty = False
+_stats = {'incremental': 0, 'rebuilt': 0, 'built': 0, 'bars_applied': 0}
+
+
+class SymbolState:
+    """
+    Crossover detector for one symbol, plus the timestamp of the last bar applied.
+    """
+    __slots__ = ('crossover', 'last_ts')
+
+    def __init__(self):
+        self.crossover = CrossoverDetector(SHORT_PERIOD, LONG_PERIOD, CROSSOVER_DAYS)
+        self.last_ts = None
+
+    @classmethod
+    def from_bars(cls, bars):
+        state = cls()
+        state.extend(bars, 0)
+        return state
+
+    def extend(self, bars, start):
+        for i in range(start, len(bars)):
+            self.crossover.update(bars.close[i])
+        if len(bars):
+            self.last_ts = int(bars.begins_at[-1])
+        return len(bars) - start
+
+    def revise_last(self, bars, i):
+        self.crossover.replace_last(bars.close[i])
+
+    def matches(self, bars, i):
+        """
+        Consistency check: the closes the state has already committed (those before its last
+        bar, which may have been forming) must equal the fetched closes before bar i.
+        """
+        committed = self.crossover.long.committed_values()
+        overlap = min(len(committed), i)
+        if overlap == 0:
+            # Nothing to compare: only acceptable if the state has committed nothing either
+            return not committed
+        expected = np.asarray(bars.close[i - overlap:i], dtype=np.float64)
+        return bool(np.allclose(committed[-overlap:], expected, rtol=CLOSE_TOLERANCE, atol=0.0))
+
+
+def _meta():
+    return np.array([STATE_VERSION, SHORT_PERIOD, LONG_PERIOD, CROSSOVER_DAYS], dtype=np.int64)
+
+
+def _load():
+    global _states
+    if _states is not None:
+        return _states
+    _states = {}
+    try:
+        with np.load(INDICATOR_STATE_FILE) as stored:
+            if not np.array_equal(stored['meta'], _meta()):  # Also drops version 1 files, which held an ATR
+                logging.info("Indicator state was saved with different settings; rebuilding it")
+                return _states
+            for symbol, last_ts, floats, ints in zip(stored['symbols'], stored['last_ts'],
+                                                      stored['floats'], stored['ints']):
+                state = SymbolState()
+                state.crossover.import_state(floats.tolist(), ints.tolist())
+                state.last_ts = int(last_ts)
+                _states[str(symbol)] = state
+    except FileNotFoundError:
+        pass
+    except (OSError, ValueError, KeyError) as e:
+        logging.warning(f"Ignoring unreadable indicator state {INDICATOR_STATE_FILE}: {e}")
+        _states = {}
+    return _states
+
+
+def load():
+    """
+    Loads the saved state (called at startup; later calls are no-ops). Returns the symbol count.
+    """
+    with _lock:
+        return len(_load())
+
+
+def crossover(symbol, bars):
+    """
+    Brings a symbol's state up to date with its fetched bars and returns whether it shows a
+    bullish crossover.
+
+    Only bars from the state's last bar onwards are applied: that bar is revised in place (it
+    may have been forming when saved) and newer ones appended. If the state's last bar is not in
+    the fetched window, or its committed closes disagree with the fetched ones, it is rebuilt.
+
+    :return: True for a bullish crossover, as screener.screen_block would report it.
+    """
+    global _dirty
+    with _lock:
+        states = _load()
+        state = states.get(symbol)
+        start = None
+        if state is not None and state.last_ts is not None and len(bars):
+            i = int(np.searchsorted(bars.begins_at, state.last_ts))
+            if i < len(bars) and int(bars.begins_at[i]) == state.last_ts and state.matches(bars, i):
+                start = i
+        if start is not None:
+            state.revise_last(bars, start)
+            _stats['bars_applied'] += state.extend(bars, start + 1) + 1
+            _stats['incremental'] += 1
+        else:
+            _stats['rebuilt' if state is not None else 'built'] += 1
+            state = states[symbol] = SymbolState.from_bars(bars)
+            _stats['bars_applied'] += len(bars)
+        _dirty = True
+        return state.crossover.signal == "Bullish Crossover"
+
+
+def report():
+    with _lock:
+        return dict(_stats)
+
+
+def flush():
+    """
+    Writes every symbol's state to the .npz file atomically.
+    """
+    global _dirty
+    with _lock:
+        if not _dirty or not _states:
+            return
+        symbols, last_ts, floats, ints = [], [], [], []
+        for symbol, state in _states.items():
+            if state.last_ts is None:
+                continue
+            crossover_floats, crossover_ints = state.crossover.export_state()
+            symbols.append(symbol)
+            last_ts.append(state.last_ts)
+            floats.append(crossover_floats)
+            ints.append(crossover_ints)
+        directory = os.path.dirname(INDICATOR_STATE_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = INDICATOR_STATE_FILE + '.tmp.npz'
+        np.savez(tmp_path, meta=_meta(), symbols=np.array(symbols), last_ts=np.array(last_ts, dtype=np.int64),
+                 floats=np.array(floats, dtype=np.float64), ints=np.array(ints, dtype=np.int64))
+        os.replace(tmp_path, INDICATOR_STATE_FILE)
+        _dirty = False
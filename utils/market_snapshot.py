@@ -0,0 +1,126 @@
+# utils/market_snapshot.py
+import logging
+import threading
+from utils.api import fetch_historical_arrays, fetch_crypto_historical_arrays
+from utils.analysis import calculate_atr
+
+
+class MarketSnapshot:
+    """
+    Run-scoped memo of bars and derived indicators.
+
+    Every step of bot.main that needs a symbol's bars or ATR asks the active snapshot, so each
+    symbol is fetched at most once per run however many steps look at it.
+    """
+
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._bars = {}
+        self._atr = {}
+        self.stats = {'fetches': 0, 'bar_hits': 0, 'atr_hits': 0, 'seeded': 0}
+
+    @staticmethod
+    def _key(symbol, asset):
+        return asset, symbol.replace('-', '').upper() if asset == 'stock' else symbol
+
+    def bars(self, symbol, asset='stock'):
+        """
+        Returns the symbol's Bars, fetching them on first use in this run.
+        """
+        key = self._key(symbol, asset)
+        with self._lock:
+            if key in self._bars:
+                self.stats['bar_hits'] += 1
+                return self._bars[key]
+            self.stats['fetches'] += 1
+            if asset == 'crypto':
+                bars = fetch_crypto_historical_arrays(symbol)
+            else:
+                bars = fetch_historical_arrays(symbol)
+            self._bars[key] = bars
+            return bars
+
+    def atr(self, symbol, asset='stock', period=14):
+        """
+        Returns the symbol's latest ATR, or None if no bars could be fetched.
+        """
+        key = self._key(symbol, asset) + (period,)
+        with self._lock:
+            if key in self._atr:
+                self.stats['atr_hits'] += 1
+                return self._atr[key]
+            bars = self.bars(symbol, asset=asset)
+            atr = calculate_atr(bars, period) if bars is not None else None
+            self._atr[key] = atr
+            return atr
+
+    def has(self, symbol, asset='stock'):
+        with self._lock:
+            return self._key(symbol, asset) in self._bars
+
+    def seed(self, bars_by_symbol, asset='stock'):
+        """
+        Adds bars fetched elsewhere (e.g. by the universe scan) so later steps reuse them.
+        """
+        with self._lock:
+            for symbol, bars in bars_by_symbol.items():
+                key = self._key(symbol, asset)
+                if bars is not None and key not in self._bars:
+                    self._bars[key] = bars
+                    self.stats['seeded'] += 1
+
+    def report(self):
+        with self._lock:
+            return dict(self.stats, saved=self.stats['bar_hits'] + self.stats['atr_hits'])
+
+
+_current = None
+
+
+def start_run():
+    """
+    Starts a fresh snapshot for a bot run and makes it the active one.
+    """
+    global _current
+    _current = MarketSnapshot()
+    return _current
+
+
+def end_run():
+    """
+    Logs the active snapshot's counters and deactivates it.
+    """
+    global _current
+    snapshot, _current = _current, None
+    if snapshot is not None:
+        stats = snapshot.report()
+        print(f"Market snapshot: {stats['fetches']} symbols fetched, {stats['seeded']} seeded from the scan, "
+              f"{stats['saved']} repeat lookups served from memory.")
+        logging.info(f"Market snapshot stats: {stats}")
+    return snapshot
+
+
+def current():
+    """
+    Returns the active snapshot, or None outside a bot run.
+    """
+    return _current
+
+
+def get_bars(symbol, asset='stock'):
+    """
+    Bars for a symbol through the active snapshot, or fetched directly when no run is active.
+    """
+    if _current is not None:
+        return _current.bars(symbol, asset=asset)
+    return fetch_crypto_historical_arrays(symbol) if asset == 'crypto' else fetch_historical_arrays(symbol)
+
+
+def get_atr(symbol, asset='stock', period=14):
+    """
+    Latest ATR for a symbol through the active snapshot, or computed directly when no run is active.
+    """
+    if _current is not None:
+        return _current.atr(symbol, asset=asset, period=period)
+    bars = get_bars(symbol, asset=asset)
+    return calculate_atr(bars, period) if bars is not None else None
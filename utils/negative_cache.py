@@ -0,0 +1,148 @@
+# utils/negative_cache.py
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from utils.settings import NEGATIVE_CACHE_FILE, NEGATIVE_CACHE_TTL_HOURS, NEGATIVE_CACHE_ERROR_STRIKES
+
+# Persisted list of symbols the scan should not request for a while: tickers the broker does not
+# know, listings too young to have a 50-day history, and symbols whose requests keep failing.
+# Each entry carries a reason code and an expiry, after which the symbol is tried again.
+
+NOT_FOUND = 'not_found'
+SHORT_HISTORY = 'short_history'
+API_ERROR = 'api_error'
+
+HOUR_SECONDS = 3600
+DAY_SECONDS = 24 * HOUR_SECONDS
+
+_lock = threading.RLock()
+_entries = None  # symbol -> {'reason', 'expires_at', 'strikes', 'recorded_at'}
+_dirty = False
+_last_report = None
+
+
+def _load():
+    global _entries
+    if _entries is None:
+        try:
+            with open(NEGATIVE_CACHE_FILE, 'r') as f:
+                _entries = json.load(f)
+        except FileNotFoundError:
+            _entries = {}
+        except (json.JSONDecodeError, OSError) as e:
+            logging.warning(f"Ignoring unreadable negative cache {NEGATIVE_CACHE_FILE}: {e}")
+            _entries = {}
+    return _entries
+
+
+def _put(symbol, reason, expires_at, strikes=0):
+    global _dirty
+    _load()[symbol] = {'reason': reason, 'expires_at': expires_at, 'strikes': strikes, 'recorded_at': time.time()}
+    _dirty = True
+
+
+def active_reason(symbol, now=None):
+    """
+    Returns the reason code a symbol is being skipped for, or None if it should be requested.
+    """
+    now = now or time.time()
+    with _lock:
+        entry = _load().get(symbol)
+    if entry and entry['expires_at'] and entry['expires_at'] > now:
+        return entry['reason']
+    return None
+
+
+def partition(stock_symbols, now=None):
+    """
+    Splits the universe into symbols to scan and symbols currently being skipped.
+
+    :return: Tuple of (symbols to scan, {skipped symbol: reason}). The split is kept for report().
+    """
+    global _last_report
+    now = now or time.time()
+    to_scan, skipped = [], {}
+    for stock in stock_symbols:
+        reason = active_reason(stock, now)
+        if reason is None:
+            to_scan.append(stock)
+        else:
+            skipped[stock] = reason
+    by_reason = {}
+    for reason in skipped.values():
+        by_reason[reason] = by_reason.get(reason, 0) + 1
+    _last_report = {'universe': len(stock_symbols), 'skipped': len(skipped), 'by_reason': by_reason,
+                    'skip_ratio': len(skipped) / len(stock_symbols) if stock_symbols else 0.0}
+    return to_scan, skipped
+
+
+def record_not_found(symbol):
+    with _lock:
+        _put(symbol, NOT_FOUND, time.time() + NEGATIVE_CACHE_TTL_HOURS[NOT_FOUND] * HOUR_SECONDS)
+
+
+def record_short_history(symbol, bar_count, min_history):
+    """
+    Skips a young listing until it can have gained enough daily bars to be analyzed (at least a day).
+    """
+    days_needed = max(1, min_history - bar_count)
+    with _lock:
+        _put(symbol, SHORT_HISTORY, time.time() + days_needed * DAY_SECONDS)
+
+
+def record_api_error(symbol):
+    """
+    Counts a failed request. The symbol is only skipped once it has failed
+    NEGATIVE_CACHE_ERROR_STRIKES runs in a row, so a one-off outage blacklists nothing.
+    """
+    with _lock:
+        entry = _load().get(symbol)
+        strikes = (entry['strikes'] if entry and entry['reason'] == API_ERROR else 0) + 1
+        expires_at = None
+        if strikes >= NEGATIVE_CACHE_ERROR_STRIKES:
+            expires_at = time.time() + NEGATIVE_CACHE_TTL_HOURS[API_ERROR] * HOUR_SECONDS
+        _put(symbol, API_ERROR, expires_at, strikes)
+
+
+def record_success(symbol):
+    """
+    Clears any entry for a symbol that returned usable data.
+    """
+    global _dirty
+    with _lock:
+        if _load().pop(symbol, None) is not None:
+            _dirty = True
+
+
+def report():
+    """
+    Returns how much of the universe the last partition() skipped, broken down by reason.
+    """
+    return dict(_last_report) if _last_report else {'universe': 0, 'skipped': 0, 'by_reason': {}, 'skip_ratio': 0.0}
+
+
+def flush():
+    """
+    Writes the cache to disk atomically, dropping entries that have expired.
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        now = time.time()
+        entries = {symbol: entry for symbol, entry in _load().items()
+                   if entry['expires_at'] is None or entry['expires_at'] > now}
+        directory = os.path.dirname(NEGATIVE_CACHE_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = NEGATIVE_CACHE_FILE + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, NEGATIVE_CACHE_FILE)
+        _dirty = False
+
+
+atexit.register(flush)
@@ -0,0 +1,223 @@
+# utils/order_sync.py
+import json
+import os
+import sqlite3
+import logging
+import threading
+import contextlib
+import robin_stocks.robinhood as r
+from robin_stocks.robinhood.helper import request_get
+from robin_stocks.robinhood.urls import orders_url
+from utils import request_layer
+from utils.settings import TRADE_STORE_FILE
+
+# Local mirror of the account's stock orders. Each sync asks the broker only for orders
+# updated since the last cursor, and instrument URLs are resolved to symbols once, ever.
+# The instrument table also remembers each stock's fractional tradability for the symbol registry.
+# Broker calls go through request_layer, and pages are followed here rather than by
+# request_get's 'pagination' mode, which returns a partial list when a later page fails.
+
+_lock = threading.RLock()
+_connection = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS orders (
+    id TEXT PRIMARY KEY,
+    instrument_url TEXT,
+    symbol TEXT,
+    side TEXT,
+    state TEXT,
+    created_at TEXT,
+    updated_at TEXT,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS orders_by_symbol ON orders (symbol, created_at);
+CREATE TABLE IF NOT EXISTS instruments (
+    url TEXT PRIMARY KEY,
+    symbol TEXT NOT NULL,
+    fractional_tradability TEXT
+);
+CREATE INDEX IF NOT EXISTS instruments_by_symbol ON instruments (symbol);
+CREATE TABLE IF NOT EXISTS sync_state (
+    name TEXT PRIMARY KEY,
+    value TEXT
+);
+"""
+
+CURSOR_NAME = 'stock_orders_updated_at'
+
+
+def _connect():
+    global _connection
+    with _lock:
+        if _connection is None:
+            directory = os.path.dirname(TRADE_STORE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(TRADE_STORE_FILE, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            columns = {row[1] for row in connection.execute("PRAGMA table_info(instruments)")}
+            if columns and 'fractional_tradability' not in columns:  # Tables created before the column existed
+                connection.execute("ALTER TABLE instruments ADD COLUMN fractional_tradability TEXT")
+            connection.executescript(SCHEMA)
+            _connection = connection
+        return _connection
+
+
+def resolve_instrument(instrument_url):
+    """
+    Returns the symbol for an instrument URL. Instrument URLs never change symbol, so each one
+    is requested from the broker at most once and then served from the local table.
+    """
+    with _lock:
+        connection = _connect()
+        row = connection.execute("SELECT symbol FROM instruments WHERE url = ?", (instrument_url,)).fetchone()
+        if row:
+            return row[0]
+    with contextlib.redirect_stdout(None):
+        instrument_data = request_layer.call('orders', r.stocks.get_instrument_by_url, instrument_url)
+    symbol = instrument_data.get('symbol') if instrument_data else None
+    if symbol:
+        _store_instrument(connection, instrument_url, symbol, instrument_data.get('fractional_tradability'))
+    return symbol
+
+
+def _store_instrument(connection, instrument_url, symbol, fractional_tradability):
+    with _lock:
+        with connection:
+            connection.execute(
+                "INSERT OR REPLACE INTO instruments (url, symbol, fractional_tradability) VALUES (?, ?, ?)",
+                (instrument_url, symbol, fractional_tradability)
+            )
+
+
+def fractional_flags():
+    """
+    Returns {symbol: bool} for every cached instrument whose fractional tradability is known.
+    """
+    with _lock:
+        rows = _connect().execute(
+            "SELECT symbol, fractional_tradability FROM instruments WHERE fractional_tradability IS NOT NULL"
+        ).fetchall()
+    return {symbol: tradability == 'tradable' for symbol, tradability in rows}
+
+
+def instrument_fractional(symbol):
+    """
+    Whether the broker accepts fractional (dollar-amount) orders for a stock. Served from the
+    instrument table; a symbol not in it yet is requested from the broker once and stored.
+
+    :return: True or False, or None if the instrument could not be fetched.
+    """
+    with _lock:
+        connection = _connect()
+        row = connection.execute(
+            "SELECT fractional_tradability FROM instruments WHERE symbol = ? AND fractional_tradability IS NOT NULL",
+            (symbol,)
+        ).fetchone()
+    if row:
+        return row[0] == 'tradable'
+    with contextlib.redirect_stdout(None):
+        instruments = request_layer.call('orders', r.stocks.get_instruments_by_symbols, symbol)
+    instrument_data = next((instrument for instrument in instruments or [] if instrument), None)
+    if not instrument_data or not instrument_data.get('fractional_tradability'):
+        return None
+    _store_instrument(connection, instrument_data['url'], instrument_data.get('symbol', symbol),
+                      instrument_data['fractional_tradability'])
+    return instrument_data['fractional_tradability'] == 'tradable'
+
+
+def _fetch_pages(payload):
+    """
+    Fetches every page of the orders listing.
+
+    :return: List of orders, or None if any page failed.
+    """
+    orders = []
+    url, params = orders_url(), payload
+    while url:
+        with contextlib.redirect_stdout(None):  # Suppress request_get's error chatter
+            page = request_layer.call('orders', request_get, url, 'regular', params)
+        if not page or 'results' not in page:
+            return None
+        orders.extend(page['results'])
+        url, params = page.get('next'), None  # The next URL already carries the query
+    return orders
+
+
+def _resolve_missing(connection):
+    """
+    Retries the symbol of stored orders whose instrument lookup failed during an earlier sync.
+    """
+    with _lock:
+        rows = connection.execute(
+            "SELECT DISTINCT instrument_url FROM orders WHERE symbol IS NULL AND instrument_url IS NOT NULL"
+        ).fetchall()
+    for (instrument_url,) in rows:
+        symbol = resolve_instrument(instrument_url)
+        if symbol:
+            with _lock:
+                with connection:
+                    connection.execute("UPDATE orders SET symbol = ? WHERE instrument_url = ? AND symbol IS NULL",
+                                       (symbol, instrument_url))
+
+
+def sync_orders():
+    """
+    Pulls stock orders changed since the last sync into the local order table.
+
+    The cursor only moves once every page has been fetched, so a failed page is requested again
+    by the next sync. Orders whose instrument could not be resolved are stored without a symbol
+    and resolved again on later syncs.
+
+    :return: Number of orders received from the broker, or None if the request failed.
+    """
+    with _lock:
+        connection = _connect()
+        row = connection.execute("SELECT value FROM sync_state WHERE name = ?", (CURSOR_NAME,)).fetchone()
+    cursor = row[0] if row else None
+    _resolve_missing(connection)
+
+    # The cursor is inclusive, so the newest known order comes back again; upserts make that harmless
+    orders = _fetch_pages({'updated_at[gte]': cursor} if cursor else None)
+    if orders is None:
+        logging.error("Failed to sync stock orders; using the local order table as-is")
+        return None
+
+    rows = []
+    newest = cursor
+    for order in orders:
+        instrument_url = order.get('instrument')
+        symbol = resolve_instrument(instrument_url) if instrument_url else None
+        rows.append((order['id'], instrument_url, symbol, order.get('side'), order.get('state'),
+                     order.get('created_at'), order.get('updated_at'), json.dumps(order)))
+        if order.get('updated_at') and (newest is None or order['updated_at'] > newest):
+            newest = order['updated_at']
+
+    with _lock:
+        with connection:
+            connection.executemany(
+                "INSERT OR REPLACE INTO orders (id, instrument_url, symbol, side, state, created_at, updated_at, record) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            if newest:
+                connection.execute("INSERT OR REPLACE INTO sync_state (name, value) VALUES (?, ?)",
+                                   (CURSOR_NAME, newest))
+    return len(rows)
+
+
+def earliest_order_dates(symbols):
+    """
+    Returns {symbol: created_at} of the earliest stock order on record for each symbol that has one.
+    """
+    symbols = list(symbols)
+    if not symbols:
+        return {}
+    placeholders = ','.join('?' for _ in symbols)
+    with _lock:
+        rows = _connect().execute(
+            f"SELECT symbol, MIN(created_at) FROM orders WHERE symbol IN ({placeholders}) GROUP BY symbol",
+            symbols
+        ).fetchall()
+    return dict(rows)
@@ -0,0 +1,199 @@
+# utils/pipeline.py
+import time
+import heapq
+import logging
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+import numpy as np
+from utils.screener import MIN_HISTORY, screen_block, atr_block, filter_block, size_block, candidate_record
+
+# Streaming scan stages: fetch -> indicators -> filter -> size, each a generator over batches,
+# feeding a bounded top-K heap. Bars are dropped as soon as their batch has been evaluated, so
+# memory is bounded by the in-flight chunks and K, not by the size of the universe.
+
+
+class Batch:
+    """
+    Symbols moving through the pipeline together, with one NumPy column per computed value.
+    `positions` are indices into the scan order, used to break ATR% ties deterministically.
+    """
+    __slots__ = ('positions', 'stocks', 'columns')
+
+    def __init__(self, positions, stocks, columns):
+        self.positions = positions
+        self.stocks = stocks
+        self.columns = columns
+
+    def __len__(self):
+        return len(self.stocks)
+
+    def select(self, mask):
+        rows = np.flatnonzero(mask)
+        return Batch([self.positions[row] for row in rows], [self.stocks[row] for row in rows],
+                     {name: column[rows] for name, column in self.columns.items()})
+
+
+class TopK:
+    """
+    Keeps the K best candidates seen so far by ATR Percent (ties go to the earlier symbol).
+    """
+
+    def __init__(self, k):
+        self.k = k
+        self._heap = []  # Min-heap of (atr_percent, -position, record); the root is the weakest kept
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, position, record):
+        item = (record['ATR Percent'], -position, record)
+        if len(self._heap) < self.k:
+            heapq.heappush(self._heap, item)
+        elif item[:2] > self._heap[0][:2]:
+            heapq.heapreplace(self._heap, item)
+
+    def ranked(self):
+        """
+        Returns copies of the kept records, best first.
+        """
+        return [dict(record) for _, _, record in sorted(self._heap, key=lambda item: item[:2], reverse=True)]
+
+
+def fetch_stage(stock_symbols, fetch_chunk, max_workers, chunk_size, deadline=None, stats=None):
+    """
+    Fetches chunks on a thread pool with at most 2 * max_workers chunks in flight, yielding
+    (chunk, start position, bars_by_symbol) in completion order.
+
+    :param deadline: Optional time.monotonic() value after which chunks still outstanding are
+                     abandoned, so the slowest symbols cannot hold back the ranking. Queued
+                     chunks are cancelled; chunks already being fetched are waited for (and
+                     discarded), so no fetch thread is still writing to the caches when the
+                     scan flushes them.
+    """
+    chunks = [(start, stock_symbols[start:start + chunk_size]) for start in range(0, len(stock_symbols), chunk_size)]
+    pending = iter(chunks)
+    in_flight = {}
+    executor = ThreadPoolExecutor(max_workers=max(1, max_workers))
+    try:
+        def submit_next():
+            for start, chunk in pending:
+                in_flight[executor.submit(fetch_chunk, chunk)] = (start, chunk)
+                return
+
+        for _ in range(2 * max(1, max_workers)):
+            submit_next()
+        while in_flight:
+            timeout = None if deadline is None else max(0.0, deadline - time.monotonic())
+            done, _ = wait(in_flight, timeout=timeout, return_when=FIRST_COMPLETED)
+            if not done:
+                late = sum(len(chunk) for _, chunk in in_flight.values()) + sum(len(chunk) for _, chunk in pending)
+                logging.warning(f"Scan deadline reached; {late} symbols left unevaluated")
+                if stats is not None:
+                    stats['late'] = late
+                return
+            for future in done:
+                start, chunk = in_flight.pop(future)
+                try:
+                    fetched = future.result()
+                except Exception as e:
+                    logging.error(f"Error fetching historicals for chunk starting at {chunk[0]}: {e}")
+                    fetched = {}
+                submit_next()
+                yield chunk, start, fetched
+    finally:
+        executor.shutdown(wait=True, cancel_futures=True)
+
+
+def indicator_stage(fetched_chunks, stats, crossover=None):
+    """
+    Computes crossover, ATR, ATR% and price for each fetched chunk, one matrix per history length.
+
+    :param crossover: Optional callable(symbol, bars) returning the bullish crossover flag from
+                      incremental per-symbol state instead of the batch kernel. ATR is always
+                      computed from the fetched bars.
+    """
+    for chunk, start, bars_by_symbol in fetched_chunks:
+        by_length = {}
+        for offset, stock in enumerate(chunk):
+            bars = bars_by_symbol.get(stock)
+            if bars is None or len(bars) < MIN_HISTORY:
+                stats['short_history'] += 1
+                continue
+            by_length.setdefault(len(bars), []).append((start + offset, stock, bars))
+        for members in by_length.values():
+            closes = np.stack([bars.close for _, _, bars in members])
+            highs = np.stack([bars.high for _, _, bars in members])
+            lows = np.stack([bars.low for _, _, bars in members])
+            if crossover is None:
+                bullish, atr, atr_percent, share_price = screen_block(closes, highs, lows)
+            else:
+                bullish = np.array([crossover(stock, bars) for _, stock, bars in members], dtype=bool)
+                atr, atr_percent, share_price = atr_block(closes, highs, lows)
+            stats['screened'] += len(members)
+            yield Batch([position for position, _, _ in members], [stock for _, stock, _ in members],
+                        {'bullish': bullish, 'atr': atr, 'atr_percent': atr_percent, 'share_price': share_price})
+
+
+def filter_stage(batches, atr_thresholds, stats):
+    """
+    Keeps symbols with a bullish crossover and an ATR% class within atr_thresholds.
+    """
+    for batch in batches:
+        above_floor, passes = filter_block(batch.columns['bullish'], batch.columns['atr_percent'], atr_thresholds)
+        stats['below_atr_floor'] += int(np.count_nonzero(~above_floor))
+        stats['bullish_crossovers'] += int(np.count_nonzero(batch.columns['bullish']))
+        if passes.any():
+            yield batch.select(passes)
+
+
+def size_stage(batches, portfolio_size, current_risk):
+    """
+    Sizes each remaining symbol and yields (position, record) for those within the risk limits.
+    """
+    for batch in batches:
+        columns = batch.columns
+        two_atr, purchase_amount, potential_loss, within_risk = size_block(columns['atr_percent'], portfolio_size,
+                                                                           current_risk)
+        for row in np.flatnonzero(within_risk):
+            yield batch.positions[row], candidate_record(
+                batch.stocks[row], columns['atr'][row], columns['atr_percent'][row], two_atr[row],
+                columns['share_price'][row], purchase_amount[row], potential_loss[row], portfolio_size
+            )
+
+
+def run_pipeline(stock_symbols, fetch_chunk, portfolio_size, current_risk, atr_thresholds, top_k, max_workers,
+                 chunk_size, preliminary_fraction=None, on_preliminary=None, deadline_seconds=None, on_chunk=None,
+                 crossover=None):
+    """
+    Streams the universe through fetch -> indicators -> filter -> size into a TopK heap.
+
+    :param preliminary_fraction: If set, on_preliminary(ranked, evaluated, total) is called once
+                                 that fraction of the universe has been evaluated.
+    :param deadline_seconds: Optional wall-clock budget after which the scan stops waiting.
+    :param on_chunk: Optional callback(chunk) invoked as each fetched chunk enters the pipeline.
+    :param crossover: Optional per-symbol crossover callable for indicator_stage.
+    :return: Tuple of (top-K results best first, stats).
+    """
+    stats = {'screened': 0, 'short_history': 0, 'below_atr_floor': 0, 'bullish_crossovers': 0,
+             'eligible': 0, 'late': 0, 'preliminary_at': None}
+    deadline = time.monotonic() + deadline_seconds if deadline_seconds else None
+    top = TopK(top_k)
+    evaluated = [0]
+
+    def counted(fetched_chunks):
+        for chunk, start, fetched in fetched_chunks:
+            yield chunk, start, fetched
+            evaluated[0] += len(chunk)  # Runs once the whole chunk has passed through every stage
+            if on_chunk:
+                on_chunk(chunk)
+            if (on_preliminary and stats['preliminary_at'] is None and preliminary_fraction is not None
+                    and evaluated[0] >= preliminary_fraction * len(stock_symbols)):
+                stats['preliminary_at'] = evaluated[0]
+                on_preliminary(top.ranked(), evaluated[0], len(stock_symbols))
+
+    fetched = counted(fetch_stage(stock_symbols, fetch_chunk, max_workers, chunk_size, deadline, stats))
+    candidates = size_stage(filter_stage(indicator_stage(fetched, stats, crossover), atr_thresholds, stats),
+                            portfolio_size, current_risk)
+    for position, record in candidates:
+        stats['eligible'] += 1
+        top.push(position, record)
+    return top.ranked(), stats
@@ -0,0 +1,43 @@
+# utils/positions.py
+import time
+import threading
+from utils import api
+from utils.settings import POSITIONS_TTL_SECONDS
+
+# Short-lived cache over utils.api.get_positions. Each refresh runs build_holdings (several
+# requests) plus the crypto lookups, so repeated checks within one run share a single fetch.
+
+_lock = threading.RLock()
+_cache = {'positions': None, 'fetched_at': 0.0}
+
+
+def get_positions(max_age=POSITIONS_TTL_SECONDS):
+    """
+    Returns current positions, refreshing from the broker only if the cached copy is older
+    than max_age seconds or has been invalidated. Pass max_age=0 to force a refresh.
+    """
+    with _lock:
+        age = time.monotonic() - _cache['fetched_at']
+        if _cache['positions'] is None or age >= max_age:
+            _cache['positions'] = api.get_positions()
+            _cache['fetched_at'] = time.monotonic()
+        return _cache['positions']
+
+
+def invalidate():
+    """
+    Drops the cached positions so the next read goes to the broker. Called once one of our
+    own sell orders is placed; buys are applied in place with record_fill instead.
+    """
+    with _lock:
+        _cache['positions'] = None
+
+
+def record_fill(symbol, position):
+    """
+    Applies one of our own filled buy orders to the cached positions without a refetch, so
+    later checks in the same run see the new position. Without a cached copy this does nothing.
+    """
+    with _lock:
+        if _cache['positions'] is not None:
+            _cache['positions'][symbol] = position
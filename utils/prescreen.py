@@ -0,0 +1,161 @@
+# utils/prescreen.py
+import os
+import json
+import time
+import atexit
+import logging
+import threading
+from utils import bar_cache
+from utils.analysis import calculate_atr
+from utils.settings import (PRESCREEN_FILE, PRESCREEN_ATR_MARGIN, PRESCREEN_MAX_AGE_HOURS,
+                            PRESCREEN_FULL_REFRESH_HOURS)
+
+# Pre-screen run before the scan fetches anything. Most of the universe sits well below the
+# ATR% floor and stays there from one 15-minute run to the next, so a symbol whose recent ATR%
+# (recorded by the previous scan, or computed from cached bars) is below the floor by more than
+# a safety margin is not fetched this run. Every PRESCREEN_FULL_REFRESH_HOURS the whole
+# universe is scanned regardless, which also refreshes the recorded values.
+
+HOUR_SECONDS = 3600
+
+_lock = threading.RLock()
+_state = None  # {'last_full_refresh': ts, 'atr_percent': {symbol: [atr_percent, recorded_at]}}
+_dirty = False
+_last_report = None
+
+
+def _load():
+    global _state
+    if _state is None:
+        try:
+            with open(PRESCREEN_FILE, 'r') as f:
+                _state = json.load(f)
+        except FileNotFoundError:
+            _state = {}
+        except (json.JSONDecodeError, OSError) as e:
+            logging.warning(f"Ignoring unreadable pre-screen state {PRESCREEN_FILE}: {e}")
+            _state = {}
+        _state.setdefault('last_full_refresh', 0.0)
+        _state.setdefault('atr_percent', {})
+    return _state
+
+
+def atr_percent_of(bars, period=14):
+    """
+    ATR as a percentage of the last close, or None if the bars are too short to tell.
+    """
+    if bars is None or len(bars) <= period or bars.close[-1] <= 0:
+        return None
+    return calculate_atr(bars, period) / float(bars.close[-1]) * 100
+
+
+def record(bars_by_symbol):
+    """
+    Remembers the ATR% of freshly fetched bars so the next run's pre-screen can use it.
+    """
+    global _dirty
+    now = time.time()
+    with _lock:
+        recorded = _load()['atr_percent']
+        for stock, bars in bars_by_symbol.items():
+            atr_percent = atr_percent_of(bars)
+            if atr_percent is not None:
+                recorded[stock] = [atr_percent, now]
+                _dirty = True
+
+
+def estimate_atr_percent(symbol, now=None):
+    """
+    Best recent ATR% for a symbol without any request: the value recorded by the previous scan,
+    else one computed from cached bars. None if neither is younger than PRESCREEN_MAX_AGE_HOURS.
+    """
+    now = now or time.time()
+    max_age = PRESCREEN_MAX_AGE_HOURS * HOUR_SECONDS
+    with _lock:
+        entry = _load()['atr_percent'].get(symbol)
+    if entry and now - entry[1] < max_age:
+        return entry[0]
+    bars = bar_cache.get_arrays(symbol.replace('-', '').upper())
+    if bars is not None and len(bars) and now - bars.begins_at[-1] < max_age:
+        return atr_percent_of(bars)
+    return None
+
+
+def plan(stock_symbols, atr_floor, now=None):
+    """
+    Splits the universe into symbols to fetch and symbols that cannot reach `atr_floor`.
+
+    A symbol is pruned only if its estimated ATR% is below atr_floor * PRESCREEN_ATR_MARGIN;
+    symbols with no recent estimate are always fetched. The split is kept for report().
+
+    :return: Tuple of (symbols to scan, {pruned symbol: estimated ATR%}).
+    """
+    global _last_report, _dirty
+    now = now or time.time()
+    start = time.perf_counter()
+    with _lock:
+        state = _load()
+        full_refresh = now - state['last_full_refresh'] >= PRESCREEN_FULL_REFRESH_HOURS * HOUR_SECONDS
+        if full_refresh:
+            state['last_full_refresh'] = now
+            _dirty = True
+
+    to_scan, pruned = [], {}
+    cutoff = atr_floor * PRESCREEN_ATR_MARGIN
+    for stock in stock_symbols:
+        estimate = None if full_refresh else estimate_atr_percent(stock, now)
+        if estimate is not None and estimate < cutoff:
+            pruned[stock] = estimate
+        else:
+            to_scan.append(stock)
+
+    _last_report = {'universe': len(stock_symbols), 'pruned': len(pruned), 'full_refresh': full_refresh,
+                    'prune_ratio': len(pruned) / len(stock_symbols) if stock_symbols else 0.0,
+                    'prescreen_seconds': time.perf_counter() - start, 'seconds_saved': 0.0}
+    return to_scan, pruned
+
+
+def finish(scan_seconds, scanned):
+    """
+    Estimates the wall-clock time the pruning saved from this run's measured time per scanned symbol.
+    """
+    if _last_report is None or not scanned:
+        return
+    _last_report['seconds_saved'] = max(
+        0.0, scan_seconds / scanned * _last_report['pruned'] - _last_report['prescreen_seconds']
+    )
+
+
+def report():
+    """
+    Returns the last plan's prune counts and ratio, whether it was a full refresh, and the
+    estimated seconds saved.
+    """
+    if _last_report is None:
+        return {'universe': 0, 'pruned': 0, 'full_refresh': False, 'prune_ratio': 0.0,
+                'prescreen_seconds': 0.0, 'seconds_saved': 0.0}
+    return dict(_last_report)
+
+
+def flush():
+    """
+    Writes the pre-screen state to disk atomically, dropping recorded values too old to be used.
+    """
+    global _dirty
+    with _lock:
+        if not _dirty:
+            return
+        state = _load()
+        oldest = time.time() - PRESCREEN_MAX_AGE_HOURS * HOUR_SECONDS
+        state['atr_percent'] = {symbol: entry for symbol, entry in state['atr_percent'].items() if entry[1] >= oldest}
+        directory = os.path.dirname(PRESCREEN_FILE)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = PRESCREEN_FILE + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(state, f, separators=(',', ':'))
+        os.replace(tmp_path, PRESCREEN_FILE)
+        _dirty = False
+
+
+atexit.register(flush)
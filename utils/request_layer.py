@@ -0,0 +1,158 @@
+# utils/request_layer.py
+import time
+import random
+import logging
+import threading
+import requests
+from robin_stocks.robinhood import helper
+from utils.settings import (REQUESTS_PER_SECOND, REQUEST_BURST, REQUEST_MAX_RETRIES, REQUEST_BACKOFF_BASE_SECONDS,
+                            REQUEST_BACKOFF_MAX_SECONDS, ENDPOINT_CONCURRENCY)
+
+# Every broker call in utils/api.py goes through call(): a shared token bucket paces the request
+# rate, each endpoint has its own concurrency cap, and throttled or transient failures are retried
+# with jittered exponential backoff. robin_stocks swallows HTTP errors and returns None, so the
+# status of the last response on each thread is captured with a session hook to tell a throttle
+# (worth retrying) from a genuine miss such as an unknown symbol (not worth retrying).
+
+TRANSIENT_STATUSES = {429, 500, 502, 503, 504}
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket: `rate` tokens per second, holding at most `capacity`.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        Takes one token, sleeping until one is available. Returns the seconds spent waiting.
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return waited
+                delay = (1 - self._tokens) / self.rate
+            time.sleep(delay)
+            waited += delay
+
+
+_bucket = TokenBucket(REQUESTS_PER_SECOND, REQUEST_BURST)
+_limits = {endpoint: threading.BoundedSemaphore(limit) for endpoint, limit in ENDPOINT_CONCURRENCY.items()}
+_limits_lock = threading.Lock()
+_last_response = threading.local()
+_counters = {}
+_counters_lock = threading.Lock()
+
+
+def _record_response(response, *args, **kwargs):
+    _last_response.status = response.status_code
+    _last_response.retry_after = response.headers.get('Retry-After')
+
+
+helper.SESSION.hooks.setdefault('response', []).append(_record_response)
+
+
+def _limit(endpoint):
+    with _limits_lock:
+        if endpoint not in _limits:
+            _limits[endpoint] = threading.BoundedSemaphore(ENDPOINT_CONCURRENCY.get('default', 4))
+        return _limits[endpoint]
+
+
+def _count(endpoint, **increments):
+    with _counters_lock:
+        counters = _counters.setdefault(endpoint, {'calls': 0, 'attempts': 0, 'retries': 0, 'throttled': 0,
+                                                   'failures': 0, 'rate_wait': 0.0, 'backoff_wait': 0.0})
+        for name, value in increments.items():
+            counters[name] += value
+
+
+def _backoff(attempt, retry_after=None):
+    """
+    Full-jitter exponential backoff, never shorter than a server-supplied Retry-After.
+    """
+    delay = random.uniform(0, min(REQUEST_BACKOFF_MAX_SECONDS, REQUEST_BACKOFF_BASE_SECONDS * 2 ** attempt))
+    try:
+        delay = max(delay, float(retry_after)) if retry_after else delay
+    except ValueError:
+        pass
+    return min(delay, REQUEST_BACKOFF_MAX_SECONDS)
+
+
+def call(endpoint, fn, *args, idempotent=True, **kwargs):
+    """
+    Makes one broker call through the rate limiter, endpoint cap and retry policy.
+
+    :param endpoint: Name of the endpoint group the call counts against (e.g. 'historicals').
+    :param fn: The robin_stocks function (or any callable making broker requests).
+    :param idempotent: Whether a call that may have reached the broker is safe to repeat. Orders
+                       pass False, so they are only retried when the broker throttled them outright.
+    :return: Whatever `fn` returns; None or [None] if every attempt failed.
+    :raises: Exceptions raised by `fn` that are not connection errors, unchanged, and the last
+             connection error once retries are exhausted.
+    """
+    _count(endpoint, calls=1)
+    result = None
+    for attempt in range(REQUEST_MAX_RETRIES + 1):
+        _count(endpoint, attempts=1, rate_wait=_bucket.acquire())
+        _last_response.status = _last_response.retry_after = None
+        with _limit(endpoint):
+            try:
+                result = fn(*args, **kwargs)
+                error = None
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                result, error = None, e
+        status = _last_response.status
+
+        if error is None and (result is not None and result != [None] or status not in TRANSIENT_STATUSES):
+            return result
+        if status == 429:
+            _count(endpoint, throttled=1)
+        # A failed order that was not throttled may still have reached the broker; never resend it
+        retryable = status == 429 or idempotent
+        if not retryable or attempt == REQUEST_MAX_RETRIES:
+            break
+
+        delay = _backoff(attempt, _last_response.retry_after)
+        logging.warning(f"{endpoint} request failed (status {status}, {error or 'empty response'}); "
+                        f"retrying in {delay:.1f}s")
+        _count(endpoint, retries=1, backoff_wait=delay)
+        time.sleep(delay)
+
+    _count(endpoint, failures=1)
+    logging.error(f"{endpoint} request gave up after {attempt + 1} attempt(s) (last status {status})")
+    if error is not None:
+        raise error
+    return result
+
+
+def last_status():
+    """
+    HTTP status of the most recent broker response on the calling thread, or None.
+    """
+    return getattr(_last_response, 'status', None)
+
+
+def report():
+    """
+    Returns a copy of the per-endpoint counters: calls, attempts, retries, throttled, failures,
+    and seconds spent waiting on the rate limiter and on backoff.
+    """
+    with _counters_lock:
+        return {endpoint: dict(counters) for endpoint, counters in _counters.items()}
+
+
+def reset():
+    with _counters_lock:
+        _counters.clear()
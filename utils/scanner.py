@@ -0,0 +1,283 @@
+# utils/scanner.py
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from utils.api import fetch_historical_data_batch
+from utils import bar_cache, signal_memo, market_snapshot, negative_cache, prescreen, indicator_state
+from utils.symbols import lookup, is_crypto
+from utils.bar_store import Bars
+from utils.trading import analyze_stock, stock_signal
+from utils.screener import screen_universe, signal_universe, MIN_HISTORY
+from utils.pipeline import run_pipeline
+from utils.settings import (SIMULATED, ATR_THRESHOLDS, SCAN_WORKERS, HISTORICALS_CHUNK_SIZE, PRESCREEN_ENABLED,
+                            SCAN_TOP_K, SCAN_PRELIMINARY_FRACTION, SCAN_DEADLINE_SECONDS, INDICATOR_STATE_ENABLED)
+
+
+def _analyze_symbol(stock, portfolio_size, current_risk, simulated, atr_thresholds, historicals=None):
+    """
+    Analyzes a single symbol into its own result list so concurrent workers never share state.
+
+    Symbols whose bars are unchanged since an earlier run reuse the memoized signal; the
+    position sizing is redone every run.
+
+    :return: Tuple of (stock, eligible, symbol_results, error).
+    """
+    symbol_results = []
+    try:
+        signal = None
+        if historicals is not None and len(historicals) >= MIN_HISTORY:
+            key = signal_memo.input_key(historicals)
+            signal = signal_memo.lookup(stock, key)
+            if signal is signal_memo.MISS:
+                signal = stock_signal(historicals)
+                signal_memo.store(stock, key, signal)
+
+        eligible = analyze_stock(stock, symbol_results, portfolio_size, current_risk, simulated=simulated,
+                                 atr_thresholds=atr_thresholds, historicals=historicals, signal=signal)
+        return stock, eligible, symbol_results, None
+    except Exception as e:
+        logging.error(f"Error analyzing {stock}: {e}")
+        return stock, False, [], e
+
+
+def _record_outcomes(chunk, bars_by_symbol, failures):
+    """
+    Updates the negative cache from a chunk's fetch: symbols without data or with too short a
+    history are recorded with their reason, and symbols with usable bars are cleared.
+    """
+    for stock in chunk:
+        bars = bars_by_symbol.get(stock)
+        if bars is None or len(bars) == 0:
+            if failures.get(stock) == negative_cache.NOT_FOUND:
+                negative_cache.record_not_found(stock)
+            else:
+                negative_cache.record_api_error(stock)
+        elif len(bars) < MIN_HISTORY:
+            negative_cache.record_short_history(stock, len(bars), MIN_HISTORY)
+        else:
+            negative_cache.record_success(stock)
+
+
+def _fetch_chunk(chunk, seed=True):
+    """
+    Fetches a chunk's stock bars in one batched call and its crypto bars per symbol. Symbols the
+    run's market snapshot already holds (e.g. open positions checked earlier in the run) are
+    reused, and fetched bars are added to the snapshot for the steps that follow the scan unless
+    `seed` is False (the streaming pipeline keeps no bars once a symbol is evaluated).
+    """
+    failures = {}
+    # Crypto symbols have no batched endpoint; the registry routes them to the crypto historicals
+    crypto = {stock: lookup(stock) for stock in chunk if is_crypto(stock)}
+    chunk_stocks = [stock for stock in chunk if stock not in crypto]
+    crypto_bars = {stock: market_snapshot.get_bars(info.symbol, asset=info.data_endpoint)
+                   for stock, info in crypto.items()}
+
+    snapshot = market_snapshot.current()
+    if snapshot is None:
+        bars_by_symbol = fetch_historical_data_batch(chunk_stocks, chunk_size=len(chunk), as_arrays=True,
+                                                     failures=failures) if chunk_stocks else {}
+    else:
+        known = {stock: snapshot.bars(stock) for stock in chunk_stocks if snapshot.has(stock)}
+        missing = [stock for stock in chunk_stocks if stock not in known]
+        bars_by_symbol = fetch_historical_data_batch(missing, chunk_size=len(chunk), as_arrays=True,
+                                                     failures=failures) if missing else {}
+        if seed:
+            snapshot.seed(bars_by_symbol)
+        bars_by_symbol.update(known)
+    bars_by_symbol.update(crypto_bars)
+    _record_outcomes(chunk, bars_by_symbol, failures)
+    prescreen.record(bars_by_symbol)
+    return bars_by_symbol
+
+
+def _analyze_chunk(chunk, portfolio_size, current_risk, simulated, atr_thresholds):
+    """
+    Fetches historicals for a chunk of symbols in one batched call, then analyzes each symbol.
+
+    :return: List of per-symbol outcomes in chunk order.
+    """
+    try:
+        bars_by_symbol = _fetch_chunk(chunk)
+    except Exception as e:
+        logging.error(f"Error fetching historicals for chunk starting at {chunk[0]}: {e}")
+        return [(stock, False, [], e) for stock in chunk]
+
+    # Empty Bars (rather than None) tell analyze_stock not to fetch again
+    return [_analyze_symbol(stock, portfolio_size, current_risk, simulated, atr_thresholds,
+                            historicals=bars_by_symbol.get(stock) or Bars.empty())
+            for stock in chunk]
+
+
+def _narrow_universe(stock_symbols, atr_thresholds):
+    """
+    Drops symbols held in the negative cache, then (if enabled) symbols the pre-screen rules out.
+    """
+    stock_symbols, _ = negative_cache.partition(stock_symbols)
+    if PRESCREEN_ENABLED:
+        stock_symbols, _ = prescreen.plan(stock_symbols, atr_thresholds[0])
+    return stock_symbols
+
+
+def _finish_scan(started, scanned):
+    prescreen.finish(time.perf_counter() - started, scanned)
+    bar_cache.flush()  # Persist the refreshed bars even if a later step of the run fails
+    negative_cache.flush()
+    prescreen.flush()
+    indicator_state.flush()
+
+
+def scan_stocks(stock_symbols, portfolio_size, current_risk, simulated=SIMULATED, atr_thresholds=ATR_THRESHOLDS,
+                max_workers=SCAN_WORKERS, chunk_size=HISTORICALS_CHUNK_SIZE, on_result=None):
+    """
+    Runs analyze_stock over the universe, optionally on a bounded thread pool.
+
+    Historicals are fetched one chunk of symbols per request. Results are merged back in
+    input order, so the same candidates are produced whatever the worker count or chunk
+    size. A failing symbol is logged and skipped without stopping the scan. Symbols held in
+    the negative cache, or pruned by the pre-screen, are not requested at all.
+
+    :param stock_symbols: List of symbols to analyze.
+    :param max_workers: Number of worker threads. 1 runs the scan sequentially.
+    :param chunk_size: Number of symbols fetched per batched historicals request.
+    :param on_result: Optional callback(stock, eligible, error) invoked as each symbol completes.
+    :return: Tuple of (results, eligibility) where eligibility maps symbol to analyze_stock's return value.
+    """
+    signal_memo.start_run()
+    started = time.perf_counter()
+    stock_symbols = _narrow_universe(stock_symbols, atr_thresholds)
+    chunks = [stock_symbols[start:start + chunk_size] for start in range(0, len(stock_symbols), chunk_size)]
+    per_chunk = [None] * len(chunks)
+
+    def record(index, outcomes):
+        per_chunk[index] = outcomes
+        if on_result:
+            for stock, eligible, _, error in outcomes:
+                on_result(stock, eligible, error)
+
+    if max_workers <= 1:
+        for index, chunk in enumerate(chunks):
+            record(index, _analyze_chunk(chunk, portfolio_size, current_risk, simulated, atr_thresholds))
+    else:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(_analyze_chunk, chunk, portfolio_size, current_risk, simulated, atr_thresholds): index
+                for index, chunk in enumerate(chunks)
+            }
+            # Completion order is nondeterministic; record() keeps each chunk at its input index
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+    results = []
+    eligibility = {}
+    for outcomes in per_chunk:
+        for stock, eligible, symbol_results, _ in outcomes:
+            results.extend(symbol_results)
+            eligibility[stock] = eligible
+
+    _finish_scan(started, len(stock_symbols))
+    return results, eligibility
+
+
+def fetch_universe_bars(stock_symbols, max_workers=SCAN_WORKERS, chunk_size=HISTORICALS_CHUNK_SIZE, on_chunk=None):
+    """
+    Fetches columnar bars for the whole universe, one batched request per chunk, on a bounded pool.
+
+    :param on_chunk: Optional callback(chunk, bars_by_symbol) invoked as each chunk completes.
+    :return: Dict mapping symbol to Bars, or None where no data was returned.
+    """
+    chunks = [stock_symbols[start:start + chunk_size] for start in range(0, len(stock_symbols), chunk_size)]
+    bars_by_symbol = {}
+
+    def fetch(chunk):
+        try:
+            return chunk, _fetch_chunk(chunk)
+        except Exception as e:
+            logging.error(f"Error fetching historicals for chunk starting at {chunk[0]}: {e}")
+            return chunk, {}
+
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        for chunk, fetched in executor.map(fetch, chunks):
+            bars_by_symbol.update(fetched)
+            if on_chunk:
+                on_chunk(chunk, fetched)
+
+    bar_cache.flush()
+    negative_cache.flush()
+    prescreen.flush()
+    return bars_by_symbol
+
+
+def screen_stocks(stock_symbols, portfolio_size, current_risk, atr_thresholds=ATR_THRESHOLDS,
+                  max_workers=SCAN_WORKERS, chunk_size=HISTORICALS_CHUNK_SIZE, on_chunk=None):
+    """
+    Vectorized alternative to scan_stocks: fetches the universe's bars, then evaluates every
+    symbol at once with the cross-sectional screener. Symbols whose bars are unchanged since
+    an earlier run take their signal from the signal memo, and symbols held in the negative
+    cache or pruned by the pre-screen are skipped.
+
+    :return: Tuple of (results, stats) as returned by screen_universe, plus memo_hits,
+             negative_skips and prescreen (the skip and prune reports).
+    """
+    signal_memo.start_run()
+    started = time.perf_counter()
+    stock_symbols = _narrow_universe(stock_symbols, atr_thresholds)
+    bars_by_symbol = fetch_universe_bars(stock_symbols, max_workers=max_workers, chunk_size=chunk_size,
+                                         on_chunk=on_chunk)
+
+    # Only symbols whose bars changed since the last run have their signal recomputed
+    keys = {}
+    signals = {}
+    for stock in dict.fromkeys(stock_symbols):
+        bars = bars_by_symbol.get(stock)
+        if bars is None or len(bars) < MIN_HISTORY:
+            continue
+        keys[stock] = signal_memo.input_key(bars)
+        signal = signal_memo.lookup(stock, keys[stock])
+        if signal is not signal_memo.MISS:
+            signals[stock] = signal
+    memo_hits = len(signals)
+    computed = signal_universe(bars_by_symbol, [stock for stock in keys if stock not in signals])
+    for stock, signal in computed.items():
+        signal_memo.store(stock, keys[stock], signal)
+    signals.update(computed)
+
+    results, stats = screen_universe(bars_by_symbol, stock_symbols, portfolio_size, current_risk,
+                                     atr_thresholds=atr_thresholds, signals=signals)
+    stats['memo_hits'] = memo_hits
+    _finish_scan(started, len(stock_symbols))
+    stats['negative_skips'] = negative_cache.report()
+    stats['prescreen'] = prescreen.report()
+    return results, stats
+
+
+def stream_stocks(stock_symbols, portfolio_size, current_risk, atr_thresholds=ATR_THRESHOLDS, top_k=SCAN_TOP_K,
+                  max_workers=SCAN_WORKERS, chunk_size=HISTORICALS_CHUNK_SIZE, on_chunk=None, on_preliminary=None,
+                  preliminary_fraction=SCAN_PRELIMINARY_FRACTION, deadline_seconds=SCAN_DEADLINE_SECONDS):
+    """
+    Streaming alternative to screen_stocks: chunks are evaluated as they arrive and only the
+    best top_k candidates are kept, so memory does not grow with the universe. The signal memo
+    is not used and fetched bars are not added to the run's market snapshot. With
+    INDICATOR_STATE_ENABLED, the crossover comes from the state persisted by indicator_state, so
+    each symbol only applies the bars that are new since the previous run; ATR is always
+    computed from the fetched bars.
+
+    :param on_preliminary: Optional callback(ranked, evaluated, total) given the ranking so far
+                           once preliminary_fraction of the universe has been evaluated.
+    :param deadline_seconds: Optional budget after which symbols still being fetched are dropped.
+    :return: Tuple of (top_k results ranked by ATR Percent, stats) plus negative_skips, prescreen
+             and, with INDICATOR_STATE_ENABLED, indicator_state.
+    """
+    started = time.perf_counter()
+    stock_symbols = _narrow_universe(list(dict.fromkeys(stock_symbols)), atr_thresholds)
+    results, stats = run_pipeline(
+        stock_symbols, lambda chunk: _fetch_chunk(chunk, seed=False), portfolio_size, current_risk,
+        atr_thresholds, top_k, max_workers, chunk_size, preliminary_fraction=preliminary_fraction,
+        on_preliminary=on_preliminary, deadline_seconds=deadline_seconds, on_chunk=on_chunk,
+        crossover=indicator_state.crossover if INDICATOR_STATE_ENABLED else None
+    )
+    _finish_scan(started, len(stock_symbols) - stats['late'])
+    stats['negative_skips'] = negative_cache.report()
+    stats['prescreen'] = prescreen.report()
+    if INDICATOR_STATE_ENABLED:
+        stats['indicator_state'] = indicator_state.report()
+    return results, stats
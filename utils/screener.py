@@ -0,0 +1,173 @@
+# utils/screener.py
+import numpy as np
+from utils.analysis import sma, wilder_atr
+from utils.settings import MAX_DAILY_LOSS, ATR_THRESHOLDS
+
+MIN_HISTORY = 50  # Same minimum as analyze_stock; shorter histories cannot produce a 50-day MA
+CROSSOVER_DAYS = 5
+
+
+def _crossover_mask(closes, short_period=20, long_period=50, days=CROSSOVER_DAYS):
+    """
+    Vectorized detect_recent_crossover over a (symbols, bars) matrix of closes.
+
+    :return: Boolean array, True where the short MA crossed above the long MA within the last `days` bars.
+    """
+    ma_long = sma(closes, long_period)
+    if ma_long.shape[-1] < days + 1:
+        return np.zeros(closes.shape[0], dtype=bool)
+    ma_short = sma(closes, short_period)[:, -ma_long.shape[-1]:]
+    was_below = ma_short[:, -days - 1:-1] <= ma_long[:, -days - 1:-1]
+    now_above = ma_short[:, -days:] > ma_long[:, -days:]
+    return np.any(was_below & now_above, axis=1)
+
+
+def classify_atr_percent(atr_percent):
+    """
+    Buckets ATR percentages into the 3%, 4% and 5% classes used for position sizing.
+    """
+    return np.select([atr_percent < 3.5, atr_percent < 4.5], [3.0, 4.0], default=5.0)
+
+
+def atr_block(closes, highs, lows):
+    """
+    Computes the latest ATR, ATR% and close for equal-length histories.
+    """
+    atr = wilder_atr(highs, lows, closes)[:, -1]
+    share_price = closes[:, -1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        atr_percent = np.where(share_price != 0, atr / share_price * 100, 0.0)
+    return atr, atr_percent, share_price
+
+
+def screen_block(closes, highs, lows):
+    """
+    Computes the crossover signal, latest ATR and latest close for equal-length histories.
+    """
+    return (_crossover_mask(closes),) + atr_block(closes, highs, lows)
+
+
+def filter_block(bullish, atr_percent, atr_thresholds=ATR_THRESHOLDS, atr_floor=3.0):
+    """
+    Applies analyze_stock's signal filters to a block of symbols.
+
+    :return: Tuple of (above_floor, passes): ATR% of at least atr_floor, and that plus a bullish
+             crossover and an ATR class within atr_thresholds.
+    """
+    above_floor = atr_percent >= atr_floor
+    passes = above_floor & bullish & np.isin(classify_atr_percent(atr_percent), atr_thresholds)
+    return above_floor, passes
+
+
+def size_block(atr_percent, portfolio_size, current_risk, risk_per_trade=0.02, atr_multiple=2,
+               max_daily_loss=MAX_DAILY_LOSS, risk_tolerance=0.0):
+    """
+    Sizes positions for a block of symbols the way analyze_stock does. The keyword arguments
+    default to analyze_stock's constants; the backtester varies them.
+
+    :param risk_tolerance: Relative slack on both risk limits. Live scans keep analyze_stock's
+                           exact comparison (0).
+    :return: Tuple of (two_atr, purchase_amount, potential_loss, within_risk). two_atr keeps its
+             name for the stop distance, atr_multiple times the classified ATR%.
+    """
+    two_atr = atr_multiple * (classify_atr_percent(atr_percent) / 100)
+    purchase_amount = (risk_per_trade * portfolio_size) / two_atr
+    potential_loss = purchase_amount * two_atr
+    within_risk = ((potential_loss <= portfolio_size * risk_per_trade * (1 + risk_tolerance))
+                   & (current_risk + potential_loss <= max_daily_loss * portfolio_size * (1 + risk_tolerance)))
+    return two_atr, purchase_amount, potential_loss, within_risk
+
+
+def candidate_record(stock, atr, atr_percent, two_atr, share_price, purchase_amount, potential_loss, portfolio_size):
+    """
+    Builds an analyze_stock-style result entry for an eligible symbol.
+    """
+    return {
+        'Stock': stock,
+        'ATR': float(atr),
+        'ATR Percent': float(atr_percent),
+        'ATR * 2': float(two_atr) * 100,
+        'Share Price': float(share_price),
+        'Eligible for Trade': True,
+        'Trade Made': False,
+        'Order Status': "Not Attempted",
+        'Order ID': None,
+        'Trade Amount': float(purchase_amount),
+        'Shares to Purchase': float(purchase_amount) / float(share_price),
+        'Potential Gain': float(potential_loss),
+        'Risk Percent': (float(potential_loss) / portfolio_size) * 100,
+        'Risk Dollar': float(potential_loss),
+        'Reason': "Criteria met"
+    }
+
+
+def signal_universe(bars_by_symbol, stock_symbols):
+    """
+    Computes screen_block's signal for every symbol with at least MIN_HISTORY bars. Histories
+    are ragged, so symbols are grouped by bar count and each group is one (symbols, bars) matrix.
+
+    :return: Dict mapping symbol to (bullish, atr, atr_percent, share_price).
+    """
+    by_length = {}
+    for stock in stock_symbols:
+        bars = bars_by_symbol.get(stock)
+        if bars is not None and len(bars) >= MIN_HISTORY:
+            by_length.setdefault(len(bars), []).append((stock, bars))
+
+    signals = {}
+    for members in by_length.values():
+        closes = np.stack([bars.close for _, bars in members])
+        highs = np.stack([bars.high for _, bars in members])
+        lows = np.stack([bars.low for _, bars in members])
+        block = screen_block(closes, highs, lows)
+        for row, (stock, _) in enumerate(members):
+            signals[stock] = tuple(column[row] for column in block)
+    return signals
+
+
+def screen_universe(bars_by_symbol, stock_symbols, portfolio_size, current_risk, atr_thresholds=ATR_THRESHOLDS,
+                    signals=None):
+    """
+    Evaluates the 20/50 crossover, ATR% filter, ATR classification and position sizing for
+    the whole universe in a few vectorized passes.
+
+    Signals come from signal_universe, except for symbols already in `signals` (e.g. served
+    by the signal memo). Sizing always runs, since it depends on the portfolio and current
+    risk. Symbols with fewer than MIN_HISTORY bars are skipped, as in analyze_stock.
+
+    :param bars_by_symbol: Dict mapping symbol to Bars (or None if no data was returned).
+    :param stock_symbols: Symbols to screen, in scan order.
+    :param signals: Optional dict mapping symbol to a precomputed (bullish, atr, atr_percent, share_price).
+    :return: Tuple of (results, stats). results holds analyze_stock-style entries ranked by
+             ATR Percent (highest first, ties in scan order); stats counts why symbols dropped out.
+    """
+    stats = {'screened': 0, 'short_history': [], 'below_atr_floor': 0, 'bullish_crossovers': 0}
+    signals = dict(signals or {})
+    signals.update(signal_universe(bars_by_symbol, [stock for stock in stock_symbols if stock not in signals]))
+    members = []
+    for position, stock in enumerate(stock_symbols):
+        if stock in signals:
+            members.append((position, stock))
+        else:
+            stats['short_history'].append(stock)
+    if not members:
+        return [], stats
+
+    bullish, atr, atr_percent, share_price = (np.array(column) for column in
+                                              zip(*(signals[stock] for _, stock in members)))
+    bullish = bullish.astype(bool)
+    stats['screened'] = len(members)
+    above_floor, passes = filter_block(bullish, atr_percent, atr_thresholds)
+    stats['below_atr_floor'] = int(np.count_nonzero(~above_floor))
+    stats['bullish_crossovers'] = int(np.count_nonzero(bullish))
+
+    two_atr, purchase_amount, potential_loss, within_risk = size_block(atr_percent, portfolio_size, current_risk)
+    candidates = []
+    for row in np.flatnonzero(passes & within_risk):
+        position, stock = members[row]
+        candidates.append((position, candidate_record(stock, atr[row], atr_percent[row], two_atr[row],
+                                                      share_price[row], purchase_amount[row],
+                                                      potential_loss[row], portfolio_size)))
+
+    candidates.sort(key=lambda item: (-item[1]['ATR Percent'], item[0]))
+    return [result for _, result in candidates], stats
@@ -10,9 +10,78 @@ PHONE_NUMBER = '252-571-5303'
 USE_CSV_DATA = True  # Set to True to use CSV data; False to use top movers
 USE_NASDAQ_DATA = True  # Set to True to use NASDAQ data only
 USE_SP500_DATA = True  # Set to True to use S&P 500 data only
+UNIVERSE_INDEX_FILE = 'cache/universe.json'  # Compiled, deduplicated index of the CSV universe (rebuilt when a CSV changes)
 
 # Trading Strategy Settings
 ATR_THRESHOLDS = (3.0, 4.0, 5.0)  # ATR thresholds for classifying ATR percentages
 
+# Scan Settings
+SCAN_MODE = 'screener'  # 'screener' evaluates the universe as one matrix; 'streaming' evaluates chunks as they arrive into a top-K heap; 'per_symbol' runs analyze_stock per ticker
+SCAN_WORKERS = 8  # Worker threads used to analyze the universe; 1 scans sequentially
+HISTORICALS_CHUNK_SIZE = 75  # Symbols requested per batched historicals call
+SCAN_TOP_K = 10  # Candidates the streaming scan keeps (best ATR Percent first)
+SCAN_PRELIMINARY_FRACTION = 0.5  # Streaming scan reports a preliminary ranking after this share of the universe
+SCAN_DEADLINE_SECONDS = None  # Streaming scan stops waiting for slow chunks after this many seconds (None waits for all)
+INDICATOR_STATE_ENABLED = True  # Streaming scan updates persisted per-symbol SMA crossover state instead of recomputing it from all bars (ATR is always recomputed)
+INDICATOR_STATE_FILE = 'cache/indicator_state.npz'  # Where that state is saved between runs
+
+# Pre-screen Settings
+PRESCREEN_ENABLED = True  # Skip fetching symbols whose recent ATR% is clearly below the floor
+PRESCREEN_FILE = 'cache/prescreen.json'  # Previous-run ATR% per symbol and the time of the last full scan
+PRESCREEN_ATR_MARGIN = 0.75  # Prune only below this fraction of the ATR% floor (0.75 * 3.0% = 2.25%)
+PRESCREEN_MAX_AGE_HOURS = 72  # Older ATR% estimates are not trusted; the symbol is fetched instead
+PRESCREEN_FULL_REFRESH_HOURS = 24  # Scan the whole universe at least this often, pruning nothing
+
+# Backtest Settings
+BACKTEST_INITIAL_CAPITAL = SIMULATED_PORTFOLIO_SIZE  # Starting equity of a backtest
+BACKTEST_SPAN = '5year'  # Daily history backtest.py requests when BACKTEST_FETCH is on
+BACKTEST_FETCH = False  # backtest.py fills the bar cache with BACKTEST_SPAN of history first (needs a login); otherwise it replays what is cached
+
+# Parameter Sweep Settings
+SWEEP_RESULTS_FILE = 'cache/sweep_results.db'  # SQLite table of metrics per parameter combination; finished runs are skipped on rerun
+SWEEP_DATA_DIR = 'cache/sweep'  # Memory-mapped panel and indicator arrays shared by the sweep workers
+SWEEP_WORKERS = None  # Worker processes for the sweep (None: one per CPU)
+SWEEP_GRID = {  # StrategyParams field -> values to try
+    'short_period': (10, 20, 30),
+    'long_period': (50, 100),
+    'atr_floor': (2.5, 3.0, 3.5),
+    'atr_thresholds': ((3.0, 4.0, 5.0), (4.0, 5.0)),
+    'atr_multiple': (1.5, 2.0, 3.0),
+    'max_hold_days': (5, 10, 20),
+    'max_daily_loss': (0.045, 0.065, 0.085),
+}
+
+# Walk-forward Settings
+WALK_FORWARD_TRAIN_DAYS = 504  # In-sample window in trading days (about two years) on which SWEEP_GRID is optimized
+WALK_FORWARD_TEST_DAYS = 126  # Out-of-sample window that follows it (about six months); windows roll forward by this much
+WALK_FORWARD_OBJECTIVE = 'cagr'  # metrics() key maximized in-sample to choose each window's parameters
+WALK_FORWARD_MIN_TRADES = 10  # In-sample runs with fewer trades rank below every run with enough
+WALK_FORWARD_EQUITY_FILE = 'cache/walk_forward_equity.csv'  # Stitched out-of-sample and baseline equity curves
+
+# Bar Cache Settings
+BAR_CACHE_DIR = 'cache/bars'  # Where fetched OHLCV bars are persisted between runs
+BAR_CACHE_FORMING_TTL_MINUTES = 15  # How long a cached series (whose last bar may still be forming) is served without refreshing
+
+# Negative Cache Settings
+NEGATIVE_CACHE_FILE = 'cache/negative_symbols.json'  # Symbols the scan skips for now, with reason and expiry
+NEGATIVE_CACHE_TTL_HOURS = {'not_found': 7 * 24, 'api_error': 6}  # How long each kind of failure is skipped (short histories expire once enough bars could exist)
+NEGATIVE_CACHE_ERROR_STRIKES = 3  # Consecutive failed runs before a symbol with API errors is skipped
+
+# Trade Journal Settings
+TRADES_DIR = 'trades'  # Directory holding the trade journal and history snapshot
+TRADE_JOURNAL_COMPACT_BYTES = 256 * 1024  # Fold the journal into trade_history.json once it grows past this size
+TRADE_STORE_FILE = 'trades/trade_store.db'  # SQLite index over the trade history for symbol and order lookups
+
+# Request Layer Settings
+REQUESTS_PER_SECOND = 8  # Sustained broker request rate shared by all threads
+REQUEST_BURST = 16  # Requests that may go out back-to-back before the rate limit applies
+REQUEST_MAX_RETRIES = 4  # Retries for a throttled (429) or transient (5xx, connection) failure
+REQUEST_BACKOFF_BASE_SECONDS = 0.5  # First retry waits up to this long; each further retry doubles it (with jitter)
+REQUEST_BACKOFF_MAX_SECONDS = 30  # Upper bound on a single backoff wait
+ENDPOINT_CONCURRENCY = {'historicals': 4, 'quotes': 4, 'account': 2, 'orders': 1, 'markets': 2, 'default': 4}  # In-flight calls allowed per endpoint group
+
+# Positions Settings
+POSITIONS_TTL_SECONDS = 30  # How long a fetched positions snapshot is reused before asking the broker again
+
 # EXUDE_LIST	= (STEC)  # List of stocks to exude from trading
 # this is 
\ No newline at end of file
@@ -0,0 +1,66 @@
+# utils/signal_memo.py
+import hashlib
+import threading
+import numpy as np
+
+# Process-wide memo of per-symbol signals. bot_schedule.py calls main() in the same process
+# every 15 minutes, so entries carry over between runs of one session. Only the crossover and
+# ATR are memoized: they depend on the bars alone, while sizing depends on the portfolio and
+# the current risk (which change between runs) and is cheap, so it is redone every run.
+_memo = {}  # symbol -> (input key, (bullish, atr, atr_percent, share_price))
+_lock = threading.Lock()
+_stats = {'hits': 0, 'misses': 0}
+
+MISS = object()
+
+
+def input_key(bars):
+    """
+    Builds the memo key for a symbol: its last bar timestamp plus a digest of the bars the
+    signal is computed from, so an intraday move of the partial bar invalidates the entry.
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    for column in (bars.begins_at, bars.high, bars.low, bars.close):
+        digest.update(np.ascontiguousarray(column).tobytes())
+    last_bar = int(bars.begins_at[-1]) if len(bars) else None
+    return last_bar, digest.hexdigest()
+
+
+def lookup(symbol, key):
+    """
+    :return: The memoized (bullish, atr, atr_percent, share_price) signal, or MISS if the bars changed.
+    """
+    with _lock:
+        entry = _memo.get(symbol)
+        if entry is None or entry[0] != key:
+            _stats['misses'] += 1
+            return MISS
+        _stats['hits'] += 1
+        return entry[1]
+
+
+def store(symbol, key, signal):
+    with _lock:
+        _memo[symbol] = (key, tuple(signal))
+
+
+def start_run():
+    """
+    Resets the per-run hit counters. Memo entries are kept.
+    """
+    with _lock:
+        _stats['hits'] = 0
+        _stats['misses'] = 0
+
+
+def report():
+    """
+    :return: Dict with this run's memo hits, misses and hit ratio.
+    """
+    with _lock:
+        total = _stats['hits'] + _stats['misses']
+        return {
+            'hits': _stats['hits'],
+            'misses': _stats['misses'],
+            'hit_ratio': _stats['hits'] / total if total else 0.0,
+        }
@@ -0,0 +1,224 @@
+# utils/sweep.py
+import os
+import json
+import time
+import sqlite3
+import logging
+import shutil
+import itertools
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from utils.backtest import (StrategyParams, save_panel, open_panel, save_signals, open_signals, compute_signals,
+                            run_backtest, metrics)
+from utils.settings import SWEEP_RESULTS_FILE, SWEEP_DATA_DIR, SWEEP_WORKERS, BACKTEST_INITIAL_CAPITAL
+
+# Parameter sweep over the backtester on a process pool. The panel is written once as .npy
+# files and every worker memory-maps it, so the bars are shared through the page cache instead
+# of being pickled to each process. Indicator arrays depend only on the MA/ATR periods, so they
+# are computed once per distinct set of periods and shared the same way. Each finished run is
+# committed to a SQLite table straight away, keyed by the panel's fingerprint and the parameters;
+# rerunning the sweep on the same panel skips every run already there.
+
+METRIC_COLUMNS = ('cagr', 'max_drawdown', 'win_rate', 'exposure', 'total_return', 'trades', 'final_equity')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    panel TEXT NOT NULL,
+    params TEXT NOT NULL,
+    cagr REAL,
+    max_drawdown REAL,
+    win_rate REAL,
+    exposure REAL,
+    total_return REAL,
+    trades INTEGER,
+    final_equity REAL,
+    seconds REAL,
+    finished_at REAL,
+    PRIMARY KEY (panel, params)
+);
+"""
+
+_worker_panel = None
+_worker_signals = {}  # indicator_key -> Signals, per worker process
+
+
+def parameter_grid(grid, base=StrategyParams()):
+    """
+    Expands {field: [values]} into every StrategyParams combination, starting from `base`.
+    Combinations whose short MA is not shorter than the long MA are left out.
+    """
+    fields = list(grid)
+    combos = []
+    for values in itertools.product(*(grid[field] for field in fields)):
+        params = base._replace(**{field: tuple(value) if isinstance(value, list) else value
+                                  for field, value in zip(fields, values)})
+        if params.short_period < params.long_period:
+            combos.append(params)
+    return combos
+
+
+def params_key(params):
+    """
+    A run's parameters as sorted JSON; with the panel fingerprint, its key in the results table.
+    """
+    return json.dumps(params._asdict(), sort_keys=True)
+
+
+def signals_directory(data_dir, params):
+    return os.path.join(data_dir, 'signals_' + '_'.join(str(value) for value in params.indicator_key()))
+
+
+def panel_fingerprint(panel):
+    """
+    Identifies the data a run was made on: symbol and day counts, first and last day, and the sum of the closes.
+    """
+    return [len(panel.symbols), len(panel.days), int(panel.days[0]) if len(panel.days) else 0,
+            int(panel.days[-1]) if len(panel.days) else 0, float(np.nansum(panel.close))]
+
+
+def share_panel(panel, data_dir):
+    """
+    Saves the panel for the workers to memory-map. If the same panel is already saved (a resumed
+    sweep), it and the signals computed from it are kept; otherwise stale signals are removed.
+    """
+    directory = os.path.join(data_dir, 'panel')
+    fingerprint = panel_fingerprint(panel)
+    try:
+        if panel_fingerprint(open_panel(directory)) == fingerprint:
+            return
+    except (FileNotFoundError, ValueError, OSError):
+        pass
+    if os.path.isdir(data_dir):
+        for name in os.listdir(data_dir):
+            if name.startswith('signals_'):
+                shutil.rmtree(os.path.join(data_dir, name), ignore_errors=True)
+    save_panel(panel, directory)
+
+
+def _connect(results_file):
+    directory = os.path.dirname(results_file)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    connection = sqlite3.connect(results_file)
+    connection.execute("PRAGMA journal_mode=WAL")
+    columns = [row[1] for row in connection.execute("PRAGMA table_info(results)")]
+    if columns and 'panel' not in columns:
+        # Written before runs were keyed by panel, so there is no telling which data they describe
+        logging.warning(f"Discarding sweep results in {results_file} that are not tied to a panel")
+        connection.execute("DROP TABLE results")
+    connection.executescript(SCHEMA)
+    return connection
+
+
+def load_results(results_file=SWEEP_RESULTS_FILE, panel=None):
+    """
+    Returns the recorded runs as dicts of their parameters and metrics, best CAGR first.
+
+    :param panel: If given, only runs made on this panel (by panel_fingerprint) are returned.
+    """
+    query = f"SELECT params, {', '.join(METRIC_COLUMNS)}, seconds FROM results"
+    args = ()
+    if panel is not None:
+        query += " WHERE panel = ?"
+        args = (json.dumps(panel_fingerprint(panel)),)
+    connection = _connect(results_file)
+    try:
+        rows = connection.execute(query + " ORDER BY cagr DESC", args).fetchall()
+    finally:
+        connection.close()
+    return [{'params': json.loads(row[0]), **dict(zip(METRIC_COLUMNS + ('seconds',), row[1:]))} for row in rows]
+
+
+def init_worker(data_dir):
+    """
+    Process pool initializer: memory-maps the panel saved by share_panel.
+    """
+    global _worker_panel
+    logging.basicConfig(level=logging.WARNING)
+    _worker_panel = open_panel(os.path.join(data_dir, 'panel'))
+
+
+def prepare_signals(data_dir, params):
+    """
+    Computes and saves the indicator arrays for one set of periods, unless already saved.
+    """
+    directory = signals_directory(data_dir, params)
+    if open_signals(directory) is None:
+        save_signals(compute_signals(_worker_panel, params), directory, params)
+    return params.indicator_key()
+
+
+def prepare_all_signals(executor, data_dir, combos):
+    """
+    Computes the Signals each distinct set of periods in `combos` needs, in parallel on `executor`.
+    """
+    indicator_sets = {params.indicator_key(): params for params in combos}
+    for future in as_completed([executor.submit(prepare_signals, data_dir, params)
+                                for params in indicator_sets.values()]):
+        future.result()
+
+
+def worker_panel():
+    return _worker_panel
+
+
+def worker_signals(data_dir, params):
+    """
+    The memory-mapped Signals for params' periods in this worker, opened on first use.
+    """
+    key = params.indicator_key()
+    if key not in _worker_signals:
+        _worker_signals[key] = open_signals(signals_directory(data_dir, params))
+    return _worker_signals[key]
+
+
+def _run_one(data_dir, params, initial_capital):
+    started = time.perf_counter()
+    result = run_backtest(_worker_panel, params, initial_capital, signals=worker_signals(data_dir, params))
+    return params, metrics(result), time.perf_counter() - started
+
+
+def run_sweep(panel, grid, results_file=SWEEP_RESULTS_FILE, data_dir=SWEEP_DATA_DIR, max_workers=SWEEP_WORKERS,
+              initial_capital=BACKTEST_INITIAL_CAPITAL, on_result=None):
+    """
+    Backtests every combination in `grid` on a process pool and records the metrics.
+
+    Runs already recorded for this panel are skipped, so an interrupted sweep resumes where it
+    stopped. Runs recorded on other data are kept in results_file but neither skipped nor returned.
+
+    :param grid: Dict mapping StrategyParams fields to the values to try.
+    :param max_workers: Worker processes (None: one per CPU).
+    :param on_result: Optional callback(params, metrics, done, total) after each recorded run.
+    :return: load_results(results_file, panel).
+    """
+    fingerprint = json.dumps(panel_fingerprint(panel))
+    connection = _connect(results_file)
+    try:
+        finished = {row[0] for row in connection.execute("SELECT params FROM results WHERE panel = ?",
+                                                         (fingerprint,))}
+        combos = parameter_grid(grid)
+        pending = sorted((params for params in combos if params_key(params) not in finished),
+                         key=lambda params: params.indicator_key())
+        logging.info(f"Sweep: {len(combos)} combinations, {len(combos) - len(pending)} already recorded")
+        if not pending:
+            return load_results(results_file, panel)
+
+        share_panel(panel, data_dir)
+        with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(data_dir,)) as executor:
+            prepare_all_signals(executor, data_dir, pending)
+
+            futures = [executor.submit(_run_one, data_dir, params, initial_capital) for params in pending]
+            for done, future in enumerate(as_completed(futures), 1):
+                params, summary, seconds = future.result()
+                with connection:
+                    connection.execute(
+                        f"INSERT OR REPLACE INTO results (panel, params, {', '.join(METRIC_COLUMNS)}, seconds, "
+                        f"finished_at) VALUES ({', '.join('?' * (len(METRIC_COLUMNS) + 4))})",
+                        (fingerprint, params_key(params), *(summary[column] for column in METRIC_COLUMNS), seconds,
+                         time.time())
+                    )
+                if on_result:
+                    on_result(params, summary, done, len(pending))
+    finally:
+        connection.close()
+    return load_results(results_file, panel)
@@ -0,0 +1,118 @@
+# utils/symbols.py
+import logging
+import threading
+from datetime import datetime, time
+from typing import NamedTuple
+from utils.universe import load_universe
+from utils.order_sync import fractional_flags
+
+# Process-wide symbol registry built once from the universe index. Every place that needs to
+# know whether a symbol is crypto (order routing, market hours, which historicals endpoint to
+# call) asks lookup() instead of keeping its own list.
+
+REGULAR_HOURS = (time(9, 30), time(16, 0))
+CRYPTO_QUOTE_SUFFIX = 'USD'
+
+
+class SymbolInfo(NamedTuple):
+    symbol: str  # Canonical symbol for orders and data requests ('BTC', not 'BTC-USD')
+    asset_class: str  # 'stock' or 'crypto'
+    trading_hours: str  # 'regular' or '24_7' (same bounds names as bar_cache)
+    fractional: bool  # Dollar-amount orders allowed; None for a stock whose instrument isn't cached yet
+    data_endpoint: str  # Historicals endpoint: 'stock' or 'crypto' (market_snapshot's asset argument)
+    exchange: str = ''
+    sector: str = ''
+    market_cap: float = None
+
+
+_lock = threading.Lock()
+_registry = None
+
+
+def normalize(symbol):
+    return symbol.replace('-', '').strip().upper()
+
+
+def _build():
+    """
+    :return: Tuple of (primary table, per-asset-class tables), each keyed by normalized symbol.
+    """
+    primary, by_class = {}, {'stock': {}, 'crypto': {}}
+    universe = load_universe()
+    try:
+        fractional = fractional_flags()
+    except Exception as e:
+        logging.error(f"Failed to read cached instrument data, stock fractional flags left unknown: {e}")
+        fractional = {}
+    for index, symbol in enumerate(universe.symbol):
+        if universe.asset_class[index] == 'crypto':
+            canonical = symbol[:-len(CRYPTO_QUOTE_SUFFIX)] if symbol.endswith(CRYPTO_QUOTE_SUFFIX) else symbol
+            info = SymbolInfo(canonical, 'crypto', '24_7', True, 'crypto', universe.exchange[index])
+            # BTC, BTCUSD and BTC-USD (normalized to BTCUSD) all resolve to the same entry
+            aliases = (normalize(canonical), normalize(canonical + CRYPTO_QUOTE_SUFFIX))
+        else:
+            info = SymbolInfo(symbol, 'stock', 'regular', fractional.get(symbol), 'stock', universe.exchange[index],
+                              universe.sector[index], universe.market_cap[index])
+            aliases = (normalize(symbol),)
+        for alias in aliases:
+            by_class[info.asset_class].setdefault(alias, info)
+
+    # A bare coin code that is also a listed ticker (ETH, SOL, ...) means the stock unless the
+    # caller says otherwise; the coin stays reachable as e.g. ETHUSD or with asset_class='crypto'
+    primary.update(by_class['crypto'])
+    primary.update(by_class['stock'])
+    return primary, by_class
+
+
+def _get_registry():
+    global _registry
+    if _registry is None:
+        with _lock:
+            if _registry is None:
+                try:
+                    _registry = _build()
+                except Exception as e:
+                    logging.error(f"Failed to build symbol registry, treating every symbol as a stock: {e}")
+                    _registry = ({}, {'stock': {}, 'crypto': {}})
+    return _registry
+
+
+def reload():
+    """
+    Drops the registry so the next lookup rebuilds it from the (possibly recompiled) universe.
+    """
+    global _registry
+    with _lock:
+        _registry = None
+
+
+def lookup(symbol, asset_class=None):
+    """
+    Returns the SymbolInfo for a symbol or any of its aliases. Pass asset_class when the caller
+    already knows it (e.g. from a broker position) to pick the right entry for a code that is
+    both a coin and a ticker. Unknown symbols are treated as regular-hours stocks, or as coins
+    if asset_class='crypto'.
+    """
+    primary, by_class = _get_registry()
+    key = normalize(symbol)
+    info = by_class[asset_class].get(key) if asset_class in by_class else primary.get(key)
+    if info is not None:
+        return info
+    if asset_class == 'crypto':
+        return SymbolInfo(key, 'crypto', '24_7', True, 'crypto')
+    return SymbolInfo(key, 'stock', 'regular', None, 'stock')
+
+
+def is_crypto(symbol):
+    return lookup(symbol).asset_class == 'crypto'
+
+
+def is_trading(symbol=None, now=None):
+    """
+    Whether the symbol's market is open at `now` (default: the current local time). Without a
+    symbol, answers for the regular stock session.
+    """
+    if symbol is not None and lookup(symbol).trading_hours == '24_7':
+        return True
+    current = (now or datetime.now()).time()
+    return REGULAR_HOURS[0] <= current <= REGULAR_HOURS[1]
@@ -0,0 +1,168 @@
+# utils/trade_journal.py
+import json
+import os
+import atexit
+import logging
+from datetime import datetime
+from utils.settings import TRADES_DIR, TRADE_JOURNAL_COMPACT_BYTES
+
+SNAPSHOT_FILE = os.path.join(TRADES_DIR, 'trade_history.json')
+JOURNAL_FILE = os.path.join(TRADES_DIR, 'trade_journal.jsonl')
+COMPACTING_FILE = JOURNAL_FILE + '.compacting'
+
+
+def _record_key(record):
+    return record.get('timestamp'), record.get('Stock'), record.get('Order ID')
+
+
+def _append_line(path, record):
+    """
+    Appends one JSON line and fsyncs it. If a previous write was cut off mid-line, the torn
+    fragment is terminated first so it cannot corrupt the new record.
+    """
+    with open(path, 'ab+') as f:
+        if f.tell() > 0:
+            f.seek(-1, os.SEEK_END)
+            if f.read(1) != b'\n':
+                f.write(b'\n')
+        f.write(json.dumps(record).encode() + b'\n')
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def _read_lines(path):
+    records = []
+    try:
+        with open(path, 'rb') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping torn journal line in {path}")
+    except FileNotFoundError:
+        pass
+    return records
+
+
+def _read_snapshot():
+    try:
+        with open(SNAPSHOT_FILE, 'r') as f:
+            return json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return []
+
+
+def _append_daily(trade):
+    """
+    Adds the trade to the day's YYYY-MM-DD_trades.json array. The file only holds one day's
+    trades, so it is rewritten (atomically) in its existing format for the tools that read it.
+    """
+    daily_file = os.path.join(TRADES_DIR, f"{datetime.now().strftime('%Y-%m-%d')}_trades.json")
+    try:
+        with open(daily_file, 'r') as f:
+            daily_trades = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        daily_trades = []
+    daily_trades.append(trade)
+
+    tmp_path = daily_file + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(daily_trades, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, daily_file)
+
+
+def append_trade(trade):
+    """
+    Records a trade: one fsynced line in the journal, plus the trade in the day's file. The
+    journal is compacted into trade_history.json once it grows past TRADE_JOURNAL_COMPACT_BYTES
+    and again when the process exits, so the snapshot is current after every bot run.
+    """
+    os.makedirs(TRADES_DIR, exist_ok=True)
+    _append_line(JOURNAL_FILE, trade)
+    _append_daily(trade)
+    if os.path.getsize(JOURNAL_FILE) >= TRADE_JOURNAL_COMPACT_BYTES:
+        compact()
+
+
+def load_trade_history():
+    """
+    Returns the full trade history: the compacted snapshot followed by journaled records.
+    """
+    history = _read_snapshot()
+    if os.path.exists(COMPACTING_FILE):
+        # An interrupted compaction; its records may or may not already be in the snapshot
+        seen = {_record_key(record) for record in history}
+        history.extend(record for record in _read_lines(COMPACTING_FILE) if _record_key(record) not in seen)
+    history.extend(_read_lines(JOURNAL_FILE))
+    return history
+
+
+def tail(count=1):
+    """
+    Returns the last `count` records without parsing the whole history. The journal is read
+    backwards in blocks; the snapshot is only consulted if the journal holds fewer records.
+    """
+    lines = []
+    try:
+        with open(JOURNAL_FILE, 'rb') as f:
+            f.seek(0, os.SEEK_END)
+            position = f.tell()
+            buffer = b''
+            while position > 0 and len(lines) < count + 2:
+                step = min(8192, position)
+                position -= step
+                f.seek(position)
+                buffer = f.read(step) + buffer
+                lines = buffer.split(b'\n')
+            if position > 0:
+                lines = lines[1:]  # The first line may be cut off at the block boundary
+    except FileNotFoundError:
+        pass
+
+    records = []
+    for line in reversed(lines):
+        if len(records) == count:
+            break
+        if line.strip():
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                logging.warning(f"Skipping torn journal line in {JOURNAL_FILE}")
+    records.reverse()
+    if len(records) < count:
+        earlier = load_trade_history()[:-len(records)] if records else load_trade_history()
+        records = earlier[-(count - len(records)):] + records
+    return records
+
+
+def compact():
+    """
+    Folds the journal into the trade_history.json snapshot.
+
+    The journal is first renamed aside, so new appends go to a fresh file. The snapshot is then
+    rewritten atomically and the renamed journal removed. If the process dies part way, the
+    leftover .compacting file is merged (without duplicates) by the next read or compaction.
+    """
+    if os.path.exists(JOURNAL_FILE) and not os.path.exists(COMPACTING_FILE):
+        os.replace(JOURNAL_FILE, COMPACTING_FILE)
+    if not os.path.exists(COMPACTING_FILE):
+        return
+
+    history = _read_snapshot()
+    seen = {_record_key(record) for record in history}
+    history.extend(record for record in _read_lines(COMPACTING_FILE) if _record_key(record) not in seen)
+
+    tmp_path = SNAPSHOT_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(history, f, indent=4)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, SNAPSHOT_FILE)
+    os.remove(COMPACTING_FILE)
+
+
+atexit.register(compact)
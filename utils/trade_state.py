@@ -2,8 +2,12 @@
 import robin_stocks.robinhood as r
 from datetime import datetime
 from utils.analysis import calculate_atr
-from utils.api import fetch_historical_data
+from utils.market_snapshot import get_atr
 from utils.account_data import global_account_data
+from utils.trade_store import first_trade_made
+from utils.positions import invalidate
+from utils.api import order_sell_market, order_crypto_sell_market
+from utils.symbols import lookup
 import json
 
 
@@ -42,21 +46,9 @@ def calculate_current_risk(open_trades, portfolio_size):
     total_risk_percent = 0.0
     total_risk_dollar = 0.0
     
-    # Load trade history to get original risk amounts
-    trade_history_file = "trades/trade_history.json"
-    try:
-        with open(trade_history_file, 'r') as f:
-            trade_history = json.load(f)
-    except (FileNotFoundError, json.JSONDecodeError):
-        trade_history = []
-    
     for trade in open_trades:
-        # Find the original trade entry in history
-        original_trade = None
-        for hist_trade in trade_history:
-            if hist_trade['Stock'] == trade.symbol and hist_trade['Trade Made']:
-                original_trade = hist_trade
-                break
+        # Find the original trade entry in the indexed trade history
+        original_trade = first_trade_made(trade.symbol)
         
         if original_trade:
             # Use the original risk amounts
@@ -64,8 +56,10 @@ def calculate_current_risk(open_trades, portfolio_size):
             position_risk_percent = original_trade['Risk Percent']
         else:
             # Fallback to calculating current risk if no history found
-            current_price = float(global_account_data['positions'][trade.symbol]['price'])
-            atr = calculate_atr(fetch_historical_data(trade.symbol))
+            position = global_account_data['positions'][trade.symbol]
+            current_price = float(position['price'])
+            info = lookup(trade.symbol, asset_class=position.get('type'))
+            atr = get_atr(info.symbol, asset=info.data_endpoint)
             risk_per_share = 2 * atr
             position_risk_dollar = trade.quantity * risk_per_share
             position_risk_percent = (position_risk_dollar / portfolio_size) * 100
@@ -82,8 +76,8 @@ def get_open_trades(positions):
     for symbol, data in positions.items():  # Iterate over the items in positions
         quantity = float(data.get('quantity', 0))
         purchase_price = float(data.get('average_buy_price', 0))
-        historical_data = fetch_historical_data(symbol)
-        atr = calculate_atr(historical_data)
+        info = lookup(symbol, asset_class=data.get('type'))
+        atr = get_atr(info.symbol, asset=info.data_endpoint)  # Shared with the other steps of this run through the market snapshot
         atr_percent = (atr / purchase_price) * 100
         stop_loss = purchase_price - (2 * atr)
         stop_limit = purchase_price + (2 * atr)
@@ -116,5 +110,11 @@ def close_expired_trades(open_trades, portfolio_size):
 
 
 def close_trade(trade):
-    r.orders.order_sell_market(trade.symbol, trade.quantity)
+    position = global_account_data.get('positions', {}).get(trade.symbol, {})
+    info = lookup(trade.symbol, asset_class=position.get('type'))
+    if info.asset_class == 'crypto':
+        order_crypto_sell_market(info.symbol, trade.quantity)
+    else:
+        order_sell_market(info.symbol, trade.quantity)
+    invalidate()  # The cached positions still hold the sold shares
     print(f"Trade {trade.symbol} closed.")
\ No newline at end of file
@@ -0,0 +1,125 @@
+# utils/trade_store.py
+import json
+import os
+import sqlite3
+import threading
+from datetime import datetime
+from utils.settings import TRADE_STORE_FILE
+from utils.trade_journal import load_trade_history
+
+# Indexed view of the trade history. The append-only journal stays the durable record;
+# this SQLite database (WAL mode) answers per-symbol and per-order lookups in O(log n).
+
+_lock = threading.RLock()
+_connection = None
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS trades (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    symbol TEXT NOT NULL,
+    order_id TEXT,
+    trade_made INTEGER NOT NULL,
+    order_status TEXT,
+    ts REAL NOT NULL,
+    trade_date TEXT NOT NULL,
+    record_key TEXT NOT NULL UNIQUE,
+    record TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS trades_by_symbol ON trades (symbol, trade_made, id);
+CREATE INDEX IF NOT EXISTS trades_by_order ON trades (order_id);
+CREATE INDEX IF NOT EXISTS trades_filled_by_symbol ON trades (symbol, order_status, trade_made, ts);
+"""
+
+
+def _normalize_timestamp(value):
+    """
+    Parses a trade timestamp once, at write time, into epoch seconds and a YYYY-MM-DD date.
+    """
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00')) if value else None
+    except ValueError:
+        parsed = None
+    if parsed is None:
+        return 0.0, ''
+    return parsed.timestamp(), parsed.strftime('%Y-%m-%d')
+
+
+def _row_values(trade):
+    ts, trade_date = _normalize_timestamp(trade.get('timestamp'))
+    record_key = json.dumps([trade.get('timestamp'), trade.get('Stock'), trade.get('Order ID')])
+    return (trade.get('Stock'), trade.get('Order ID'), 1 if trade.get('Trade Made') else 0,
+            trade.get('Order Status'), ts, trade_date, record_key, json.dumps(trade))
+
+
+def _insert(connection, trades):
+    connection.executemany(
+        "INSERT OR IGNORE INTO trades (symbol, order_id, trade_made, order_status, ts, trade_date, record_key, record) "
+        "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+        [_row_values(trade) for trade in trades if trade.get('Stock')]
+    )
+
+
+def _connect():
+    global _connection
+    with _lock:
+        if _connection is None:
+            directory = os.path.dirname(TRADE_STORE_FILE)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            connection = sqlite3.connect(TRADE_STORE_FILE, check_same_thread=False)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SCHEMA)
+            # Backfill once per process from the journal (covers first use and any missed writes)
+            history = load_trade_history()
+            (count,) = connection.execute("SELECT COUNT(*) FROM trades").fetchone()
+            if count < len(history):
+                with connection:
+                    _insert(connection, history)
+            _connection = connection
+        return _connection
+
+
+def _fetch_record(query, params):
+    with _lock:
+        row = _connect().execute(query, params).fetchone()
+    return json.loads(row[0]) if row else None
+
+
+def insert_trade(trade):
+    """
+    Indexes a trade that has just been written to the journal.
+    """
+    with _lock:
+        connection = _connect()
+        with connection:
+            _insert(connection, [trade])
+
+
+def first_trade_made(symbol):
+    """
+    Returns the earliest recorded trade for a symbol that was actually made, or None.
+    """
+    return _fetch_record(
+        "SELECT record FROM trades WHERE symbol = ? AND trade_made = 1 ORDER BY id LIMIT 1",
+        (symbol,)
+    )
+
+
+def latest_filled_trade(symbol, as_of=None):
+    """
+    Returns the most recent filled trade for a symbol dated on or before `as_of` (default: now), or None.
+    """
+    as_of = (as_of or datetime.now()).strftime('%Y-%m-%d')
+    return _fetch_record(
+        "SELECT record FROM trades WHERE symbol = ? AND order_status = 'filled' AND trade_made = 1 "
+        "AND trade_date <= ? ORDER BY ts DESC LIMIT 1",
+        (symbol, as_of)
+    )
+
+
+def find_by_order_id(order_id):
+    """
+    Returns the trade recorded for a broker order ID, or None.
+    """
+    return _fetch_record("SELECT record FROM trades WHERE order_id = ? ORDER BY id LIMIT 1", (order_id,))
@@ -1,10 +1,19 @@
 # utils/trading.py
 import robin_stocks.robinhood as r
 from utils.analysis import moving_average, calculate_atr, detect_recent_crossover, check_recent_crossovers
-from utils.api import fetch_historical_data, order_buy_market, get_positions
+from utils.api import (fetch_historical_data, order_buy_market, order_sell_market, order_crypto_sell_market,
+                       order_buy_crypto_by_price, order_buy_fractional_by_price, position_record)
+from utils.positions import get_positions, record_fill, invalidate
+from utils.bar_store import Bars, bars_from_dicts
 from utils.settings import SIMULATED, MAX_DAILY_LOSS, ATR_THRESHOLDS, PHONE_NUMBER
 from utils.send_message import send_text_message
 from utils.trade_state import TradeState,calculate_current_risk, get_open_trades
+from utils.account_data import global_account_data
+from utils.trade_journal import append_trade
+from utils.trade_store import insert_trade, latest_filled_trade
+from utils.order_sync import sync_orders, earliest_order_dates, instrument_fractional
+from utils.market_snapshot import get_bars, get_atr
+from utils.symbols import lookup, is_trading
 from termcolor import colored
 from datetime import datetime
 import json
@@ -13,43 +22,42 @@ import pandas as pd
 import logging
 
 def is_market_open(symbol=None):
-    # Load crypto symbols from CSV
-    try:
-        crypto_df = pd.read_csv('crypto_symbols.csv')
-        crypto_symbols = [sym.replace('-USD', '') for sym in crypto_df['Symbol'].tolist()]
-    except Exception as e:
-        # Fallback to basic list if file can't be read
-        crypto_symbols = ['BTC', 'ETH', 'DOGE', 'SHIB', 'SOL', 'XRP', 'ADA']
-        logging.error(f"Failed to read crypto symbols, using fallback list: {e}")
+    # Crypto trades around the clock; everything else follows the regular stock session
+    return is_trading(symbol)
 
-    # Crypto markets are always open
-    if symbol and symbol in crypto_symbols:
-        return True
-        
-    # Stock market hours
-    from datetime import datetime, time
-    now = datetime.now().time()
-    market_open = time(9, 30)
-    market_close = time(16, 0)
-    return market_open <= now <= market_close
 
+def stock_signal(historicals):
+    """
+    Computes analyze_stock's inputs from a symbol's bars (at least 50 of them).
 
-def analyze_stock(stock, results, portfolio_size, current_risk, simulated=SIMULATED, atr_thresholds=ATR_THRESHOLDS):
-    historicals = fetch_historical_data(stock)
-    
-    if not historicals or len(historicals) < 50:  # Ensure enough data for moving averages
-        print(f"Not enough data for {stock}. Skipping...")
-        return False
-    
-    closing_prices = [float(day['close_price']) for day in historicals]
+    :return: Tuple of (bullish, atr, atr_percent, share_price), the same shape as screener.screen_block.
+    """
+    if not isinstance(historicals, Bars):
+        historicals = bars_from_dicts(historicals)
+    closing_prices = historicals.close
     ma_20 = moving_average(closing_prices, 20)
     ma_50 = moving_average(closing_prices, 50)
-    
-    crossover_signal = detect_recent_crossover(ma_20[-len(ma_50):], ma_50, days=5)
-    
+    bullish = detect_recent_crossover(ma_20[-len(ma_50):], ma_50, days=5) == "Bullish Crossover"
     atr = calculate_atr(historicals)
     atr_percent = (atr / closing_prices[-1]) * 100 if closing_prices[-1] != 0 else 0
-    share_price = closing_prices[-1]  # Latest share price
+    share_price = float(closing_prices[-1])  # Latest share price
+    return bullish, atr, atr_percent, share_price
+
+
+def analyze_stock(stock, results, portfolio_size, current_risk, simulated=SIMULATED, atr_thresholds=ATR_THRESHOLDS, historicals=None,
+                  signal=None):
+    # `signal` is an earlier stock_signal() of the same bars (e.g. from the signal memo); sizing is always redone
+    if signal is None:
+        if historicals is None:  # Fetch unless the caller pre-fetched the bars
+            historicals = fetch_historical_data(stock)
+
+        if not historicals or len(historicals) < 50:  # Ensure enough data for moving averages
+            print(f"Not enough data for {stock}. Skipping...")
+            return False
+        signal = stock_signal(historicals)
+
+    bullish, atr, atr_percent, share_price = signal
+    crossover_signal = "Bullish Crossover" if bullish else None
     
     # Filter out stocks with an ATR percent less than 3%
     if atr_percent < 3.0:
@@ -108,8 +116,11 @@ def analyze_stock(stock, results, portfolio_size, current_risk, simulated=SIMULA
 
 
 def execute_trade(trade, portfolio_size, current_risk_percent, simulated):
+    info = lookup(trade['Stock'])
+    is_crypto = info.asset_class == 'crypto'
+
     positions = get_positions()
-    if trade['Stock'] in positions:
+    if info.symbol in positions:
         print(f"\nTrade for {trade['Stock']} skipped because it's already in the portfolio.")
         return False
 
@@ -122,23 +133,20 @@ def execute_trade(trade, portfolio_size, current_risk_percent, simulated):
 
     print(colored(f"Executing trade for: {trade['Stock']}, Simulated={simulated}, Amount: ${trade['Trade Amount']:.2f}", 'green'))
     
-    if is_market_open() and not simulated:
+    if is_market_open(trade['Stock']) and not simulated:
         try:
-            # Determine if this is a crypto symbol
-            is_crypto = trade['Stock'] in ['BTC', 'ETH', 'DOGE', 'SHIB', 'SOL', 'XRP', 'ADA']  # Add more as needed
-            
+            # The registry only knows the flag for stocks whose instrument was cached before it was built
+            fractional = info.fractional if info.fractional is not None else instrument_fractional(info.symbol)
             if is_crypto:
-                order_result = r.orders.order_buy_crypto_by_price(
-                    symbol=trade['Stock'],
-                    amountInDollars=trade['Trade Amount']
-                )
+                order_result = order_buy_crypto_by_price(info.symbol, trade['Trade Amount'])
+            elif fractional:
+                order_result = order_buy_fractional_by_price(info.symbol, trade['Trade Amount'])
             else:
-                order_result = r.orders.order_buy_fractional_by_price(
-                    symbol=trade['Stock'],
-                    amountInDollars=trade['Trade Amount'],
-                    timeInForce='gfd',
-                    extendedHours=False
-                )
+                whole_shares = int(trade['Shares to Purchase'])
+                if whole_shares == 0:
+                    print(f"Trade for {trade['Stock']} skipped: not fractionally tradable and the amount buys no whole share.")
+                    return False
+                order_result = order_buy_market(info.symbol, whole_shares)
 
             print(f"Order result: {order_result}")
             
@@ -150,19 +158,16 @@ def execute_trade(trade, portfolio_size, current_risk_percent, simulated):
                         trade['Trade Made'] = True
                         trade['Order Status'] = order_status
                         trade['Order ID'] = order_id
-                        trade['Type'] = 'crypto' if is_crypto else 'stock'
+                        trade['Type'] = info.asset_class
                         
                         # Save trade data
                         save_trade_data(trade)
                         
-                        # Update global account data
-                        global_account_data['positions'][trade['Stock']] = {
-                            'name': trade['Stock'],
-                            'quantity': trade['Shares to Purchase'],
-                            'price': trade['Share Price'],
-                            'type': 'crypto' if is_crypto else 'stock',
-                            'purchase_date': datetime.now().strftime("%Y-%m-%d")
-                        }
+                        # Apply the fill to the cached positions so later trades this run see it without a refetch
+                        record_fill(info.symbol, position_record(
+                            info.symbol, trade['Shares to Purchase'], trade['Share Price'], trade['Share Price'],
+                            info.asset_class
+                        ))
                         
                         print(f"Trade executed for {trade['Stock']}. Order ID: {order_id}")
                         return True
@@ -183,7 +188,7 @@ def execute_trade(trade, portfolio_size, current_risk_percent, simulated):
         trade['Trade Made'] = False
         trade['Order Status'] = "Pending Market Open"
         trade['Order ID'] = None
-        trade['Type'] = 'crypto' if trade['Stock'] in ['BTC', 'ETH', 'DOGE', 'SHIB', 'SOL', 'XRP', 'ADA'] else 'stock'
+        trade['Type'] = info.asset_class
         save_trade_data(trade)
         return False
 
@@ -226,7 +231,7 @@ def send_trade_summary(top_trades, portfolio_size, current_risk_percent, open_tr
 
 def verify_position_closed(symbol, position_type='stock'):
     """Verify that a position has been closed by checking current positions"""
-    positions = get_positions()
+    positions = get_positions(max_age=0)  # Our own sell just went through, so the cached copy is stale
     if symbol not in positions:
         if position_type == 'crypto':
             print(colored(f"✓ Verified: Crypto position {symbol} has been closed successfully", 'green'))
@@ -246,28 +251,14 @@ def check_open_positions_sell_points():
         current_price = float(data['price'])
         quantity = float(data['quantity'])
         purchase_price = float(data['average_buy_price'])
-        position_type = data.get('type', 'stock')
+        info = lookup(symbol, asset_class=data.get('type'))
+        position_type = info.asset_class
 
-        # Get the most recent trade for this symbol
-        with open('trades/trade_history.json', 'r') as f:
-            trade_history = json.load(f)
-        
-        # Filter trades for this symbol that were actually filled and made
-        symbol_trades = [t for t in trade_history 
-                        if t.get('Stock') == symbol 
-                        and t.get('Trade Made') 
-                        and t.get('Order Status') == 'filled'
-                        and datetime.strptime(t['timestamp'][:10], "%Y-%m-%d") <= current_date]
-        
-        # Sort by timestamp in descending order
-        symbol_trades.sort(key=lambda x: datetime.strptime(x['timestamp'], 
-                                                         "%Y-%m-%dT%H:%M:%S.%f%z" if 'Z' in x['timestamp'] 
-                                                         else "%Y-%m-%dT%H:%M:%S.%f"), 
-                         reverse=True)
+        # Get the most recent filled trade for this symbol from the indexed trade history
+        most_recent_trade = latest_filled_trade(symbol, as_of=current_date)
         
         # Get the most recent trade's purchase date
-        if symbol_trades:
-            most_recent_trade = symbol_trades[0]
+        if most_recent_trade:
             purchase_date = datetime.strptime(most_recent_trade['timestamp'][:10], "%Y-%m-%d")
             print(f"Found most recent trade for {symbol} on {purchase_date.date()}")
         else:
@@ -286,10 +277,7 @@ def check_open_positions_sell_points():
         # Check 14-day expiration for all positions
         if days_held >= 14:
             print(colored(f"Position {symbol} has exceeded 14-day hold period. Selling position...", 'yellow'))
-            if position_type == 'crypto':
-                order = order_crypto_sell_market(symbol, quantity)
-            else:
-                order = order_sell_market(symbol, quantity)
+            order = sell_position(symbol, quantity, position_type)
                 
             if order:
                 print(colored(f"Sell order placed for {symbol}", 'green'))
@@ -305,17 +293,14 @@ def check_open_positions_sell_points():
             continue
 
         # Get appropriate historical data based on position type
-        if position_type == 'crypto':
-            historical_data = fetch_crypto_historical_data(symbol)
-        else:
-            historical_data = fetch_historical_data(symbol)
+        historical_data = get_bars(symbol, asset=info.data_endpoint)
 
         if not historical_data:
             print(f"Could not fetch historical data for {symbol}")
             continue
 
         # Calculate sell point using ATR
-        atr = calculate_atr(historical_data)
+        atr = get_atr(symbol, asset=info.data_endpoint)
         atr_percent = (atr / purchase_price) * 100
 
         # Determine ATR multiple
@@ -330,10 +315,7 @@ def check_open_positions_sell_points():
 
         if current_price >= sell_point:
             print(colored(f"Selling {symbol} at {current_price} (Sell point: {sell_point})", 'yellow'))
-            if position_type == 'crypto':
-                order = order_crypto_sell_market(symbol, quantity)
-            else:
-                order = order_sell_market(symbol, quantity)
+            order = sell_position(symbol, quantity, position_type)
                 
             if order:
                 print(colored(f"Sell order placed for {symbol}", 'green'))
@@ -361,48 +343,133 @@ def check_open_positions_sell_points():
     else:
         print("\nNo positions were closed in this check.")
 
+def sell_position(symbol, quantity, position_type=None):
+    """
+    Places a market sell for a position. Once an order is placed the cached positions are
+    invalidated, so the next read sees the reduced (or closed) position.
+    """
+    info = lookup(symbol, asset_class=position_type)
+    if info.asset_class == 'crypto':
+        order = order_crypto_sell_market(info.symbol, quantity)
+    else:
+        order = order_sell_market(info.symbol, quantity)
+    if order:
+        invalidate()
+    return order
+
+
+def close_trade(symbol, quantity, sale_price, sale_type=None, position_type=None):
+    """Sells a whole position at market and records the sale in global_account_data['sales']"""
+    try:
+        result = sell_position(symbol, quantity, position_type)
+        print(f"Attempting to sell {quantity} of {symbol} at market price.")
+        print(f"Response from Robinhood: {result}")
+        if result and 'id' in result:
+            print(f"Trade {symbol} closed successfully.")
+            purchase_price = float(global_account_data['positions'].get(symbol, {}).get('average_buy_price', 0))
+            add_sale_to_global_data(symbol, sale_price > purchase_price, sale_price, sale_type)
+            return True
+        print(f"Failed to close trade for {symbol}. Response: {result}")
+    except Exception as e:
+        print(f"Exception occurred while closing trade: {e}")
+    return False
+
+
+def add_sale_to_global_data(symbol, profit, sale_price, sale_type=None):
+    """Logs a closed position in global_account_data, marking whether it sold at a profit or a loss"""
+    global_account_data.setdefault('sales', []).append({
+        'symbol': symbol,
+        'profit': profit,
+        'sale_price': sale_price,
+        'sale_time': datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+        'sale_type': sale_type
+    })
+    print(f"Sale made for {'profit' if profit else 'loss'}: {symbol} at ${sale_price:.2f}")
+
+
+def check_positions_against_atr(global_account_data):
+    """
+    Checks all open positions to see if they have crossed their ATR-based stop loss or stop limit.
+    If crossed, it triggers a market order to close the position and logs the sale.
+    Bars and ATRs come from the run's market snapshot, so later steps reuse them.
+    """
+    positions = global_account_data['positions']
+    positions_closed = False
+    for symbol, data in list(positions.items()):
+        quantity = float(data.get('quantity', 0))
+        purchase_price = float(data.get('average_buy_price', 0))
+        current_price = float(data.get('price', 0))
+        info = lookup(symbol, asset_class=data.get('type'))
+        atr = get_atr(info.symbol, asset=info.data_endpoint)
+        if atr is None:
+            print(f"Could not fetch historical data for {symbol}; skipping its ATR check.")
+            continue
+        stop_loss = purchase_price - (2 * atr)
+        stop_limit = purchase_price + (2 * atr)
+        if current_price <= stop_loss:
+            print(f"Position for {symbol} has hit the stop loss at ${stop_loss:.2f}. Closing the position.")
+            positions_closed |= close_trade(symbol, quantity, sale_type="Loss", sale_price=current_price,
+                                            position_type=info.asset_class)
+        elif current_price >= stop_limit:
+            print(f"Position for {symbol} has hit the stop limit at ${stop_limit:.2f}. Closing the position.")
+            positions_closed |= close_trade(symbol, quantity, sale_type="Profit", sale_price=current_price,
+                                            position_type=info.asset_class)
+    if not positions_closed:
+        print("No positions have hit the ATR stop loss or stop limit.")
+
+
+def _purchase_date(data):
+    # bot.main records the opening order's created_at; older records carried a plain purchase_date
+    for key, fmt in (('created_at', "%Y-%m-%dT%H:%M:%S.%fZ"), ('purchase_date', "%Y-%m-%d")):
+        if data.get(key):
+            try:
+                return datetime.strptime(data[key], fmt)
+            except ValueError:
+                continue
+    return None
+
+
+def close_trades_open_for_ten_days(positions):
+    """
+    Checks if any trades have been open for more than 10 days.
+    If so, closes the trades and logs the sales.
+    """
+    trades_closed = False
+    for symbol, data in list(positions.items()):
+        purchase_date = _purchase_date(data)
+        if purchase_date and (datetime.now() - purchase_date).days > 10:
+            quantity = float(data.get('quantity', 0))
+            current_price = float(data.get('price', 0))
+            print(f"Trade for {symbol} has been open for more than 10 days. Closing the position.")
+            trades_closed |= close_trade(symbol, quantity, sale_price=current_price, position_type=data.get('type'))
+    if not trades_closed:
+        print("No trades open more than 10 days.")
+
+
+def get_stock_orders_and_match_open_positions(open_position_symbols):
+    """
+    Returns {symbol: created_at} for open positions, using the earliest stock order on record.
+    Orders come from the local order table, which is first brought up to date with only the
+    orders that changed since the last sync.
+    """
+    synced = sync_orders()
+    if synced is not None:
+        print(f"Synced {synced} changed stock orders.")
+
+    print("Stock Orders (Matching Open Positions):")
+    matched_orders = earliest_order_dates(open_position_symbols)
+    for stock_symbol, created_at in matched_orders.items():
+        print(f"Order for {stock_symbol}: Created at {created_at}")
+    if not matched_orders:
+        print("No stock orders found.")
+    return matched_orders
+
 def save_trade_data(trade):
-    """Save trade data to a JSON file for persistence"""
-    
-    # Create trades directory if it doesn't exist
-    trades_dir = 'trades'
-    if not os.path.exists(trades_dir):
-        os.makedirs(trades_dir)
-    
-    # Create files for different types of data
-    daily_file = f"trades/{datetime.now().strftime('%Y-%m-%d')}_trades.json"
-    history_file = "trades/trade_history.json"
+    """Save trade data to the append-only trade journal for persistence"""
     
     # Add timestamp to trade data
     trade['timestamp'] = datetime.now().isoformat()
     
-    # Load existing daily trades
-    daily_trades = []
-    if os.path.exists(daily_file):
-        with open(daily_file, 'r') as f:
-            try:
-                daily_trades = json.load(f)
-            except json.JSONDecodeError:
-                daily_trades = []
-    
-    # Add new trade
-    daily_trades.append(trade)
-    
-    # Save daily trades
-    with open(daily_file, 'w') as f:
-        json.dump(daily_trades, f, indent=4)
-    
-    # Load and update trade history
-    history = []
-    if os.path.exists(history_file):
-        with open(history_file, 'r') as f:
-            try:
-                history = json.load(f)
-            except json.JSONDecodeError:
-                history = []
-    
-    history.append(trade)
-    
-    # Save updated history
-    with open(history_file, 'w') as f:
-        json.dump(history, f, indent=4)
\ No newline at end of file
+    # Append to the journal; this costs the same however long the history grows
+    append_trade(trade)
+    insert_trade(trade)
@@ -0,0 +1,164 @@
+# utils/universe.py
+import os
+import csv
+import json
+import logging
+import threading
+from utils.settings import UNIVERSE_INDEX_FILE
+
+# Compiled index of the symbol universe. The source CSVs (the S&P 500 file alone is ~800 KB of
+# mostly business summaries) are parsed only when one of them changes; every other run loads
+# a small column-oriented JSON file with one deduplicated record per symbol.
+
+# Source name -> (CSV path, symbol column, asset class). Order matters: it is the scan order,
+# and the first source listing a symbol decides its position in the universe.
+SOURCES = {
+    'crypto': ('crypto_symbols.csv', 'Symbol', 'crypto'),
+    'nasdaq': ('nasdaq100_full.csv', 'Ticker', 'stock'),
+    'sp500': ('sp500_companies.csv', 'Symbol', 'stock'),
+}
+SOURCE_BITS = {name: 1 << bit for bit, name in enumerate(SOURCES)}
+FIELDS = ('symbol', 'asset_class', 'exchange', 'sector', 'market_cap', 'sources')
+INDEX_VERSION = 1
+
+_lock = threading.Lock()
+_universe = None
+
+
+def sanitize_symbol(symbol):
+    """
+    Same normalization as api.sanitize_ticker_symbols: hyphens removed, surrounding spaces stripped.
+    """
+    return symbol.replace('-', '').strip()
+
+
+class Universe:
+    """
+    Column-oriented universe index with O(1) lookup by symbol.
+    """
+    __slots__ = FIELDS + ('_position',)
+
+    def __init__(self, columns):
+        for field in FIELDS:
+            setattr(self, field, columns[field])
+        self._position = {symbol: index for index, symbol in enumerate(self.symbol)}
+
+    def __len__(self):
+        return len(self.symbol)
+
+    def __contains__(self, symbol):
+        return symbol in self._position
+
+    def get(self, symbol):
+        """
+        Returns the symbol's record as a dict, or None if it is not in the universe.
+        """
+        index = self._position.get(symbol)
+        if index is None:
+            return None
+        return {field: getattr(self, field)[index] for field in FIELDS}
+
+    def symbols(self, sources=None):
+        """
+        Returns the deduplicated symbols listed by any of the given sources (default: all), in scan order.
+        """
+        if sources is None:
+            return list(self.symbol)
+        mask = 0
+        for name in sources:
+            mask |= SOURCE_BITS[name]
+        return [symbol for symbol, bits in zip(self.symbol, self.sources) if bits & mask]
+
+
+def _parse_market_cap(value):
+    try:
+        return float(value) if value else None
+    except ValueError:
+        return None
+
+
+def _source_stamps():
+    stamps = {}
+    for name, (path, _, _) in SOURCES.items():
+        try:
+            stat = os.stat(path)
+            stamps[name] = [stat.st_mtime_ns, stat.st_size]
+        except FileNotFoundError:
+            stamps[name] = None
+    return stamps
+
+
+def compile_universe(stamps=None):
+    """
+    Parses the source CSVs into index columns. A symbol listed by several sources appears once,
+    at its first position, with the union of its sources and the first non-empty metadata.
+    """
+    columns = {field: [] for field in FIELDS}
+    position = {}
+    for name, (path, symbol_column, asset_class) in SOURCES.items():
+        try:
+            with open(path, newline='') as f:
+                rows = list(csv.DictReader(f))
+        except FileNotFoundError:
+            logging.warning(f"Universe source {path} not found; skipping it")
+            continue
+        for row in rows:
+            symbol = sanitize_symbol(row.get(symbol_column) or '')
+            if not symbol:
+                continue
+            record = {'exchange': row.get('Exchange') or '', 'sector': row.get('Sector') or '',
+                      'market_cap': _parse_market_cap(row.get('Marketcap'))}
+            index = position.get(symbol)
+            if index is None:
+                position[symbol] = len(columns['symbol'])
+                columns['symbol'].append(symbol)
+                columns['asset_class'].append(asset_class)
+                columns['sources'].append(SOURCE_BITS[name])
+                for field, value in record.items():
+                    columns[field].append(value)
+            else:
+                columns['sources'][index] |= SOURCE_BITS[name]
+                for field, value in record.items():
+                    if value and not columns[field][index]:
+                        columns[field][index] = value
+    return {'version': INDEX_VERSION, 'sources': stamps or _source_stamps(), 'columns': columns}
+
+
+def _write_index(index):
+    directory = os.path.dirname(UNIVERSE_INDEX_FILE)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = UNIVERSE_INDEX_FILE + '.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(index, f, separators=(',', ':'))
+    os.replace(tmp_path, UNIVERSE_INDEX_FILE)
+
+
+def _read_index():
+    try:
+        with open(UNIVERSE_INDEX_FILE, 'r') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+    except (json.JSONDecodeError, OSError) as e:
+        logging.warning(f"Rebuilding unreadable universe index {UNIVERSE_INDEX_FILE}: {e}")
+        return None
+
+
+def load_universe():
+    """
+    Returns the Universe, recompiling the index only if a source file's mtime or size changed.
+    The loaded index is kept for the life of the process and rechecked on each call.
+    """
+    global _universe
+    stamps = _source_stamps()
+    with _lock:
+        if _universe is not None and _universe[0] == stamps:
+            return _universe[1]
+        index = _read_index()
+        if index is None or index.get('version') != INDEX_VERSION or index.get('sources') != stamps:
+            index = compile_universe(stamps)
+            _write_index(index)
+            logging.info(f"Compiled universe index with {len(index['columns']['symbol'])} symbols")
+        _universe = (stamps, Universe(index['columns']))
+        return _universe[1]
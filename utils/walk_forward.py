@@ -0,0 +1,148 @@
+# utils/walk_forward.py
+import logging
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import numpy as np
+from utils.backtest import StrategyParams, BacktestResult, run_backtest, metrics, format_day
+from utils.sweep import (parameter_grid, share_panel, init_worker, prepare_all_signals, worker_panel,
+                         worker_signals)
+from utils.settings import (SWEEP_DATA_DIR, SWEEP_WORKERS, BACKTEST_INITIAL_CAPITAL, WALK_FORWARD_TRAIN_DAYS,
+                            WALK_FORWARD_TEST_DAYS, WALK_FORWARD_OBJECTIVE, WALK_FORWARD_MIN_TRADES)
+
+# Walk-forward optimization. The span is cut into rolling windows: parameters are chosen on
+# each in-sample (train) window and then traded, unchanged, on the test window that follows.
+# Indicators at a day only use bars up to that day, so the arrays computed once over the full
+# span serve every window as they are; a window is just a [start, end) column range passed to
+# run_backtest. Windows' in-sample grids and out-of-sample runs go through the sweep's process
+# pool and memory-mapped panel.
+
+# Sizing scales with equity and shares are fractional, so a run's equity curve is proportional
+# to its starting capital. Out-of-sample windows are therefore run independently (in parallel)
+# from the same capital and chained afterwards by rescaling each to where the previous one ended.
+
+
+class Window(NamedTuple):
+    train_start: int  # Panel column indices; train is [train_start, test_start), test is [test_start, test_end)
+    test_start: int
+    test_end: int
+
+
+class WalkForwardResult(NamedTuple):
+    windows: list  # Per window: dates, chosen params and in-sample / out-of-sample metrics
+    out_of_sample: BacktestResult  # Stitched out-of-sample run with each window's chosen params
+    baseline: BacktestResult  # The same test windows traded with the unoptimized base params
+
+
+def make_windows(day_count, train_days=WALK_FORWARD_TRAIN_DAYS, test_days=WALK_FORWARD_TEST_DAYS):
+    """
+    Rolling windows over `day_count` panel columns, advancing by test_days; the last test
+    window is cut short at the end of the data.
+    """
+    return [Window(start, start + train_days, min(start + train_days + test_days, day_count))
+            for start in range(0, day_count - train_days, test_days)]
+
+
+def _rank(summary, objective, min_trades):
+    # Settings that barely traded in-sample rank below any that traded enough
+    return summary['trades'] >= min_trades, summary[objective]
+
+
+def _in_sample(data_dir, window, combos, initial_capital):
+    panel = worker_panel()
+    return window, [(params, metrics(run_backtest(panel, params, initial_capital, worker_signals(data_dir, params),
+                                                  window.train_start, window.test_start)))
+                    for params in combos]
+
+
+def _out_of_sample(data_dir, window, params, initial_capital):
+    return run_backtest(worker_panel(), params, initial_capital, worker_signals(data_dir, params),
+                        window.test_start, window.test_end)
+
+
+def stitch(results, initial_capital):
+    """
+    Chains consecutive runs (each started from the same capital) into one equity curve, scaling
+    each run, and its trades, to the equity the previous one ended with.
+    """
+    days, equity, open_positions, trades = [], [], [], []
+    capital = float(initial_capital)
+    for result in results:
+        scale = capital / result.initial_capital
+        days.append(result.days)
+        equity.append(result.equity * scale)
+        open_positions.append(result.open_positions)
+        for trade in result.trades:
+            trades.append({**trade, **{field: trade[field] * scale
+                                       for field in ('shares', 'trade_amount', 'risk_dollar', 'pnl')}})
+        if len(result.equity):
+            capital = float(equity[-1][-1])
+    if not results:
+        return BacktestResult(np.empty(0, dtype=np.int64), np.empty(0), np.zeros(0, dtype=np.int64), [], None,
+                              float(initial_capital))
+    return BacktestResult(np.concatenate(days), np.concatenate(equity), np.concatenate(open_positions), trades,
+                          None, float(initial_capital))
+
+
+def run_walk_forward(panel, grid, base=StrategyParams(), train_days=WALK_FORWARD_TRAIN_DAYS,
+                     test_days=WALK_FORWARD_TEST_DAYS, objective=WALK_FORWARD_OBJECTIVE,
+                     min_trades=WALK_FORWARD_MIN_TRADES, data_dir=SWEEP_DATA_DIR, max_workers=SWEEP_WORKERS,
+                     initial_capital=BACKTEST_INITIAL_CAPITAL, on_window=None):
+    """
+    Optimizes `grid` (expanded from `base`) on every in-sample window by `objective`, a
+    metrics() key that is maximized, and trades the winner out-of-sample. Each test window
+    starts flat; positions still open at its end are marked at the last close. The base params
+    are traded on the same test windows as a baseline.
+
+    :param on_window: Optional callback(window_record, done, total) as each window's parameters are chosen.
+    :return: WalkForwardResult.
+    """
+    windows = make_windows(len(panel.days), train_days, test_days)
+    if not windows:
+        logging.warning(f"Walk-forward needs more than {train_days} days of data; the panel has {len(panel.days)}")
+        empty = stitch([], initial_capital)
+        return WalkForwardResult([], empty, empty)
+    combos = parameter_grid(grid, base)
+    by_periods = {}
+    for params in combos:
+        by_periods.setdefault(params.indicator_key(), []).append(params)
+
+    share_panel(panel, data_dir)
+    records = {window: {'train_start': format_day(panel.days[window.train_start]),
+                        'test_start': format_day(panel.days[window.test_start]),
+                        'test_end': format_day(panel.days[window.test_end - 1])} for window in windows}
+    order = {params: index for index, params in enumerate(combos)}
+    scores = {}
+    with ProcessPoolExecutor(max_workers=max_workers, initializer=init_worker, initargs=(data_dir,)) as executor:
+        prepare_all_signals(executor, data_dir, combos + [base])
+
+        # In-sample: one task per window and set of periods, so every window runs at once
+        in_sample = [executor.submit(_in_sample, data_dir, window, group, initial_capital)
+                     for window in windows for group in by_periods.values()]
+        baseline = {window: executor.submit(_out_of_sample, data_dir, window, base, initial_capital)
+                    for window in windows}
+        chosen = {}
+        remaining = {window: len(by_periods) for window in windows}
+        for future in as_completed(in_sample):
+            window, scored = future.result()
+            scores.setdefault(window, []).extend(scored)
+            remaining[window] -= 1
+            if remaining[window] == 0:
+                # Window fully optimized: trade its winner out-of-sample while other windows finish.
+                # Ties go to the earlier combination in grid order, whatever order tasks finished in.
+                ordered = sorted(scores.pop(window), key=lambda item: order[item[0]])
+                params, summary = max(ordered, key=lambda item: _rank(item[1], objective, min_trades))
+                records[window].update(params=params._asdict(), in_sample=summary)
+                chosen[window] = executor.submit(_out_of_sample, data_dir, window, params, initial_capital)
+                if on_window:
+                    on_window(records[window], len(chosen), len(windows))
+
+        chosen = {window: future.result() for window, future in chosen.items()}
+        baseline = {window: future.result() for window, future in baseline.items()}
+
+    for window in windows:
+        records[window].update(out_of_sample=metrics(chosen[window]), baseline=metrics(baseline[window]))
+    return WalkForwardResult(
+        [records[window] for window in windows],
+        stitch([chosen[window] for window in windows], initial_capital),
+        stitch([baseline[window] for window in windows], initial_capital),
+    )
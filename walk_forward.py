@@ -0,0 +1,50 @@
+# walk_forward.py
+import os
+import csv
+import logging
+from utils.backtest import load_panel, metrics, format_day
+from utils.walk_forward import run_walk_forward
+from utils.settings import SWEEP_GRID, WALK_FORWARD_EQUITY_FILE
+from data_loader import load_stock_symbols
+
+
+def save_equity_curves(result, path=WALK_FORWARD_EQUITY_FILE):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['date', 'out_of_sample_equity', 'baseline_equity'])
+        for day, equity, baseline in zip(result.out_of_sample.days, result.out_of_sample.equity,
+                                         result.baseline.equity):
+            writer.writerow([format_day(day), f"{equity:.2f}", f"{baseline:.2f}"])
+
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+    panel = load_panel(load_stock_symbols())
+
+    def on_window(record, done, total):
+        print(f"[{done}/{total}] {record['train_start']} to {record['test_start']}: in-sample CAGR "
+              f"{record['in_sample']['cagr']:.1%} with {record['params']}")
+
+    result = run_walk_forward(panel, SWEEP_GRID, on_window=on_window)
+    if not result.windows:
+        print("Not enough cached daily bars for a walk-forward run. Run backtest.py with BACKTEST_FETCH = True first.")
+        return
+
+    print("\nOut-of-sample results per window (chosen vs. current settings):")
+    for record in result.windows:
+        print(f"{record['test_start']} to {record['test_end']}: CAGR {record['out_of_sample']['cagr']:.1%} vs "
+              f"{record['baseline']['cagr']:.1%}, drawdown {record['out_of_sample']['max_drawdown']:.1%} vs "
+              f"{record['baseline']['max_drawdown']:.1%}")
+    for label, stitched in (('Walk-forward', result.out_of_sample), ('Current settings', result.baseline)):
+        summary = metrics(stitched)
+        print(f"{label}: CAGR {summary['cagr']:.1%}, max drawdown {summary['max_drawdown']:.1%}, "
+              f"win rate {summary['win_rate']:.1%}, exposure {summary['exposure']:.1%}, {summary['trades']} trades")
+    save_equity_curves(result)
+    print(f"Stitched equity curves written to {WALK_FORWARD_EQUITY_FILE}")
+
+
+if __name__ == "__main__":
+    main()